@@ -0,0 +1,106 @@
+import re
+import csv
+import io
+import sys
+import time
+import random
+import argparse
+
+from read_record import extract_emails_from_record, build_email_column_plan
+
+
+def legacy_extract_emails_from_record(record):
+    """
+    The previous implementation: regex over every column except last_received_message_text,
+    plus a second re.match per candidate. Kept here as the benchmark baseline.
+    """
+    emails = set()
+    email_regex = re.compile(r"[a-zA-Z0-9_.+-]+@[a-zA-Z0-9-]+\.[a-zA-Z0-9-.]+")
+    for key, value in record.items():
+        if key == "last_received_message_text":
+            continue
+        if not value:
+            continue
+        if isinstance(value, str):
+            emails.update(email_regex.findall(value))
+    return [e for e in emails if re.match(r'.*[a-zA-Z]$', e)]
+
+
+def build_wide_export(num_rows, seed=42):
+    """
+    Build an in-memory LinkedHelper-style export (~130 columns) with long free-text columns
+    and a few email addresses, and return its rows as csv.DictReader dicts.
+    """
+    rng = random.Random(seed)
+    words = ("strategy growth cloud data platform leader sales b2b saas engineering product team "
+             "customer success marketing operations revenue partner global enterprise").split()
+    columns = ['id', 'id_type', 'public_id', 'public_id_2', 'hash_id', 'sn_hash_id', 'member_id', 'lh_id',
+               'avatar', 'profile_url', 'first_name', 'last_name', 'full_name', 'headline', 'summary', 'skills',
+               'location_name', 'industry', 'birthday', 'email', 'third_party_email_1', 'third_party_email_2',
+               'third_party_email_3', 'phone_1', 'phone_type_1', 'twitters', 'website_1', 'website_2', 'tags',
+               'connected_at', 'mutual_count', 'followers', 'connections_count', 'member_distance',
+               'badges_premium', 'badges_influencer', 'badges_job_seeker', 'badges_open_link', 'badges_hiring',
+               'current_company', 'current_company_position', 'language_1', 'last_received_message_text']
+    for i in range(1, 8):
+        columns += [f'organization_{i}', f'organization_id_{i}', f'organization_url_{i}', f'organization_title_{i}',
+                    f'organization_start_{i}', f'organization_end_{i}', f'organization_description_{i}',
+                    f'organization_location_{i}', f'organization_website_{i}', f'organization_domain_{i}']
+    for i in range(1, 4):
+        columns += [f'education_{i}', f'education_degree_{i}', f'education_fos_{i}', f'education_start_{i}',
+                    f'education_end_{i}']
+
+    def text(n):
+        return ' '.join(rng.choice(words) for _ in range(n))
+
+    out = io.StringIO()
+    writer = csv.DictWriter(out, fieldnames=columns)
+    writer.writeheader()
+    for n in range(num_rows):
+        row = {c: text(3) for c in columns}
+        row.update({
+            'id': f'person-{n}', 'hash_id': f'ACwAA{n:08d}', 'member_id': str(100000 + n),
+            'summary': text(120), 'skills': text(40), 'headline': text(12),
+            'email': f'person{n}@example.com' if n % 2 else '',
+            'third_party_email_1': f'p{n}@mail.example.org' if n % 3 == 0 else '',
+            'last_received_message_text': f'write to someone{n}@example.net ' + text(30),
+            'connected_at': '2024-05-01T10:00:00Z', 'followers': str(n % 5000), 'badges_premium': 'true',
+        })
+        if n % 10 == 0:
+            row['summary'] += f' Contact me at person{n}.alt@example.com.'
+        writer.writerow(row)
+    out.seek(0)
+    return list(csv.DictReader(out))
+
+
+def time_rows_per_second(func, rows, repeat):
+    best = float('inf')
+    for _ in range(repeat):
+        start = time.perf_counter()
+        for row in rows:
+            func(row)
+        best = min(best, time.perf_counter() - start)
+    return len(rows) / best
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark email extraction on a wide LinkedHelper export.")
+    parser.add_argument('--rows', type=int, default=20000, help="Number of synthetic rows (default: 20000)")
+    parser.add_argument('--repeat', type=int, default=3, help="Timing repetitions; the best is reported (default: 3)")
+    args = parser.parse_args()
+
+    rows = build_wide_export(args.rows)
+    plan = build_email_column_plan(tuple(rows[0].keys()))
+    mismatches = sum(1 for row in rows
+                     if set(legacy_extract_emails_from_record(row)) != set(extract_emails_from_record(row, plan)))
+    print(f"Rows: {len(rows)}  Columns: {len(rows[0])}  Planned email columns: {len(plan)}  Result mismatches: {mismatches}")
+
+    before = time_rows_per_second(legacy_extract_emails_from_record, rows, args.repeat)
+    after = time_rows_per_second(lambda row: extract_emails_from_record(row, plan), rows, args.repeat)
+    print(f"Before (all columns, regex per value): {before:12,.0f} rows/s")
+    print(f"After  (column plan + '@' pre-filter):  {after:12,.0f} rows/s")
+    print(f"Speedup: {after / before:.1f}x")
+    return 0 if mismatches == 0 else 1
+
+
+if __name__ == "__main__":
+    sys.exit(main())
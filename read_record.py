@@ -1,10 +1,45 @@
+import io
 import os
 import sys
 import csv
+import glob
 import json
 import re
+import time
+import zlib
+import gzip
+import string
+import struct
+import argparse
+import hashlib
+import math
+import functools
+import collections.abc
+import urllib.parse
 import datetime
+import queue
+import asyncio
+import cProfile
+import pstats
+import contextlib
+import contextvars
+import threading
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from multiprocessing.managers import BaseManager
 import requests
+try:
+    import aiohttp  # Optional: only needed for --async mode
+except ImportError:
+    aiohttp = None
+try:
+    import pyarrow  # Optional: vectorizes the --columnar pre-pass
+    import pyarrow.compute
+except ImportError:
+    pyarrow = None
+try:
+    import zstandard  # Optional: only needed to read .csv.zst exports
+except ImportError:
+    zstandard = None
 # WARNING: Do not hardcode API keys in source code. Use environment variables for secrets.
 
 
@@ -82,14 +117,448 @@ def log_http_error(request, response):
         pass
     print("--------------------------")
 
-def create_hubspot_contact(csv_json):
+# HubSpot private apps allow 100 calls per rolling 10 seconds; override via environment if your tier differs.
+HUBSPOT_RATE_LIMIT_CALLS = int(os.getenv('HUBSPOT_RATE_LIMIT_CALLS', '100'))
+HUBSPOT_RATE_LIMIT_PERIOD = float(os.getenv('HUBSPOT_RATE_LIMIT_PERIOD', '10'))
+
+class RateLimiter:
+    """
+    Thread-safe token bucket (GCRA) that hands out HubSpot call slots.
+    reserve() books the next slot and returns how many seconds the caller must wait before using it,
+    so the same object works in-process and behind a multiprocessing manager (the quota coordinator).
+    """
+    def __init__(self, max_calls=HUBSPOT_RATE_LIMIT_CALLS, period=HUBSPOT_RATE_LIMIT_PERIOD):
+        self.period = float(period)
+        self.interval = self.period / max(1, int(max_calls))
+        self._tat = 0.0  # theoretical arrival time of the next call
+        self._lock = threading.Lock()
+
+    def reserve(self):
+        with self._lock:
+            now = time.monotonic()
+            self._tat = max(self._tat, now) + self.interval
+            return max(0.0, self._tat - self.period - now)
+
+# HubSpot also caps API calls per day (250,000 for Professional portals); leave a reserve for other integrations.
+HUBSPOT_DAILY_LIMIT = int(os.getenv('HUBSPOT_DAILY_LIMIT', '250000'))
+HUBSPOT_DAILY_RESERVE = int(os.getenv('HUBSPOT_DAILY_RESERVE', '1000'))
+DAILY_USAGE_FILE = '.hubspot_daily_usage.json'
+
+class DailyQuota:
+    """
+    Counts HubSpot calls made today (persisted in DAILY_USAGE_FILE across runs) and tracks the
+    X-HubSpot-RateLimit-Daily-Remaining header when HubSpot returns it, which also reflects other
+    integrations sharing the portal. The day rolls over at local midnight.
+    """
+    def __init__(self, daily_limit=HUBSPOT_DAILY_LIMIT, usage_file=DAILY_USAGE_FILE):
+        self.daily_limit = daily_limit
+        self.usage_file = usage_file
+        self._lock = threading.Lock()
+        self.day = datetime.date.today().isoformat()
+        self.used = 0
+        self.reported_remaining = None
+        self.calls_since_report = 0
+        try:
+            with open(usage_file, encoding='utf-8') as f:
+                self.used = int(json.load(f).get(self.day, 0))
+        except (OSError, ValueError, AttributeError):
+            pass
+
+    def _roll_day(self):
+        today = datetime.date.today().isoformat()
+        if today != self.day:
+            self.day, self.used, self.reported_remaining, self.calls_since_report = today, 0, None, 0
+
+    def record_call(self, headers=None):
+        with self._lock:
+            self._roll_day()
+            self.used += 1
+            self.calls_since_report += 1
+            remaining = (headers or {}).get('X-HubSpot-RateLimit-Daily-Remaining')
+            if remaining is not None:
+                try:
+                    self.reported_remaining = int(remaining)
+                    self.calls_since_report = 0
+                except ValueError:
+                    pass
+
+    def remaining(self):
+        with self._lock:
+            self._roll_day()
+            remaining = self.daily_limit - self.used
+            if self.reported_remaining is not None:
+                remaining = min(remaining, self.reported_remaining - self.calls_since_report)
+            return max(0, remaining)
+
+    def seconds_until_reset(self):
+        now = datetime.datetime.now()
+        midnight = datetime.datetime.combine(now.date() + datetime.timedelta(days=1), datetime.time())
+        return max(1.0, (midnight - now).total_seconds())
+
+    def save(self):
+        with self._lock:
+            try:
+                with open(self.usage_file, 'w', encoding='utf-8') as f:
+                    json.dump({self.day: self.used}, f)
+            except OSError as e:
+                print(f"Could not save daily API usage to {self.usage_file}: {e}")
+
+# --- Tracing and profiling --------------------------------------------------------
+# --trace records a span for every record, pipeline stage batch, helper step and HubSpot call (with
+# rate-limiter wait, concurrency wait and network time) and writes them as Chrome trace-event JSON,
+# viewable in chrome://tracing or https://ui.perfetto.dev. --profile adds cProfile statistics.
+
+DEFAULT_TRACE_FILE = 'read_record_trace.json'
+DEFAULT_PROFILE_FILE = 'read_record.prof'
+
+# Async workers share one thread; each gets its own lane (trace "thread") so its spans nest correctly
+_trace_lane = contextvars.ContextVar('trace_lane', default=None)
+
+class Tracer:
+    """
+    Collects complete ('X') trace events. Timestamps are wall-clock microseconds so events from
+    worker processes line up with the coordinator's.
+    """
+    def __init__(self):
+        self.enabled = False
+        self.events = []
+        self._lock = threading.Lock()
+        self._epoch = time.time() - time.perf_counter()
+        self._lanes = {}
+
+    def enable(self):
+        self.enabled = True
+
+    def now(self):
+        return (self._epoch + time.perf_counter()) * 1e6
+
+    def _tid(self):
+        lane = _trace_lane.get()
+        key = lane if lane is not None else threading.get_ident()
+        with self._lock:
+            tid = self._lanes.get(key)
+            if tid is None:
+                tid = self._lanes[key] = len(self._lanes) + 1
+                name = lane if lane is not None else threading.current_thread().name
+                self.events.append({'name': 'thread_name', 'ph': 'M', 'pid': os.getpid(), 'tid': tid, 'args': {'name': name}})
+        return tid
+
+    def add_span(self, name, category, start, end, args=None):
+        event = {'name': name, 'cat': category, 'ph': 'X', 'ts': round(start, 1), 'dur': round(max(0.0, end - start), 1),
+                 'pid': os.getpid(), 'tid': self._tid(), 'args': args or {}}
+        with self._lock:
+            self.events.append(event)
+
+    @contextlib.contextmanager
+    def span(self, name, category, **args):
+        """
+        Record a span around the with-block. The yielded dict can be filled with more span arguments.
+        """
+        if not self.enabled:
+            yield args
+            return
+        start = self.now()
+        try:
+            yield args
+        finally:
+            self.add_span(name, category, start, self.now(), args)
+
+    def write(self, path):
+        with self._lock:
+            events = list(self.events)
+        with open(path, 'w', encoding='utf-8') as f:
+            json.dump({'traceEvents': events, 'displayTimeUnit': 'ms'}, f)
+        print(f"Trace with {sum(1 for e in events if e['ph'] == 'X')} span(s) written to {path}.")
+
+_tracer = Tracer()
+
+def traced(category, name=None, span_args=None):
+    """
+    Decorator: record a span for every call of the function while tracing is enabled.
+    span_args(*args, **kwargs) may return a dict of span arguments (e.g. the record number).
+    """
+    def decorator(func):
+        span_name = name or func.__name__
+        if asyncio.iscoroutinefunction(func):
+            @functools.wraps(func)
+            async def async_wrapper(*args, **kwargs):
+                if not _tracer.enabled:
+                    return await func(*args, **kwargs)
+                with _tracer.span(span_name, category, **(span_args(*args, **kwargs) if span_args else {})):
+                    return await func(*args, **kwargs)
+            return async_wrapper
+
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            if not _tracer.enabled:
+                return func(*args, **kwargs)
+            with _tracer.span(span_name, category, **(span_args(*args, **kwargs) if span_args else {})):
+                return func(*args, **kwargs)
+        return wrapper
+    return decorator
+
+_ID_PATH_SEGMENT = re.compile(r'^\d+$')
+
+def trace_endpoint(url):
+    """
+    Return the URL path with contact IDs and emails replaced by placeholders, so spans group by endpoint
+    and traces do not contain personal data.
+    """
+    segments = urllib.parse.urlsplit(url).path.split('/')
+    return '/'.join('{id}' if _ID_PATH_SEGMENT.match(seg) else '{email}' if '@' in seg else seg for seg in segments)
+
+_profiling = False
+_profiles = []
+_profiles_lock = threading.Lock()
+
+def start_thread_profile():
+    """
+    Start a cProfile profiler for the calling thread if --profile is on; returns it (or None).
+    """
+    if not _profiling:
+        return None
+    profile = cProfile.Profile()
+    try:
+        profile.enable()
+    except ValueError:
+        return None  # Python 3.12+ allows one active profiler per process; it already covers this thread
+    return profile
+
+def stop_thread_profile(profile):
+    if profile is not None:
+        profile.disable()
+        with _profiles_lock:
+            _profiles.append(profile)
+
+def write_profile(path, top=25):
+    """
+    Merge the collected thread profiles, save them to path (for snakeviz or pstats) and print the
+    functions with the most own time.
+    """
+    with _profiles_lock:
+        profiles = list(_profiles)
+    if not profiles:
+        return
+    stats = pstats.Stats(profiles[0])
+    for profile in profiles[1:]:
+        stats.add(profile)
+    stats.dump_stats(path)
+    print(f"\nProfile of {len(profiles)} thread(s) saved to {path}. Top {top} functions by own time:")
+    stats.sort_stats('tottime').print_stats(top)
+
+# In-flight HubSpot requests are capped by an AIMD controller (as in TCP congestion control): the cap grows
+# by about one request per round of healthy responses and is halved on a 429, a server or connection
+# error, or a latency spike. It adapts to other integrations sharing the portal's limits.
+HUBSPOT_CONCURRENCY_INITIAL = int(os.getenv('HUBSPOT_CONCURRENCY_INITIAL', '4'))
+HUBSPOT_CONCURRENCY_MAX = int(os.getenv('HUBSPOT_CONCURRENCY_MAX', '32'))
+LATENCY_SPIKE_FACTOR = 3.0  # a response this many times slower than its endpoint's baseline counts as congestion
+LATENCY_BASELINE_WEIGHT = 0.05  # every response moves the baseline, so a lasting slowdown becomes the new normal
+
+def latency_class(method, url):
+    """
+    Return the endpoint class whose latency baseline a request is compared with: batch reads/updates and
+    searches take far longer than single-contact calls.
+    """
+    path = urllib.parse.urlsplit(url).path
+    if '/batch/' in path:
+        return 'batch'
+    if path.endswith('/search'):
+        return 'search'
+    return 'single'
+
+class ConcurrencyController:
+    """
+    Thread-safe AIMD limit on in-flight requests. acquire() blocks while the limit is reached;
+    release(latency, status, endpoint) returns the slot and feeds the outcome back into the limit.
+    status is the HTTP status code, or None if the request failed without a response; latency is None if
+    the request was never sent. endpoint is the latency_class of the request, which has its own latency baseline.
+    """
+    def __init__(self, initial=HUBSPOT_CONCURRENCY_INITIAL, max_limit=HUBSPOT_CONCURRENCY_MAX, min_limit=1):
+        self.min_limit = min_limit
+        self.max_limit = max(min_limit, max_limit)
+        self.limit = float(min(max(initial, min_limit), self.max_limit))
+        self.in_flight = 0
+        self.avg_latency = None
+        self.baselines = {}
+        self._last_decrease = 0.0
+        self._cond = threading.Condition()
+        self._async_waiters = []
+        self.stats = {'requests': 0, 'peak': int(self.limit), 'low': int(self.limit),
+                      'decrease_429': 0, 'decrease_error': 0, 'decrease_latency': 0}
+
+    def acquire(self):
+        with self._cond:
+            while self.in_flight >= int(self.limit):
+                self._cond.wait()
+            self.in_flight += 1
+
+    async def acquire_async(self):
+        # Slots are released from the event loop and from worker threads alike, so waiters are woken
+        # through their loop rather than with a threading wait that would block it
+        while True:
+            with self._cond:
+                if self.in_flight < int(self.limit):
+                    self.in_flight += 1
+                    return
+                waiter = asyncio.Event()
+                self._async_waiters.append((asyncio.get_running_loop(), waiter))
+            await waiter.wait()
+
+    def release(self, latency, status, endpoint='single'):
+        with self._cond:
+            self.in_flight -= 1
+            if latency is not None:  # None: the request was never sent, so there is no feedback
+                self._feedback(latency, status, endpoint)
+            self._cond.notify_all()
+            waiters, self._async_waiters = self._async_waiters, []
+        for loop, waiter in waiters:
+            try:
+                loop.call_soon_threadsafe(waiter.set)
+            except RuntimeError:
+                pass  # the waiting loop has been closed
+
+    def _feedback(self, latency, status, endpoint):
+        self.stats['requests'] += 1
+        if status == 429:
+            self._decrease('decrease_429')
+            return
+        if status is None or status >= 500:
+            self._decrease('decrease_error')
+            return
+        baseline = self.baselines.get(endpoint)
+        self.baselines[endpoint] = latency if baseline is None else (
+            (1 - LATENCY_BASELINE_WEIGHT) * baseline + LATENCY_BASELINE_WEIGHT * latency)
+        self.avg_latency = latency if self.avg_latency is None else 0.9 * self.avg_latency + 0.1 * latency
+        if baseline is not None and latency > LATENCY_SPIKE_FACTOR * baseline:
+            self._decrease('decrease_latency')
+        else:
+            self.limit = min(self.max_limit, self.limit + 1.0 / self.limit)
+            self.stats['peak'] = max(self.stats['peak'], int(self.limit))
+
+    def _decrease(self, reason):
+        # Responses to requests sent before the last cut reflect the old limit; cut at most once per round trip
+        now = time.monotonic()
+        if now - self._last_decrease < (self.avg_latency or 0.5):
+            return
+        self._last_decrease = now
+        self.limit = max(self.min_limit, self.limit / 2)
+        self.stats[reason] += 1
+        self.stats['low'] = min(self.stats['low'], int(self.limit))
+
+    def raise_max_limit(self, max_limit):
+        with self._cond:
+            self.max_limit = max(self.max_limit, max_limit)
+
+    def report(self):
+        """
+        Print the current concurrency level and how it moved during the run.
+        """
+        with self._cond:
+            stats, limit, avg_latency = dict(self.stats), int(self.limit), self.avg_latency
+        if not stats['requests']:
+            return
+        latency = f", average latency {avg_latency * 1000:.0f} ms" if avg_latency is not None else ""
+        print(f"HTTP concurrency: limit {limit} in-flight request(s) (range {stats['low']}-{stats['peak']} over {stats['requests']} request(s){latency}); "
+              f"cut back {stats['decrease_429']}x on 429, {stats['decrease_error']}x on errors, {stats['decrease_latency']}x on latency spikes")
+
+# Batch request bodies at least this large are sent gzip-compressed when HUBSPOT_GZIP_REQUESTS=1.
+# Responses are compressed regardless: requests and aiohttp send Accept-Encoding and decode transparently.
+GZIP_REQUEST_MIN_BYTES = int(os.getenv('HUBSPOT_GZIP_MIN_BYTES', '16384'))
+_gzip_requests = os.getenv('HUBSPOT_GZIP_REQUESTS', '0') == '1'
+
+_rate_limiter = RateLimiter()
+_daily_quota = DailyQuota()
+_concurrency = ConcurrencyController()
+_http_session = None
+
+def set_rate_limiter(limiter):
+    """
+    Replace the rate limiter used by hubspot_request (e.g. with a coordinator proxy in worker processes).
+    Any object with a reserve() method returning a delay in seconds can be used.
+    """
+    global _rate_limiter
+    _rate_limiter = limiter
+
+def get_http_session():
+    """
+    Return the shared requests.Session used for all HubSpot calls, so connections are kept alive and reused.
+    """
+    global _http_session
+    if _http_session is None:
+        _http_session = requests.Session()
+    return _http_session
+
+def gzip_json_body(kwargs):
+    """
+    Return a copy of request kwargs with the json payload replaced by a gzip-compressed body, or None
+    if request compression is off or the body is smaller than GZIP_REQUEST_MIN_BYTES.
+    """
+    if not _gzip_requests or kwargs.get('json') is None:
+        return None
+    body = json.dumps(kwargs['json']).encode('utf-8')
+    if len(body) < GZIP_REQUEST_MIN_BYTES:
+        return None
+    compressed = dict(kwargs)
+    del compressed['json']
+    compressed['data'] = gzip.compress(body, compresslevel=5)
+    compressed['headers'] = {**(kwargs.get('headers') or {}), 'Content-Type': 'application/json', 'Content-Encoding': 'gzip'}
+    return compressed
+
+def _disable_gzip_requests(status):
+    global _gzip_requests
+    if _gzip_requests:
+        print(f"HubSpot rejected a gzip-compressed request body ({status}); sending uncompressed bodies from now on.")
+        _gzip_requests = False
+
+def hubspot_request(method, url, compress=False, **kwargs):
+    """
+    Send an HTTP request to HubSpot through the shared session after taking a slot from the rate limiter
+    and from the adaptive concurrency limit. Accepts the same keyword arguments as requests and returns
+    the requests.Response.
+    compress: gzip a large json body (see gzip_json_body). If HubSpot rejects the compressed body and the
+    same request succeeds uncompressed, request compression is turned off for the rest of the run.
+    """
+    compressed = gzip_json_body(kwargs) if compress else None
+    span_start = _tracer.now() if _tracer.enabled else None
+    # Take the concurrency slot first, so the rate-limit reservation is not stale by the time the request is sent
+    waited = time.monotonic()
+    _concurrency.acquire()
+    acquired = time.monotonic()
+    delay = 0.0
+    status = None
+    started = None
+    try:
+        delay = _rate_limiter.reserve()
+        if delay > 0:
+            time.sleep(delay)
+        started = time.monotonic()
+        response = get_http_session().request(method, url, **(compressed or kwargs))
+        status = response.status_code
+    finally:
+        network = time.monotonic() - started if started is not None else 0.0
+        _concurrency.release(network if started is not None else None, status, latency_class(method, url))
+        if span_start is not None:
+            _tracer.add_span(f"{method} {trace_endpoint(url)}", 'http', span_start, _tracer.now(), {
+                'status': status, 'limiter_wait_ms': round(delay * 1000, 1),
+                'concurrency_wait_ms': round((acquired - waited) * 1000, 1),
+                'network_ms': round(network * 1000, 1), 'gzip': bool(compressed)})
+    _daily_quota.record_call(response.headers)
+    if compressed and response.status_code in (400, 415):
+        retry = hubspot_request(method, url, **kwargs)
+        if retry.status_code < 400:
+            _disable_gzip_requests(response.status_code)
+        return retry
+    return response
+
+@traced('create')
+def create_hubspot_contact(csv_json, derived=None):
     """
     Create a new HubSpot contact using the provided CSV JSON record.
     This function creates an empty HubSpot JSON, determines which properties to set using get_hubspot_update_properties,
     and then creates the contact in HubSpot. Returns True if successful, False otherwise.
     """
     hubspot_json = {}
-    update_properties = get_hubspot_update_properties(hubspot_json, csv_json)
+    update_properties = get_hubspot_update_properties(hubspot_json, csv_json, derived)
     if not update_properties:
         print("No properties to set for new contact. Skipping.")
         return False
@@ -103,11 +572,12 @@ def create_hubspot_contact(csv_json):
     }
     payload = {"properties": update_properties}
     try:
-        response = requests.post(url, headers=headers, json=payload)
+        response = hubspot_request('POST', url, headers=headers, json=payload)
         response.raise_for_status()
         data = response.json()
         contact_id = data.get('id')
         print(f"Successfully created new HubSpot contact with email: {update_properties.get('email', '[no email]')} and ID: {contact_id}")
+        _search_cache.contact_created(contact_id, update_properties)
         return contact_id if contact_id else False
     except Exception as e:
         print(f"HubSpot API error while creating contact: {e}")
@@ -117,80 +587,178 @@ def create_hubspot_contact(csv_json):
 import requests
 # WARNING: Do not hardcode API keys in source code. Use environment variables for secrets.
 
-def update_secondary_email(contact_id: str, secondary_email: str):
+# --- Secondary email writer ---------------------------------------------------
+# Extra emails are added with the legacy v1 secondary-email endpoint, one call per address. The calls run on
+# background threads fed by one queue so the record loop never waits on them; they share the rate limiter,
+# retry transient errors, skip addresses HubSpot already knows and report failures in failed_records.log.
 
+SECONDARY_EMAIL_WORKERS = 4
+SECONDARY_EMAIL_MAX_ATTEMPTS = 4
+SECONDARY_EMAIL_RETRY_STATUSES = {429, 500, 502, 503, 504}
+
+def get_contact_email_identities(contact_id):
+    """
+    Return the lowercased emails HubSpot has for a contact (primary and secondary), or None if they
+    could not be fetched.
+    """
     api_key = get_api_key()
-    print(f"Start Email insert record: {contact_id} email: {secondary_email}")
+    url = f"https://api.hubapi.com/contacts/v1/contact/vid/{contact_id}/profile"
+    headers = {
+        "Content-Type": "application/json",
+        "Authorization": f"Bearer {api_key}"
+    }
+    try:
+        response = hubspot_request('GET', url, headers=headers)
+        response.raise_for_status()
+        data = response.json()
+    except Exception as e:
+        print(f"[WARN] Could not fetch existing emails for contact {contact_id}: {e}")
+        return None
+    emails = set()
+    for profile in data.get('identity-profiles', []):
+        for ident in profile.get('identities', []):
+            if ident.get('type') == 'EMAIL' and ident.get('value'):
+                emails.add(ident['value'].lower())
+    return emails
 
+@traced('secondary_emails', span_args=lambda contact_id, secondary_email, *a, **k: {'contact_id': str(contact_id)})
+def update_secondary_email(contact_id, secondary_email, max_attempts=SECONDARY_EMAIL_MAX_ATTEMPTS):
+    """
+    Add secondary_email to a HubSpot contact. If the secondary email endpoint rejects it with a 400,
+    the email is set on the contact profile instead. Rate limits (429), server errors and connection
+    errors are retried with backoff. Returns (True, None) on success or (False, reason) on failure.
+    """
+    api_key = get_api_key()
     secondary_url = f"https://api.hubapi.com/contacts/v1/secondary-email/{contact_id}/email/{secondary_email}"
     primary_url = f"https://api.hubapi.com/contacts/v1/contact/vid/{contact_id}/profile"
-
     headers = {
         'Content-Type': 'application/json',
         'Authorization': f'Bearer {api_key}'
     }
+    payload = {"properties": [{"property": "email", "value": secondary_email}]}
+    reason = None
+    for attempt in range(1, max_attempts + 1):
+        retry_after = None
+        try:
+            response = hubspot_request('PUT', secondary_url, headers=headers, json=payload)
+            if response.status_code == 400:
+                print(f"Secondary email {secondary_email} could not be set on contact {contact_id}: 400 - Trying primary")
+                response = hubspot_request('POST', primary_url, headers=headers, json=payload)
+            if response.status_code in (200, 204):
+                return True, None
+            reason = f"status {response.status_code}"
+            if response.status_code not in SECONDARY_EMAIL_RETRY_STATUSES:
+                break
+            retry_after = response.headers.get('Retry-After')
+        except Exception as e:
+            reason = str(e)
+        if attempt < max_attempts:
+            try:
+                delay = float(retry_after)
+            except (TypeError, ValueError):
+                delay = 0.5 * 2 ** (attempt - 1)
+            with _tracer.span('retry backoff', 'retry', attempt=attempt, reason=reason):
+                time.sleep(delay)
+    return False, reason
 
-    # Try to set secondary email
-    response = requests.put(
-        url=secondary_url,
-        headers=headers,
-        json={
-            "properties": [
-                {"property": "email", "value": secondary_email}
-            ]
-        }
-    )
+class SecondaryEmailWriter:
+    """
+    Background queue of secondary email writes. submit() returns immediately; worker threads fetch the
+    contact's known emails (unless the caller already has them) and add the missing ones. drain() waits
+    until everything submitted so far has been written.
+    """
+    def __init__(self, workers=SECONDARY_EMAIL_WORKERS):
+        self.workers = workers
+        self.queue = queue.Queue()
+        self._lock = threading.Lock()
+        self._threads = []
+        self._submitted = set()  # (contact_id, lowercased email) already queued in this run
+        self.stats = {'added': 0, 'known': 0, 'failed': 0}
+        self._reported = dict(self.stats)
 
-    print("Setting Secondary")
+    def submit(self, contact_id, emails, known_emails=None):
+        """
+        Queue emails to be added to contact_id. known_emails, if given, is the set of lowercased
+        emails HubSpot already has for the contact; otherwise it is fetched by the worker.
+        """
+        contact_id = str(contact_id)
+        with self._lock:
+            new_emails = []
+            for email in emails:
+                key = (contact_id, email.lower())
+                if key not in self._submitted:
+                    self._submitted.add(key)
+                    new_emails.append(email)
+            if not new_emails:
+                return
+            if not self._threads:
+                for n in range(self.workers):
+                    thread = threading.Thread(target=self._worker, name=f"secondary-email-{n + 1}", daemon=True)
+                    thread.start()
+                    self._threads.append(thread)
+        self.queue.put((contact_id, new_emails, known_emails))
 
-    # If secondary fails with 400, try to set as primary
-    if response.status_code == 400:
-        print("Secondary could not be set: 400 - Trying primary")
+    def _worker(self):
+        while True:
+            contact_id, emails, known_emails = self.queue.get()
+            try:
+                self._write(contact_id, emails, known_emails)
+            except Exception as e:
+                print(f"Unexpected error while adding secondary emails to contact {contact_id}: {e}")
+                log_failed_record_id(contact_id, reason=f"secondary emails {', '.join(emails)} failed: {e}")
+            finally:
+                self.queue.task_done()
 
-        response = requests.post(
-            url=primary_url,
-            headers=headers,
-            json={
-                "properties": [
-                    {"property": "email", "value": secondary_email}
-                ]
-            }
-        )
-        print("Setting Primary")
-        if response.status_code != 200:
-            print(f"Error: Failed to set email as primary. Status: {response.status_code}, Response: {dir(response)}")
-            import sys
-            sys.exit(1)
-    elif response.status_code != 200:
-        print(f"Error: Failed to set email as secondary. Status: {response.status_code}, Response: {response}")
-        import sys
-        sys.exit(1)
-    return {"status": "ok", "message": "Email update successful"}
+    def _write(self, contact_id, emails, known_emails):
+        if known_emails is None:
+            known_emails = get_contact_email_identities(contact_id) or set()
+        for email in emails:
+            if email.lower() in known_emails:
+                self._count('known')
+                continue
+            ok, reason = update_secondary_email(contact_id, email)
+            if ok:
+                print(f"Added secondary email {email} to contact {contact_id}.")
+                _search_cache.add(('email', normalize_search_email(email)), contact_id)
+                self._count('added')
+            else:
+                print(f"Error: Failed to add secondary email {email} to contact {contact_id}: {reason}")
+                log_failed_record_id(contact_id, reason=f"secondary email {email} failed: {reason}")
+                self._count('failed')
 
+    def _count(self, key):
+        with self._lock:
+            self.stats[key] += 1
 
-def add_secondary_email_to_hubspot_contact(contact_id, secondary_email):
+    def drain(self):
+        """
+        Wait for all queued secondary email writes and print what happened since the last drain.
+        """
+        self.queue.join()
+        with self._lock:
+            delta = {k: self.stats[k] - self._reported[k] for k in self.stats}
+            self._reported = dict(self.stats)
+        if any(delta.values()):
+            print(f"Secondary emails: {delta['added']} added, {delta['known']} already known, {delta['failed']} failed.")
+
+_secondary_email_writer = None
+
+def get_secondary_email_writer():
     """
-    Add a secondary email to a HubSpot contact using the legacy v1 endpoint.
-    Requires HUBSPOT_API_KEY environment variable to be set.
-    contact_id: HubSpot contact ID (int or str)
-    secondary_email: The email address to add as secondary (str)
-    Returns True if successful, False otherwise.
+    Return the process-wide SecondaryEmailWriter, creating it on first use.
     """
-    api_key = get_api_key()
-    if not api_key:
-        return False
-    url = f"https://api.hubapi.com/contacts/v1/secondary-email/{contact_id}/email/{secondary_email}?hapikey={api_key}"
-    headers = {"Content-Type": "application/json"}
-    payload = {"email": secondary_email}
-    try:
-        response = requests.put(url, headers=headers, json=payload)
-        response.raise_for_status()
-        print(f"Successfully added secondary email '{secondary_email}' to contact {contact_id}.")
-        return True
-    except Exception as e:
-        print(f"HubSpot API error while adding secondary email to contact {contact_id}: {e}")
-        return False
-    
+    global _secondary_email_writer
+    if _secondary_email_writer is None:
+        _secondary_email_writer = SecondaryEmailWriter()
+    return _secondary_email_writer
+
+def drain_secondary_emails():
+    """
+    Wait for pending secondary email writes, if any were submitted in this process.
+    """
+    if _secondary_email_writer is not None:
+        _secondary_email_writer.drain()
+
 def get_hubspot_language_map():
     """
     Returns a dictionary mapping language labels (and label variants) to HubSpot internal language values.
@@ -410,13 +978,519 @@ def get_hubspot_language_map():
         lang_map[code.lower()] = code
     return lang_map
 
-def get_hubspot_update_properties(hubspot_json, csv_json):
+# Gazetteer used by resolve_location. Keys are lowercase; values are the names written to HubSpot.
+US_STATES = {
+    'AL': 'Alabama', 'AK': 'Alaska', 'AZ': 'Arizona', 'AR': 'Arkansas', 'CA': 'California',
+    'CO': 'Colorado', 'CT': 'Connecticut', 'DE': 'Delaware', 'FL': 'Florida', 'GA': 'Georgia',
+    'HI': 'Hawaii', 'ID': 'Idaho', 'IL': 'Illinois', 'IN': 'Indiana', 'IA': 'Iowa',
+    'KS': 'Kansas', 'KY': 'Kentucky', 'LA': 'Louisiana', 'ME': 'Maine', 'MD': 'Maryland',
+    'MA': 'Massachusetts', 'MI': 'Michigan', 'MN': 'Minnesota', 'MS': 'Mississippi', 'MO': 'Missouri',
+    'MT': 'Montana', 'NE': 'Nebraska', 'NV': 'Nevada', 'NH': 'New Hampshire', 'NJ': 'New Jersey',
+    'NM': 'New Mexico', 'NY': 'New York', 'NC': 'North Carolina', 'ND': 'North Dakota', 'OH': 'Ohio',
+    'OK': 'Oklahoma', 'OR': 'Oregon', 'PA': 'Pennsylvania', 'RI': 'Rhode Island', 'SC': 'South Carolina',
+    'SD': 'South Dakota', 'TN': 'Tennessee', 'TX': 'Texas', 'UT': 'Utah', 'VT': 'Vermont',
+    'VA': 'Virginia', 'WA': 'Washington', 'WV': 'West Virginia', 'WI': 'Wisconsin', 'WY': 'Wyoming',
+    'DC': 'District of Columbia', 'PR': 'Puerto Rico',
+}
+CANADIAN_PROVINCES = {
+    'AB': 'Alberta', 'BC': 'British Columbia', 'MB': 'Manitoba', 'NB': 'New Brunswick',
+    'NL': 'Newfoundland and Labrador', 'NS': 'Nova Scotia', 'NT': 'Northwest Territories', 'NU': 'Nunavut',
+    'ON': 'Ontario', 'PE': 'Prince Edward Island', 'QC': 'Quebec', 'SK': 'Saskatchewan', 'YT': 'Yukon',
+}
+COUNTRIES = [
+    'United States', 'Canada', 'Mexico', 'Brazil', 'Argentina', 'Chile', 'Colombia', 'Peru',
+    'United Kingdom', 'Ireland', 'France', 'Germany', 'Netherlands', 'Belgium', 'Luxembourg', 'Switzerland',
+    'Austria', 'Spain', 'Portugal', 'Italy', 'Denmark', 'Sweden', 'Norway', 'Finland', 'Iceland', 'Poland',
+    'Czechia', 'Czech Republic', 'Slovakia', 'Hungary', 'Romania', 'Bulgaria', 'Greece', 'Croatia', 'Serbia',
+    'Slovenia', 'Estonia', 'Latvia', 'Lithuania', 'Ukraine', 'Turkey', 'Türkiye', 'Israel', 'Egypt',
+    'United Arab Emirates', 'Saudi Arabia', 'Qatar', 'South Africa', 'Nigeria', 'Kenya', 'India', 'Pakistan',
+    'Bangladesh', 'Sri Lanka', 'China', 'Hong Kong', 'Taiwan', 'Japan', 'South Korea', 'Singapore', 'Malaysia',
+    'Indonesia', 'Philippines', 'Thailand', 'Vietnam', 'Australia', 'New Zealand', 'Georgia', 'Armenia',
+    'Azerbaijan', 'Kazakhstan', 'Cyprus', 'Malta', 'Morocco', 'Tunisia', 'Jordan', 'Lebanon', 'Ghana',
+]
+COUNTRY_ALIASES = {
+    'usa': 'United States', 'us': 'United States', 'u.s.': 'United States', 'u.s.a.': 'United States',
+    'united states of america': 'United States', 'uk': 'United Kingdom', 'england': 'United Kingdom',
+    'scotland': 'United Kingdom', 'wales': 'United Kingdom', 'uae': 'United Arab Emirates',
+}
+# LinkedIn metro names -> (city, state, country)
+METRO_AREAS = {
+    'greater seattle area': ('Seattle', 'Washington', 'United States'),
+    'san francisco bay area': ('San Francisco', 'California', 'United States'),
+    'new york city metropolitan area': ('New York', 'New York', 'United States'),
+    'greater new york city area': ('New York', 'New York', 'United States'),
+    'los angeles metropolitan area': ('Los Angeles', 'California', 'United States'),
+    'greater los angeles area': ('Los Angeles', 'California', 'United States'),
+    'greater chicago area': ('Chicago', 'Illinois', 'United States'),
+    'greater boston': ('Boston', 'Massachusetts', 'United States'),
+    'greater boston area': ('Boston', 'Massachusetts', 'United States'),
+    'dallas-fort worth metroplex': ('Dallas', 'Texas', 'United States'),
+    'greater houston': ('Houston', 'Texas', 'United States'),
+    'austin, texas metropolitan area': ('Austin', 'Texas', 'United States'),
+    'atlanta metropolitan area': ('Atlanta', 'Georgia', 'United States'),
+    'greater atlanta area': ('Atlanta', 'Georgia', 'United States'),
+    'washington dc-baltimore area': ('Washington', 'District of Columbia', 'United States'),
+    'washington dc metro area': ('Washington', 'District of Columbia', 'United States'),
+    'denver metropolitan area': ('Denver', 'Colorado', 'United States'),
+    'greater denver area': ('Denver', 'Colorado', 'United States'),
+    'greater philadelphia': ('Philadelphia', 'Pennsylvania', 'United States'),
+    'greater phoenix area': ('Phoenix', 'Arizona', 'United States'),
+    'miami-fort lauderdale area': ('Miami', 'Florida', 'United States'),
+    'greater minneapolis-st. paul area': ('Minneapolis', 'Minnesota', 'United States'),
+    'greater san diego area': ('San Diego', 'California', 'United States'),
+    'greater detroit area': ('Detroit', 'Michigan', 'United States'),
+    'greater salt lake city area': ('Salt Lake City', 'Utah', 'United States'),
+    'portland, oregon metropolitan area': ('Portland', 'Oregon', 'United States'),
+    'raleigh-durham-chapel hill area': ('Raleigh', 'North Carolina', 'United States'),
+    'greater toronto area': ('Toronto', 'Ontario', 'Canada'),
+    'greater vancouver metropolitan area': ('Vancouver', 'British Columbia', 'Canada'),
+    'greater montreal metropolitan area': ('Montreal', 'Quebec', 'Canada'),
+    'greater calgary metropolitan area': ('Calgary', 'Alberta', 'Canada'),
+    'ottawa-gatineau area': ('Ottawa', 'Ontario', 'Canada'),
+    'greater london': ('London', None, 'United Kingdom'),
+    'london area': ('London', None, 'United Kingdom'),
+    'greater paris metropolitan region': ('Paris', None, 'France'),
+    'greater sydney area': ('Sydney', 'New South Wales', 'Australia'),
+    'greater melbourne area': ('Melbourne', 'Victoria', 'Australia'),
+}
+_AREA_SUFFIXES = (' metropolitan area', ' metro area', ' metroplex', ' area')
+_US_STATE_LOOKUP = {k.lower(): v for k, v in US_STATES.items()} | {v.lower(): v for v in US_STATES.values()}
+_CA_PROVINCE_LOOKUP = {k.lower(): v for k, v in CANADIAN_PROVINCES.items()} | {v.lower(): v for v in CANADIAN_PROVINCES.values()}
+_COUNTRY_LOOKUP = {c.lower(): c for c in COUNTRIES} | COUNTRY_ALIASES
+# State and province codes that are also ISO country codes ("Mumbai, IN" is India, not Indiana)
+_AMBIGUOUS_REGION_CODES = frozenset({
+    'al', 'ar', 'az', 'ca', 'co', 'de', 'ga', 'id', 'il', 'in', 'ky', 'la', 'ma', 'md', 'me', 'mn', 'mo',
+    'ms', 'mt', 'nc', 'ne', 'nl', 'nu', 'pa', 'pe', 'sc', 'sd', 'sk', 'tn', 'va', 'yt',
+})
+
+def _strip_area_suffix(value):
+    lowered = value.lower()
+    for suffix in _AREA_SUFFIXES:
+        if lowered.endswith(suffix):
+            return value[:-len(suffix)].strip()
+    return value
+
+def _resolve_region(value):
+    """
+    Resolve a state, province or country name/code to (state, country); either may be None.
+    Country names win over state names ("Tbilisi, Georgia" is the country, LinkedIn's usual "City, Country"
+    form), and two-letter codes that are also country codes are not taken as states.
+    """
+    key = value.lower()
+    if key in _COUNTRY_LOOKUP and len(key) > 2:
+        return None, _COUNTRY_LOOKUP[key]
+    if key in _AMBIGUOUS_REGION_CODES:
+        return None, None
+    if key in _US_STATE_LOOKUP:
+        return _US_STATE_LOOKUP[key], 'United States'
+    if key in _CA_PROVINCE_LOOKUP:
+        return _CA_PROVINCE_LOOKUP[key], 'Canada'
+    if key in _COUNTRY_LOOKUP:
+        return None, _COUNTRY_LOOKUP[key]
+    return None, None
+
+def _resolve_state(region, country):
+    """
+    Resolve the middle part of a "City, Region, Country" location. The country settles state codes
+    ("Atlanta, GA, United States"); a part naming a country ("London, England, United Kingdom") is no
+    state; other regions (e.g. "Bavaria") are kept as written.
+    """
+    key = region.lower()
+    if country == 'United States' and key in _US_STATE_LOOKUP:
+        return _US_STATE_LOOKUP[key]
+    if country == 'Canada' and key in _CA_PROVINCE_LOOKUP:
+        return _CA_PROVINCE_LOOKUP[key]
+    if key in _COUNTRY_LOOKUP:
+        return None
+    return region
+
+@functools.lru_cache(maxsize=4096)
+def resolve_location(location_name):
+    """
+    Split a LinkedIn location string into (city, state, country); unknown parts are None.
+    Uses the embedded gazetteer for US states, Canadian provinces, countries and metro areas,
+    so "Toronto, Ontario" resolves to Canada and "Greater Seattle Area" to Seattle, Washington.
+    Results are memoized because campaigns repeat a small set of locations.
+    """
+    loc_parts = [p.strip() for p in (location_name or '').split(',') if p.strip()]
+    if not loc_parts:
+        return None, None, None
+    metro = METRO_AREAS.get(', '.join(loc_parts[:2]).lower()) or METRO_AREAS.get(loc_parts[0].lower())
+    if metro:
+        return metro
+    if len(loc_parts) >= 3:
+        city, region, country = loc_parts[0], loc_parts[-2], loc_parts[-1]
+        country = _resolve_region(country)[1] or country
+        return city, _resolve_state(region, country), country
+    if len(loc_parts) == 2:
+        city, region = loc_parts[0], _strip_area_suffix(loc_parts[1])
+        state, country = _resolve_region(region)
+        if not state and not country and region.lower() not in _AMBIGUOUS_REGION_CODES:
+            # Unknown region: keep it as the state but do not guess a country
+            state = region
+        return _strip_area_suffix(city), state, country
+    # Single part: a metro name ("Greater Denver Area"), a region on its own, or a city
+    name = loc_parts[0]
+    state, country = _resolve_region(name)
+    if state or country:
+        return None, state, country
+    if name.lower().startswith('greater '):
+        name = name[len('greater '):]
+    return _strip_area_suffix(name), None, None
+
+# Contact property holding the canonical LinkedIn key (single-line text, ideally with unique values)
+LINKEDIN_KEY_PROPERTY = os.getenv('HUBSPOT_LINKEDIN_KEY_PROPERTY', 'linkedin_canonical_key')
+# Also match contacts whose canonical key has not been written yet by their linkedin_url spellings
+LINKEDIN_LEGACY_URL_LOOKUP = True
+
+_LINKEDIN_URL_PATTERN = re.compile(
+    r"^(?:https?://)?(?:[a-z]{2,3}\.|www\.|m\.)?linkedin\.com/"
+    r"(?:in|pub|sales/people|sales/lead|talent/profile)/([^/?#,]+)",
+    re.IGNORECASE
+)
+_LINKEDIN_HASH_PATTERN = re.compile(r"^AC[a-zA-Z0-9_-]{20,}$")  # member hash IDs are case-sensitive
+
+def canonicalize_linkedin_id(value):
+    """
+    Return the canonical key for a LinkedIn profile URL or bare ID, or None if there is none.
+    Scheme, host (www, m and locale subdomains), trailing slashes, query strings and
+    sales/people suffixes are dropped; public IDs are lowercased, member hash IDs keep their case.
+    """
+    value = (value or '').strip()
+    if not value:
+        return None
+    match = _LINKEDIN_URL_PATTERN.match(value)
+    if match:
+        slug = match.group(1)
+    elif 'linkedin.com' in value.lower() or '/' in value.strip('/'):
+        return None
+    else:
+        slug = value.strip('/').split(',', 1)[0].split('?', 1)[0]
+    slug = urllib.parse.unquote(slug).strip()
+    if not slug:
+        return None
+    return slug if _LINKEDIN_HASH_PATTERN.match(slug) else slug.lower()
+
+def linkedin_profile_url(linkedin_key):
+    """
+    Return the https://www.linkedin.com/in/ URL for a canonical LinkedIn key.
+    """
+    return f"https://www.linkedin.com/in/{linkedin_key}"
+
+def get_record_linkedin_key(record):
+    """
+    Return the canonical LinkedIn key for a CSV record, preferring the public ID over hash IDs.
+    """
+    candidates = []
+    if str(record.get('id_type') or '').strip().lower() == 'public-id':
+        candidates.append(record.get('id'))
+    candidates += [record.get('public_id'), record.get('public_id_2'), record.get('profile_url'),
+                   record.get('id'), record.get('hash_id')]
+    for candidate in candidates:
+        key = canonicalize_linkedin_id(candidate)
+        if key:
+            return key
+    return None
+
+# Define fields that can be mapped directly if present in both
+DIRECT_FIELDS = [
+    'industry', 'birthday', 'education_start_1' 
+]
+
+# Map CSV keys to HubSpot property names if they differ
+CSV_TO_HUBSPOT_MAP = {
+    'first_name': 'firstname',
+    'last_name': 'lastname',
+    'mobile': 'mobilephone',
+    'organization_url_1': 'website',
+    'member_id': 'linkedin_member_id',
+    'hash_id': 'linkedin_hash_id',
+    'sn_hash_id': 'linkedin_sn_hash_id',
+    'lh_id': 'linkedhelper_crm_id',
+    'profile_url': 'linkedin_url',  
+    'profile_url': 'linkedin',
+    'headline': 'linkedin_headline',
+    'location_name': 'linkedin_location_name',
+    'summary': 'lh_summary',
+    'badges_premium': 'linkedin_premium_badge',
+    'badges_influencer': 'linkedin_influencer_badge',
+    'badges_job_seeker': 'lh_badgesjobseeker',
+    'badges_open_link': 'linkedin_open_badge',
+    'badges_hiring': 'lh_badgeshiring',
+    'current_company': 'company', 
+    'current_company_position': 'jobtitle',
+    'current_company_position': 'linkedin_title',
+    'organization_1': 'company',
+    'organization_id_1': 'organization_li_id_1',
+    'organization_url_1': 'organization_li_url_1',
+    'organization_title_1': 'organization_title_1',
+    'organization_start_1': 'organization_start_1',
+    'organization_end_1': 'organization_end_1',
+    'organization_description_1': 'organization_description_1',
+    'organization_location_1': 'organization_location_1',
+    'organization_website_1': 'organization_website_1',
+    'organization_domain_1': 'organization_domain_1',
+    'education_1': 'linkedin_education',
+    'education_end_1': 'linkedin_education_end',
+    'language_1': 'hs_language',
+    'skills': 'linkedin_skills',
+    'twitters': 'lh_twitter',
+    'website_1': 'website',
+    'website_2': 'personal_website_1',
+    'tags': 'lh_tags',
+    'connected_at': 'linkedin_connected_at',
+    'mutual_count': 'linkedin_mutual_count',
+    'followers': 'linkedin_followers',
+    'connections_count': 'linkedinconnections',
+    'member_distance': 'lh_member_distance'
+    # Add more mappings as needed
+}
+
+BADGE_KEYS = {
+    'linkedin_premium_badge', 'linkedin_influencer_badge', 'lh_badgesjobseeker',
+    'linkedin_open_badge', 'lh_badgeshiring'
+}
+
+def normalize_organization_website(value):
+    """
+    Normalize a malformed organization_website_1 URL: keep the part after the last colon or
+    prepend https:// when the scheme is missing.
+    """
+    val_str = str(value).strip().lstrip()
+    # If value contains a colon, take the part after the last colon and prepend https://
+    if val_str:
+        if ':' in val_str:
+            # Split on colon and take the last part (after the last colon)
+            last_part = val_str.split(':')[-1].lstrip('/').lstrip()
+            if last_part:
+                return 'https://' + last_part
+            return 'https://'
+        elif not val_str.lower().startswith('http'):
+            return 'https://' + val_str
+    return value
+
+def normalize_badge_value(value):
+    """
+    Convert a badge/boolean CSV value to lowercase 'true' or 'false' (unknown values pass through lowercased).
+    """
+    val_str = str(value).strip().lower()
+    if val_str in {'true', 'false'}:
+        return val_str
+    # Accept also 1/0, yes/no, y/n
+    if val_str in {'1', 'yes', 'y'}:
+        return 'true'
+    elif val_str in {'0', 'no', 'n'}:
+        return 'false'
+    return 'false' if not val_str else val_str
+
+@functools.lru_cache(maxsize=1)
+def _cached_language_map():
+    return get_hubspot_language_map()
+
+def get_language_code(value):
+    """
+    Map a language label or code to the HubSpot hs_language value, or None if unknown.
+    """
+    return _cached_language_map().get(str(value).strip().lower())
+
+def build_education_description(degree, fos):
+    """
+    education_description_1 is education_degree_1 + education_fos_1 (either may be empty).
+    """
+    return ' '.join([v for v in [(degree or '').strip(), (fos or '').strip()] if v])
+
+# --- Contact property schema ---------------------------------------------------
+# HubSpot rejects a whole write (and a whole batch) with a 400 if one value does not fit its property:
+# an unknown enumeration option, a malformed date, text in a number field. The contact property
+# definitions are fetched once, cached on disk for PROPERTY_SCHEMA_TTL_HOURS, and every property set is
+# coerced to the expected format locally; values that cannot be coerced are dropped and logged.
+
+PROPERTY_SCHEMA_FILE = '.hubspot_contact_properties.json'
+PROPERTY_SCHEMA_TTL_HOURS = float(os.getenv('HUBSPOT_SCHEMA_TTL_HOURS', '24'))
+HUBSPOT_STRING_MAX_LENGTH = 65536
+TRUE_VALUES = frozenset({'true', '1', 'yes', 'y', 't', 'on'})
+FALSE_VALUES = frozenset({'false', '0', 'no', 'n', 'f', 'off', ''})
+# Formats seen in LinkedHelper exports besides ISO 8601; partial dates mean the first day of the period
+DATE_INPUT_FORMATS = ('%m/%d/%Y', '%d.%m.%Y', '%b %d, %Y', '%B %d, %Y', '%d %b %Y', '%d %B %Y',
+                      '%b %Y', '%B %Y', '%m/%Y', '%Y-%m', '%Y')
+
+_property_schema = None
+_property_schema_lock = threading.Lock()
+_reported_unknown_properties = set()
+
+def fetch_contact_property_schema():
+    """
+    Fetch all contact property definitions and return {name: {'type', 'field_type', 'options', 'labels', 'read_only'}},
+    or None on error.
+    """
+    api_key = get_api_key()
+    if not api_key:
+        return None
+    url = "https://api.hubapi.com/crm/v3/properties/contacts"
+    headers = {
+        "Content-Type": "application/json",
+        "Authorization": f"Bearer {api_key}"
+    }
+    try:
+        response = hubspot_request('GET', url, headers=headers)
+        response.raise_for_status()
+        results = response.json().get('results', [])
+    except Exception as e:
+        print(f"HubSpot API error while fetching contact properties: {e}")
+        return None
+    schema = {}
+    for prop in results:
+        options = [o for o in prop.get('options') or [] if not o.get('hidden')]
+        schema[prop['name']] = {
+            'type': prop.get('type'),
+            'field_type': prop.get('fieldType'),
+            'options': [o.get('value') for o in options],
+            'labels': {str(o.get('label', '')).strip().lower(): o.get('value') for o in options},
+            'read_only': bool((prop.get('modificationMetadata') or {}).get('readOnlyValue')),
+        }
+    return schema
+
+def get_contact_property_schema():
+    """
+    Return the contact property schema from PROPERTY_SCHEMA_FILE if it is fresh, otherwise fetch and cache it.
+    Returns None if it is unavailable; properties are then sent unvalidated.
+    """
+    global _property_schema
+    with _property_schema_lock:
+        if _property_schema is not None:
+            return _property_schema or None
+        try:
+            with open(PROPERTY_SCHEMA_FILE, encoding='utf-8') as f:
+                cached = json.load(f)
+            if time.time() - cached['fetched_at'] < PROPERTY_SCHEMA_TTL_HOURS * 3600:
+                _property_schema = cached['properties']
+                return _property_schema
+        except (OSError, ValueError, KeyError, TypeError):
+            pass
+        schema = fetch_contact_property_schema()
+        _property_schema = schema or {}  # {} = unavailable for this run; do not refetch per record
+        if schema:
+            try:
+                with open(PROPERTY_SCHEMA_FILE, 'w', encoding='utf-8') as f:
+                    json.dump({'fetched_at': time.time(), 'properties': schema}, f)
+            except OSError as e:
+                print(f"Could not cache contact properties in {PROPERTY_SCHEMA_FILE}: {e}")
+        return schema
+
+def parse_date_value(value):
+    """
+    Parse an ISO 8601 or common LinkedHelper date/datetime string into a datetime (naive means UTC), or None.
+    """
+    value = str(value).strip()
+    try:
+        return datetime.datetime.fromisoformat(value.replace('Z', '+00:00'))
+    except ValueError:
+        pass
+    if value.isdigit() and len(value) >= 12:  # epoch milliseconds
+        return datetime.datetime.fromtimestamp(int(value) / 1000, tz=datetime.timezone.utc)
+    for fmt in DATE_INPUT_FORMATS:
+        try:
+            return datetime.datetime.strptime(value, fmt)
+        except ValueError:
+            continue
+    return None
+
+def coerce_property_value(definition, value):
+    """
+    Coerce a value to what HubSpot accepts for a property definition.
+    Returns (value, None) or (None, reason) if the value cannot be used.
+    """
+    value = str(value).strip()
+    prop_type = definition.get('type')
+    if prop_type == 'bool' or definition.get('field_type') == 'booleancheckbox':
+        lowered = value.lower()
+        if lowered in TRUE_VALUES:
+            return 'true', None
+        if lowered in FALSE_VALUES:
+            return 'false', None
+        return None, "not a boolean"
+    if prop_type == 'enumeration':
+        options = set(definition.get('options') or [])
+        labels = definition.get('labels') or {}
+        parts = value.split(';') if definition.get('field_type') == 'checkbox' else [value]
+        coerced = []
+        for part in (p.strip() for p in parts):
+            if part in options:
+                coerced.append(part)
+            elif part.lower() in labels:
+                coerced.append(labels[part.lower()])
+            else:
+                return None, f"'{part}' is not an option"
+        return ';'.join(coerced), None
+    if prop_type == 'number':
+        cleaned = value.replace(',', '').replace(' ', '').rstrip('+')
+        try:
+            number = float(cleaned)
+        except ValueError:
+            return None, "not a number"
+        if not math.isfinite(number):
+            return None, "not a finite number"
+        return (str(int(number)) if number.is_integer() else repr(number)), None
+    if prop_type in ('date', 'datetime'):
+        parsed = parse_date_value(value)
+        if parsed is None:
+            return None, "not a recognized date"
+        if parsed.tzinfo is not None:
+            parsed = parsed.astimezone(datetime.timezone.utc).replace(tzinfo=None)
+        if prop_type == 'date':
+            return parsed.strftime('%Y-%m-%d'), None
+        return parsed.strftime('%Y-%m-%dT%H:%M:%S.') + f"{parsed.microsecond // 1000:03d}Z", None
+    if len(value) > HUBSPOT_STRING_MAX_LENGTH:
+        return value[:HUBSPOT_STRING_MAX_LENGTH], None
+    return value, None
+
+def validate_contact_properties(properties, hubspot_json=None, record_label=None):
+    """
+    Coerce properties against the contact property schema. Unknown or read-only properties and values
+    that cannot be coerced are dropped (and logged to failed_records.log); values that become equal to
+    the current HubSpot value are dropped silently. Returns the validated dict.
+    The email property is passed through (it may hold several addresses, split later).
+    """
+    schema = get_contact_property_schema()
+    if not schema:
+        return properties
+    hubspot_json = hubspot_json or {}
+    validated = {}
+    for name, value in properties.items():
+        definition = schema.get(name)
+        if name == 'email':
+            validated[name] = value
+            continue
+        if definition is None:
+            if name not in _reported_unknown_properties:
+                _reported_unknown_properties.add(name)
+                print(f"WARNING: HubSpot has no contact property '{name}'; it will not be written.")
+                log_failed_record_id(record_label or 'properties', reason=f"unknown contact property {name}")
+            continue
+        if definition.get('read_only'):
+            continue
+        coerced, reason = coerce_property_value(definition, value)
+        if reason:
+            print(f"Dropping invalid value for {name}: {value!r} ({reason}).")
+            log_failed_record_id(record_label or 'properties', reason=f"invalid {name}={value!r}: {reason}")
+            continue
+        if coerced != hubspot_json.get(name):
+            validated[name] = coerced
+    return validated
+
+@traced('diff')
+def get_hubspot_update_properties(hubspot_json, csv_json, derived=None, validate=True):
     """
     Given a HubSpot contact JSON (properties) and a CSV record JSON,
     return a dict of properties to update in HubSpot (only those that should be changed).
     Handles both direct matches and custom logic for specific fields.
+    derived: optional row from prepare_derived_columns; its precomputed values are used instead of
+    re-deriving location, education, website, language and badge fields from the record.
+    The result is validated and coerced against the contact property schema (validate_contact_properties)
+    unless validate is False, in which case the raw mapped properties are returned without any logging.
     """
     update_props = {}
+    derived = derived or {}
 
     # Custom logic: map csv.phone_1 to the correct HubSpot property based on csv.phone_type_1
     phone_type = (csv_json.get('phone_type_1') or '').strip().upper()
@@ -433,144 +1507,48 @@ def get_hubspot_update_properties(hubspot_json, csv_json):
                 update_props['mobilephone'] = phone_val
 
     # Custom logic: education_description_1 is education_degree_1 + education_fos_1
-    edu_degree = csv_json.get('education_degree_1', '').strip()
-    edu_fos = csv_json.get('education_fos_1', '').strip()
-    if edu_degree or edu_fos:
-        edu_desc = ' '.join([v for v in [edu_degree, edu_fos] if v])
-        if edu_desc and hubspot_json.get('education_description_1') != edu_desc:
-            update_props['education_description_1'] = edu_desc
+    if 'education_description_1' in derived:
+        edu_desc = derived['education_description_1']
+    else:
+        edu_desc = build_education_description(csv_json.get('education_degree_1'), csv_json.get('education_fos_1'))
+    if edu_desc and hubspot_json.get('education_description_1') != edu_desc:
+        update_props['education_description_1'] = edu_desc
 
     # Custom logic: split csv.location_name into hubspot city, state, country
-    if 'location_name' in csv_json and csv_json['location_name']:
-        loc = csv_json['location_name']
-        loc_parts = [p.strip() for p in loc.split(',') if p.strip()]
-        # Reset values to update if different
-        if len(loc_parts) == 3:
-            city, state, country = loc_parts
-            if city and hubspot_json.get('city') != city:
-                update_props['city'] = city
-            if state and hubspot_json.get('state') != state:
-                update_props['state'] = state
-            if country and hubspot_json.get('country') != country:
-                update_props['country'] = country
-        elif len(loc_parts) == 2:
-            city, state = loc_parts
-            if city and hubspot_json.get('city') != city:
-                update_props['city'] = city
-            # If state ends with 'Area', strip it away
-            state_clean = state[:-4].strip() if state.lower().endswith('area') else state
-            if state_clean and hubspot_json.get('state') != state_clean:
-                update_props['state'] = state_clean
-                update_props['country'] = 'United States'  # Default to US if state is provided
-        elif len(loc_parts) == 1:
-            city = loc_parts[0]
-            if city and hubspot_json.get('city') != city:
-                update_props['city'] = city
-
-    # Define fields that can be mapped directly if present in both
-    direct_fields = [
-        'industry', 'birthday', 'education_start_1' 
-    ]
-
-    # Map CSV keys to HubSpot property names if they differ
-    csv_to_hubspot_map = {
-        'first_name': 'firstname',
-        'last_name': 'lastname',
-        'mobile': 'mobilephone',
-        'organization_url_1': 'website',
-        'member_id': 'linkedin_member_id',
-        'hash_id': 'linkedin_hash_id',
-        'sn_hash_id': 'linkedin_sn_hash_id',
-        'lh_id': 'linkedhelper_crm_id',
-        'profile_url': 'linkedin_url',  
-        'profile_url': 'linkedin',
-        'headline': 'linkedin_headline',
-        'location_name': 'linkedin_location_name',
-        'summary': 'lh_summary',
-        'badges_premium': 'linkedin_premium_badge',
-        'badges_influencer': 'linkedin_influencer_badge',
-        'badges_job_seeker': 'lh_badgesjobseeker',
-        'badges_open_link': 'linkedin_open_badge',
-        'badges_hiring': 'lh_badgeshiring',
-        'current_company': 'company', 
-        'current_company_position': 'jobtitle',
-        'current_company_position': 'linkedin_title',
-        'organization_1': 'company',
-        'organization_id_1': 'organization_li_id_1',
-        'organization_url_1': 'organization_li_url_1',
-        'organization_title_1': 'organization_title_1',
-        'organization_start_1': 'organization_start_1',
-        'organization_end_1': 'organization_end_1',
-        'organization_description_1': 'organization_description_1',
-        'organization_location_1': 'organization_location_1',
-        'organization_website_1': 'organization_website_1',
-        'organization_domain_1': 'organization_domain_1',
-        'education_1': 'linkedin_education',
-        'education_end_1': 'linkedin_education_end',
-        'language_1': 'hs_language',
-        'skills': 'linkedin_skills',
-        'twitters': 'lh_twitter',
-        'website_1': 'website',
-        'website_2': 'personal_website_1',
-        'tags': 'lh_tags',
-        'connected_at': 'linkedin_connected_at',
-        'mutual_count': 'linkedin_mutual_count',
-        'followers': 'linkedin_followers',
-        'connections_count': 'linkedinconnections',
-        'member_distance': 'lh_member_distance'
-        # Add more mappings as needed
-    }
+    if 'location' in derived:
+        location = derived['location']
+    elif 'location_name' in csv_json and csv_json['location_name']:
+        location = resolve_location(csv_json['location_name'])
+    else:
+        location = (None, None, None)
+    for prop, value in zip(('city', 'state', 'country'), location):
+        if value and hubspot_json.get(prop) != value:
+            update_props[prop] = value
 
     # 1. Direct field matches (same name in both)
-    for field in direct_fields:
+    for field in DIRECT_FIELDS:
         csv_val = csv_json.get(field)
         hub_val = hubspot_json.get(field)
         if csv_val is not None and str(csv_val).strip() != '' and csv_val != hub_val:
             update_props[field] = str(csv_val).strip()
 
     # 2. Mapped fields (different names)
-    badge_keys = {
-        'linkedin_premium_badge', 'linkedin_influencer_badge', 'lh_badgesjobseeker',
-        'linkedin_open_badge', 'lh_badgeshiring'
-    }
-    lang_map = get_hubspot_language_map()
-    for csv_key, hub_key in csv_to_hubspot_map.items():
+    for csv_key, hub_key in CSV_TO_HUBSPOT_MAP.items():
         csv_val = csv_json.get(csv_key)
         if csv_val is not None and str(csv_val).strip() != '':
             val_to_set = csv_val
             # Special logic for organization_website_1: normalize malformed URLs
             if csv_key == 'organization_website_1':
-                val_str = str(csv_val).strip().lstrip()
-                # If value contains a colon, take the part after the last colon and prepend https://
-                if val_str:
-                    if ':' in val_str:
-                        # Split on colon and take the last part (after the last colon)
-                        last_part = val_str.split(':')[-1].lstrip('/').lstrip()
-                        if last_part:
-                            val_to_set = 'https://' + last_part
-                        else:
-                            val_to_set = 'https://'
-                    elif not val_str.lower().startswith('http'):
-                        val_to_set = 'https://' + val_str
+                val_to_set = derived[hub_key] if hub_key in derived else normalize_organization_website(csv_val)
             if hub_key == 'hs_language':
                 # Map language_1 to hs_language using the language map
-                lang_code = lang_map.get(str(csv_val).strip().lower())
+                lang_code = derived[hub_key] if hub_key in derived else get_language_code(csv_val)
                 if lang_code and hubspot_json.get('hs_language') != lang_code:
                     update_props['hs_language'] = lang_code
                 continue
-            if hub_key in badge_keys:
+            if hub_key in BADGE_KEYS:
                 # Convert to lowercase 'true' or 'false' string
-                val_str = str(csv_val).strip().lower()
-                if val_str in {'true', 'false'}:
-                    val_to_set = val_str
-                else:
-                    # Accept also 1/0, yes/no, y/n
-                    if val_str in {'1', 'yes', 'y'}:
-                        val_to_set = 'true'
-                    elif val_str in {'0', 'no', 'n'}:
-                        val_to_set = 'false'
-                    else:
-                        val_to_set = 'false' if not val_str else val_str
+                val_to_set = derived[hub_key] if hub_key in derived else normalize_badge_value(csv_val)
             if hubspot_json.get(hub_key) != val_to_set:
                 # For company, only update if not already set or if org_1 is preferred
                 if hub_key == 'company' and hubspot_json.get('company'):
@@ -596,22 +1574,29 @@ def get_hubspot_update_properties(hubspot_json, csv_json):
     linkedin_url = hubspot_json.get('linkedin_url', '')
     # Check for empty or sales/people linkedin_url
     if not linkedin_url or linkedin_url.startswith('https://www.linkedin.com/sales/people'):
-        if profile_url and profile_url.startswith('https://www.linkedin.com/sales/people'):
-            # Replace sales/people with /in and cut after first comma
-            new_url = profile_url.replace('https://www.linkedin.com/sales/people', 'https://www.linkedin.com/in')
-            if ',' in new_url:
-                new_url = new_url.split(',', 1)[0]
-            update_props['linkedin_url'] = new_url
+        profile_key = canonicalize_linkedin_id(profile_url) if profile_url else None
+        if profile_key and profile_url.startswith('https://www.linkedin.com/sales/people'):
+            # Replace sales/people with the /in URL of its canonical key (drops everything after the first comma)
+            update_props['linkedin_url'] = linkedin_profile_url(profile_key)
         elif profile_url:
             update_props['linkedin_url'] = profile_url
     elif profile_url is not None and str(profile_url).strip() != '':
         update_props['linkedin_url'] = profile_url
 
+    # Canonical LinkedIn key used for single exact-match identity lookups
+    linkedin_key = get_record_linkedin_key(csv_json)
+    if linkedin_key and hubspot_json.get(LINKEDIN_KEY_PROPERTY) != linkedin_key:
+        update_props[LINKEDIN_KEY_PROPERTY] = linkedin_key
+
 
 
     # Add more custom logic as needed
-    return update_props
+    if not validate:
+        return update_props
+    record_label = f"record {csv_json.get('id') or csv_json.get('full_name') or '?'}"
+    return validate_contact_properties(update_props, hubspot_json, record_label)
 
+@traced('write')
 def update_hubspot_contact_by_id(contact_id, properties):
     """
     Update a HubSpot contact record by ID with the given properties (JSON object).
@@ -628,29 +1613,7 @@ def update_hubspot_contact_by_id(contact_id, properties):
         email_list = [e.strip() for e in email_val.split(',') if e.strip()]
         if email_list:
             properties['email'] = email_list[0]
-            # Only add as secondary if not already present in HubSpot
-            # Fetch current contact to get all emails
-            # api_key already set above
-            url = f"https://api.hubapi.com/contacts/v1/contact/vid/{contact_id}/profile"
-            headers = {
-                "Content-Type": "application/json",
-                "Authorization": f"Bearer {api_key}"
-            }
-            try:
-                resp = requests.get(url, headers=headers)
-                resp.raise_for_status()
-                data = resp.json()
-                existing_emails = set()
-                if 'identity-profiles' in data:
-                    for profile in data['identity-profiles']:
-                        for ident in profile.get('identities', []):
-                            if ident.get('type') == 'EMAIL' and ident.get('value'):
-                                existing_emails.add(ident['value'].lower())
-                # Only add secondary emails not already present
-                secondary_emails = [e for e in email_list[1:] if e.lower() not in existing_emails]
-            except Exception as e:
-                print(f"[WARN] Could not fetch existing emails for contact {contact_id}: {e}")
-                secondary_emails = email_list[1:]
+            secondary_emails = email_list[1:]
     url = f"https://api.hubapi.com/crm/v3/objects/contacts/{contact_id}"
     headers = {
         "Content-Type": "application/json",
@@ -663,12 +1626,14 @@ def update_hubspot_contact_by_id(contact_id, properties):
         print(f"[DEBUG] Properties to update: {properties}")
         print(f"[DEBUG] PATCH payload: {payload}")
     try:
-        response = requests.patch(url, headers=headers, json=payload)
+        response = hubspot_request('PATCH', url, headers=headers, json=payload)
         response.raise_for_status()
         data = response.json()
-        # Add secondary emails if needed
-        for sec_email in secondary_emails:
-            update_secondary_email(contact_id, sec_email)
+        if properties.get('email'):
+            _search_cache.emails_written(contact_id, [properties['email']])
+        # Secondary emails HubSpot does not know yet are added in the background
+        if secondary_emails:
+            get_secondary_email_writer().submit(contact_id, secondary_emails)
         return data.get('properties', {})
     except Exception as e:
         print(f"HubSpot API error while updating contact {contact_id}: {e}")
@@ -676,6 +1641,7 @@ def update_hubspot_contact_by_id(contact_id, properties):
         log_http_error(properties, response)
         return None
 
+@traced('fetch')
 def get_hubspot_contact_by_id(contact_id):
     """
     Fetch a HubSpot contact record by ID and return its properties as a JSON object.
@@ -690,7 +1656,7 @@ def get_hubspot_contact_by_id(contact_id):
         "Authorization": f"Bearer {api_key}"
     }
     try:
-        response = requests.get(url, headers=headers)
+        response = hubspot_request('GET', url, headers=headers)
         response.raise_for_status()
         data = response.json()
         return data.get('properties', {})
@@ -698,6 +1664,71 @@ def get_hubspot_contact_by_id(contact_id):
         print(f"HubSpot API error while fetching contact {contact_id}: {e}")
         return None
 
+@traced('fetch')
+def batch_read_hubspot_contacts(contact_ids, properties=None):
+    """
+    Read contacts 100 at a time with the v3 batch read endpoint.
+    Returns a dict mapping contact ID to its properties; IDs that could not be read are missing.
+    """
+    api_key = get_api_key()
+    if not api_key:
+        return {}
+    url = "https://api.hubapi.com/crm/v3/objects/contacts/batch/read"
+    headers = {
+        "Content-Type": "application/json",
+        "Authorization": f"Bearer {api_key}"
+    }
+    contact_ids = [str(c) for c in contact_ids]
+    contacts = {}
+    for i in range(0, len(contact_ids), 100):
+        payload = {
+            "inputs": [{"id": c} for c in contact_ids[i:i + 100]],
+            "properties": list(properties or [])
+        }
+        try:
+            response = hubspot_request('POST', url, compress=True, headers=headers, json=payload)
+            response.raise_for_status()
+            for result in response.json().get('results', []):
+                if result.get('id'):
+                    contacts[result['id']] = result.get('properties', {})
+        except Exception as e:
+            print(f"HubSpot API error during batch read: {e}")
+    return contacts
+
+@traced('write')
+def batch_update_hubspot_contacts(updates):
+    """
+    Update contacts 100 at a time with the v3 batch update endpoint.
+    updates: dict mapping contact ID to a properties dict (single primary email only).
+    If a batch is rejected, its contacts are retried one by one so a single bad field does not fail the rest.
+    Returns the set of contact IDs that were updated.
+    """
+    api_key = get_api_key()
+    if not api_key:
+        return set()
+    url = "https://api.hubapi.com/crm/v3/objects/contacts/batch/update"
+    headers = {
+        "Content-Type": "application/json",
+        "Authorization": f"Bearer {api_key}"
+    }
+    items = [{"id": str(c), "properties": p} for c, p in updates.items()]
+    updated = set()
+    for i in range(0, len(items), 100):
+        chunk = items[i:i + 100]
+        try:
+            response = hubspot_request('POST', url, compress=True, headers=headers, json={"inputs": chunk})
+            response.raise_for_status()
+            updated.update(r.get('id') for r in response.json().get('results', []) if r.get('id'))
+            for item in chunk:
+                if item['properties'].get('email') and item['id'] in updated:
+                    _search_cache.emails_written(item['id'], [item['properties']['email']])
+        except Exception as e:
+            print(f"HubSpot API error during batch update, retrying {len(chunk)} contact(s) individually: {e}")
+            for item in chunk:
+                if update_hubspot_contact_by_id(item['id'], item['properties']) is not None:
+                    updated.add(item['id'])
+    return updated
+
 def merge_hubspot_contacts(id1, id2):
     """
     Merge two HubSpot contacts. The contact with the smaller ID is merged into the larger (primary).
@@ -722,7 +1753,7 @@ def merge_hubspot_contacts(id1, id2):
             "objectIdToMerge": objectIdToMerge,
             "primaryObjectId": primaryObjectId
         }
-        response = requests.post(url, headers=headers, json=payload)
+        response = hubspot_request('POST', url, headers=headers, json=payload)
         response.raise_for_status()
         print(f"Successfully merged contact {objectIdToMerge} into {primaryObjectId}.")
         return response.json()
@@ -730,254 +1761,1603 @@ def merge_hubspot_contacts(id1, id2):
         print(f"HubSpot API error during merge: {e}")
         return None
 
+# --- Name matching -----------------------------------------------------------
+# Name searches return every contact with the same first and last name, which for common names means
+# unrelated people. Results are paged (sorted newest first, up to NAME_SEARCH_MAX_PAGES pages) with the
+# company, email and LinkedIn properties, candidates are ranked locally on that evidence, and at most
+# NAME_CORROBORATION_LIMIT of them are checked against their associated companies when nothing decides.
+# A single best candidate is kept (highest ID on ties), so a name match never merges several contacts, and
+# when several candidates remain without any evidence none is used: the record is created as a new contact
+# rather than written into a stranger's.
+
+NAME_SEARCH_MAX_PAGES = int(os.getenv('HUBSPOT_NAME_SEARCH_MAX_PAGES', '3'))
+NAME_CORROBORATION_LIMIT = int(os.getenv('HUBSPOT_NAME_CORROBORATION_LIMIT', '3'))
+NAME_SEARCH_PROPERTIES = ['firstname', 'lastname', 'company', 'email', 'hs_additional_emails', 'linkedin_url', LINKEDIN_KEY_PROPERTY]
+NAME_MATCH_SCORES = {'email': 4, 'linkedin': 4, 'company': 2}
+
+# Contact ID -> properties returned by a name search (or written by a create), so cached name searches
+# can still be ranked
+_name_candidate_properties = {}
+
+def remember_name_candidate(contact_id, properties):
+    """
+    Keep the name-matching properties of a contact this run created, so later same-name records can be
+    ranked against it. A create may hold several comma-separated emails; the first is the primary one.
+    """
+    candidate = {k: properties[k] for k in NAME_SEARCH_PROPERTIES if properties.get(k)}
+    emails = [e.strip() for e in (properties.get('email') or '').split(',') if e.strip()]
+    if emails:
+        candidate['email'] = emails[0]
+        candidate['hs_additional_emails'] = ';'.join(emails[1:])
+    _name_candidate_properties[str(contact_id)] = candidate
+
+def build_name_search_payload(first_name, last_name, after=None):
+    """
+    Build one page of the exact first/last name search, newest contacts first.
+    """
+    payload = {
+        "filterGroups": [
+            {
+                "filters": [
+                    {"propertyName": "firstname", "operator": "EQ", "value": first_name},
+                    {"propertyName": "lastname", "operator": "EQ", "value": last_name}
+                ]
+            }
+        ],
+        "properties": NAME_SEARCH_PROPERTIES,
+        "sorts": [{"propertyName": "hs_object_id", "direction": "DESCENDING"}],
+        "limit": 100
+    }
+    if after:
+        payload["after"] = after
+    return payload
+
+def cached_name_candidates(cache_key):
+    """
+    Return {contact ID: properties} for a cached name search, or None if it is not cached.
+    Contacts that joined the entry through a create or merge have no properties and rank on the name alone.
+    """
+    ids = _search_cache.get(cache_key) if cache_key else None
+    if ids is None:
+        return None
+    return {contact_id: _name_candidate_properties.get(contact_id, {}) for contact_id in ids}
+
+def store_name_candidates(cache_key, candidates, complete=True):
+    _name_candidate_properties.update(candidates)
+    if cache_key and complete:
+        _search_cache.put(cache_key, candidates)
+
+@traced('resolve')
 def search_hubspot_by_name(first_name, last_name):
     """
-    Search HubSpot contacts by first name and last name using API v3 and return a list of record IDs if found.
+    Search HubSpot contacts by first name and last name using API v3, following the result pages
+    (at most NAME_SEARCH_MAX_PAGES of 100). Returns a dict mapping contact ID to its name-matching properties.
+    Results are kept in the search cache for the rest of the run.
     Requires HUBSPOT_API_KEY environment variable to be set.
     """
+    cache_key = name_search_key(first_name, last_name)
+    cached = cached_name_candidates(cache_key)
+    if cached is not None:
+        return cached
     api_key = get_api_key()
     if not api_key:
-        return []
+        return {}
     url = "https://api.hubapi.com/crm/v3/objects/contacts/search"
     headers = {
         "Content-Type": "application/json",
         "Authorization": f"Bearer {api_key}"
     }
-    payload = {
-        "filterGroups": [
-            {
-                "filters": [
-                    {
-                        "propertyName": "firstname",
-                        "operator": "EQ",
-                        "value": first_name
-                    },
-                    {
-                        "propertyName": "lastname",
-                        "operator": "EQ",
-                        "value": last_name
-                    }
-                ]
-            }
-        ],
-        "properties": ["firstname", "lastname"]
+    candidates = {}
+    after = None
+    try:
+        for page in range(NAME_SEARCH_MAX_PAGES):
+            response = hubspot_request('POST', url, headers=headers, json=build_name_search_payload(first_name, last_name, after))
+            response.raise_for_status()
+            data = response.json()
+            for r in data.get('results', []):
+                if r.get('id'):
+                    candidates[r['id']] = r.get('properties') or {}
+            after = ((data.get('paging') or {}).get('next') or {}).get('after')
+            if not after:
+                break
+        else:
+            print(f"More than {len(candidates)} contacts are named {first_name} {last_name}; ranking the newest {len(candidates)}.")
+    except Exception as e:
+        print(f"HubSpot API error: {e}")
+        store_name_candidates(cache_key, candidates, complete=False)
+        return candidates
+    store_name_candidates(cache_key, candidates)
+    return candidates
+
+def get_record_linkedin_keys(record):
+    """
+    Return every canonical LinkedIn key of a CSV record (user ID, hash IDs, public IDs and profile URL).
+    """
+    return {canonicalize_linkedin_id(record.get(f)) for f in ('id', 'hash_id', 'public_id', 'public_id_2', 'profile_url')} - {None}
+
+def score_name_candidate(properties, record_emails, record_linkedin_keys, org_names):
+    """
+    Score the evidence that a same-name contact is the record's person: a shared email, LinkedIn profile
+    or company (NAME_MATCH_SCORES). Returns None if the contact belongs to a different LinkedIn profile.
+    """
+    score = 0
+    contact_linkedin_keys = {canonicalize_linkedin_id(properties.get(LINKEDIN_KEY_PROPERTY)),
+                             canonicalize_linkedin_id(properties.get('linkedin_url'))} - {None}
+    if contact_linkedin_keys and record_linkedin_keys:
+        if not contact_linkedin_keys & record_linkedin_keys:
+            return None
+        score += NAME_MATCH_SCORES['linkedin']
+    contact_emails = [properties.get('email') or ''] + (properties.get('hs_additional_emails') or '').split(';')
+    if {normalize_search_email(e) for e in contact_emails if e.strip()} & record_emails:
+        score += NAME_MATCH_SCORES['email']
+    company = (properties.get('company') or '').strip().lower()
+    if company and company in org_names:
+        score += NAME_MATCH_SCORES['company']
+    return score
+
+def rank_name_candidates(candidates, record, email_addresses):
+    """
+    Rank name search candidates on their properties without further API calls.
+    Returns (best_id, unconfirmed_ids): best_id is the highest-scoring candidate with any evidence (highest
+    ID on ties) or None; otherwise unconfirmed_ids lists the candidates not ruled out, highest ID first.
+    """
+    record_emails = {normalize_search_email(e) for e in email_addresses if e.strip()}
+    record_linkedin_keys = get_record_linkedin_keys(record)
+    org_names = get_record_organization_names(record)
+    scored = []
+    for contact_id, properties in candidates.items():
+        score = score_name_candidate(properties, record_emails, record_linkedin_keys, org_names)
+        if score is not None:
+            scored.append((score, int(contact_id), contact_id))
+    scored.sort(reverse=True)
+    if scored and scored[0][0] > 0:
+        return scored[0][2], []
+    return None, [contact_id for _, _, contact_id in scored]
+
+def match_name_candidates(candidates, record, email_addresses):
+    """
+    Pick the contact a record's name match refers to: the best locally ranked candidate, else the only
+    candidate not ruled out, else the newest of up to NAME_CORROBORATION_LIMIT candidates sharing a company
+    association with the record. Returns the contact ID, or None if no candidate is a safe match.
+    """
+    best_id, unconfirmed_ids = rank_name_candidates(candidates, record, email_addresses)
+    if best_id:
+        print(f"Contact {best_id} shares an email, LinkedIn profile or company with the record. Keeping it.")
+        return best_id
+    if not unconfirmed_ids:
+        print("Every name match belongs to a different LinkedIn profile.")
+        return None
+    if len(unconfirmed_ids) == 1:
+        print(f"Keeping the only remaining name match {unconfirmed_ids[0]}.")
+        return unconfirmed_ids[0]
+    org_names = get_record_organization_names(record)
+    if org_names:
+        checked = unconfirmed_ids[:NAME_CORROBORATION_LIMIT]
+        print(f"Corroborating {len(checked)} of {len(unconfirmed_ids)} name match(es) with organization names: {', '.join(org_names)}")
+        for contact_id in checked:
+            company_names = get_company_names_for_contact(contact_id)
+            if company_names & org_names:
+                print(f"Contact {contact_id} is associated with company name(s): {', '.join(company_names & org_names)}")
+                return contact_id
+    print(f"None of the {len(unconfirmed_ids)} name matches can be confirmed; treating the record as a new contact.")
+    return None
+    # imports are now at the top of the file
+
+
+# --- Compact CSV records ----------------------------------------------------
+# A LinkedHelper export has ~100 columns; a csv.DictReader row keeps all of them in its own dict.
+# CompactRecord stores only the columns the mapping plan needs in a tuple, shares one RecordHeader
+# (column -> position) across all rows and interns values that repeat across rows.
+
+# Columns read by the custom logic in get_hubspot_update_properties and the identity lookups
+RECORD_CUSTOM_COLUMNS = (
+    'id', 'id_type', 'hash_id', 'public_id', 'public_id_2', 'profile_url', 'first_name', 'last_name',
+    'firstname', 'lastname', 'phone_1', 'phone_type_1', 'education_degree_1', 'education_fos_1',
+    'location_name', 'email', 'third_party_email_1', 'third_party_email_2', 'third_party_email_3',
+) + tuple(f'organization_{i}' for i in range(1, 11))
+
+# Columns whose values repeat across many rows (companies, locations, badges, enumerations)
+INTERNED_COLUMN_PATTERN = re.compile(
+    r"^(current_company|organization_\d+|organization_location_\d+|location_name|industry|id_type|"
+    r"phone_type_\d+|language_\d+|member_distance|badges_.*|education_\d+|tags)$"
+)
+
+def build_record_columns(fieldnames):
+    """
+    Return the header columns a CompactRecord must keep: mapped fields, custom-logic fields and
+    the email column plan, in header order.
+    """
+    needed = set(DIRECT_FIELDS) | set(CSV_TO_HUBSPOT_MAP) | set(RECORD_CUSTOM_COLUMNS)
+    needed |= set(build_email_column_plan(tuple(fieldnames)))
+    return tuple(name for name in fieldnames if name in needed)
+
+class RecordHeader:
+    """
+    Column layout shared by every CompactRecord read from one CSV header.
+    """
+    __slots__ = ('columns', 'index', 'positions', 'interned')
+
+    def __init__(self, fieldnames):
+        # Positions come from the unfiltered header so columns after an empty header cell still line up;
+        # for a repeated column name the last one wins, as in csv.DictReader
+        source = {name: i for i, name in enumerate(fieldnames) if name}
+        self.columns = build_record_columns(list(source))
+        self.index = {name: i for i, name in enumerate(self.columns)}
+        # Position of each kept column in the raw CSV row
+        self.positions = tuple(source[name] for name in self.columns)
+        self.interned = frozenset(i for i, name in enumerate(self.columns) if INTERNED_COLUMN_PATTERN.match(name))
+
+    def make_record(self, row):
+        """
+        Build a CompactRecord from a raw csv.reader row. Missing trailing cells become None,
+        like csv.DictReader's restval.
+        """
+        row_len = len(row)
+        values = []
+        for i, pos in enumerate(self.positions):
+            value = row[pos] if pos < row_len else None
+            if value and i in self.interned:
+                value = sys.intern(value)
+            values.append(value)
+        return CompactRecord(self, tuple(values))
+
+class CompactRecord(collections.abc.Mapping):
+    """
+    Read-only, dict-like CSV record backed by a tuple of values and a shared RecordHeader.
+    Supports get(), [], in, keys() and items(), so it can be used wherever a DictReader row was.
+    """
+    __slots__ = ('header', 'values')
+
+    def __init__(self, header, values):
+        self.header = header
+        self.values = values
+
+    def __getitem__(self, key):
+        return self.values[self.header.index[key]]
+
+    def get(self, key, default=None):
+        i = self.header.index.get(key)
+        if i is None:
+            return default
+        value = self.values[i]
+        return default if value is None else value
+
+    def __contains__(self, key):
+        return key in self.header.index
+
+    def __iter__(self):
+        return iter(self.header.columns)
+
+    def __len__(self):
+        return len(self.header.columns)
+
+    def keys(self):
+        return self.header.columns
+
+    def __repr__(self):
+        return f"CompactRecord({dict(self.items())!r})"
+
+GZIP_MAGIC = b'\x1f\x8b'
+ZSTD_MAGIC = b'\x28\xb5\x2f\xfd'
+
+def open_csv_input(path):
+    """
+    Open a CSV export for reading as text. .csv.gz and .csv.zst exports (recognized by extension or by
+    their magic bytes) are decompressed while they are read, without a temporary file.
+    """
+    with open(path, 'rb') as f:
+        magic = f.read(4)
+    name = path.lower()
+    if name.endswith('.gz') or magic.startswith(GZIP_MAGIC):
+        return gzip.open(path, 'rt', newline='', encoding='utf-8')
+    if name.endswith('.zst') or magic == ZSTD_MAGIC:
+        if zstandard is None:
+            raise RuntimeError("Reading .zst exports requires the zstandard package (pip install zstandard).")
+        reader = zstandard.ZstdDecompressor().stream_reader(open(path, 'rb'), closefd=True)
+        return io.TextIOWrapper(reader, encoding='utf-8', newline='')
+    return open(path, newline='', encoding='utf-8')
+
+def read_compact_records(f):
+    """
+    Read an open CSV file into a list of CompactRecord rows sharing one header.
+    """
+    reader = csv.reader(f)
+    fieldnames = next(reader, None)
+    if not fieldnames:
+        return []
+    header = RecordHeader(fieldnames)
+    return [header.make_record(row) for row in reader if row]
+
+# --- Multi-file input -----------------------------------------------------------
+# csv_file may name several exports (comma-separated paths and/or glob patterns). They are read as one
+# input, oldest file first, and rows for the same person are collapsed to the freshest one before any
+# HubSpot work, so API calls scale with unique people rather than total rows. A path that itself contains
+# a comma can only be given on its own (or matched by a glob pattern).
+
+def expand_csv_inputs(csv_spec):
+    """
+    Return the export paths named by csv_spec (comma-separated paths or glob patterns), oldest first by
+    modification time. Raises FileNotFoundError if a path or pattern matches nothing.
+    """
+    if os.path.isfile(csv_spec):
+        return [csv_spec]  # one existing file, even if its name contains a comma
+    paths = []
+    for part in (p.strip() for p in csv_spec.split(',')):
+        if not part:
+            continue
+        matches = sorted(glob.glob(part)) if glob.has_magic(part) else [part]
+        if not matches or not os.path.exists(matches[0]):
+            raise FileNotFoundError(part)
+        paths.extend(m for m in matches if m not in paths)
+    return sorted(paths, key=lambda p: (os.path.getmtime(p), p))
+
+def snapshot_export_files(paths):
+    """
+    Return the absolute path, modification time and size of each export, in order. Checkpoints store
+    this so a resume reads exactly the same rows.
+    """
+    files = []
+    for path in paths:
+        stat = os.stat(path)
+        files.append({'path': os.path.abspath(path), 'mtime_ns': stat.st_mtime_ns, 'size': stat.st_size})
+    return files
+
+def check_export_files(files):
+    """
+    Return the paths of a checkpoint's export snapshot, in their original order.
+    Raises RuntimeError if a file is missing or has changed, since record numbers would then point at
+    different people.
+    """
+    for entry in files:
+        try:
+            stat = os.stat(entry['path'])
+        except OSError:
+            raise RuntimeError(f"{entry['path']} no longer exists")
+        if (stat.st_mtime_ns, stat.st_size) != (entry['mtime_ns'], entry['size']):
+            raise RuntimeError(f"{entry['path']} has changed since the checkpoint was written")
+    return [entry['path'] for entry in files]
+
+def dedupe_identity_keys(record):
+    """
+    Keys that identify the same person across exports: canonical LinkedIn keys and the primary email,
+    or the name for rows with neither. Third-party emails are not used; they are often shared.
+    """
+    keys = set()
+    for field in ('id', 'hash_id', 'public_id_2'):
+        linkedin_key = canonicalize_linkedin_id(record.get(field))
+        if linkedin_key:
+            keys.add(f"li:{linkedin_key}")
+    email = (record.get('email') or '').strip().lower()
+    if email:
+        keys.add(f"email:{email}")
+    if not keys:
+        keys.add(record_identity_key(record))
+    return keys
+
+def dedupe_records(records):
+    """
+    Collapse rows that share an identity key, keeping the last (freshest) row of each person in the
+    position of the person's first row. Returns the list of unique records.
+    """
+    slots = []       # one record per person, or None once merged into another slot
+    key_slot = {}    # identity key -> slot index
+    slot_keys = []   # slot index -> identity keys pointing at it
+    for record in records:
+        keys = dedupe_identity_keys(record)
+        matched = sorted({key_slot[k] for k in keys if k in key_slot})
+        if matched:
+            slot = matched[0]
+            for other in matched[1:]:
+                # This row links two people seen separately so far (e.g. public ID in one file, hash ID in another)
+                slots[other] = None
+                for k in slot_keys[other]:
+                    key_slot[k] = slot
+                slot_keys[slot] |= slot_keys[other]
+                slot_keys[other] = set()
+            slots[slot] = record
+        else:
+            slot = len(slots)
+            slots.append(record)
+            slot_keys.append(set())
+        for k in keys:
+            key_slot[k] = slot
+        slot_keys[slot] |= keys
+    return [r for r in slots if r is not None]
+
+@traced('parse')
+def load_export_records(paths):
+    """
+    Read the exports at paths (see expand_csv_inputs). A single file is returned row for row; several
+    files are merged in the given order and deduplicated across files (see dedupe_records).
+    """
+    if len(paths) == 1:
+        with open_csv_input(paths[0]) as f:
+            return read_compact_records(f)
+    rows = []
+    for path in paths:
+        with open_csv_input(path) as f:
+            file_rows = read_compact_records(f)
+        print(f"Read {len(file_rows)} row(s) from {path}.")
+        rows.extend(file_rows)
+    records = dedupe_records(rows)
+    print(f"Read {len(paths)} file(s): {len(rows)} row(s), {len(records)} unique people "
+          f"({len(rows) - len(records)} older duplicate row(s) dropped).")
+    return records
+
+# --- Columnar pre-pass --------------------------------------------------------
+# --columnar derives location, education, website, language, badge and email fields for every row
+# in one pass per column before any network work starts. Each distinct value is transformed once and
+# values without an '@' are masked out in bulk (vectorized with pyarrow when it is installed).
+
+def _record_column(records, column):
+    """
+    Return one column of the records as a list (None where the column is missing).
+    """
+    if records and isinstance(records[0], CompactRecord):
+        header = records[0].header
+        # Rows merged from several exports have different headers; fall back to per-row lookups then
+        if all(r.header is header for r in records):
+            i = header.index.get(column)
+            if i is None:
+                return [None] * len(records)
+            return [r.values[i] for r in records]
+    return [r.get(column) for r in records]
+
+def _map_distinct(values, func):
+    """
+    Apply func once per distinct non-None value and return the per-row results (None for None).
+    """
+    if pyarrow is not None:
+        encoded = pyarrow.array(values, type=pyarrow.string()).dictionary_encode()
+        mapped = [func(v) for v in encoded.dictionary.to_pylist()]
+        return [None if i is None else mapped[i] for i in encoded.indices.to_pylist()]
+    cache = {}
+    results = []
+    for v in values:
+        if v is None:
+            results.append(None)
+        elif v in cache:
+            results.append(cache[v])
+        else:
+            results.append(cache.setdefault(v, func(v)))
+    return results
+
+def _contains_at_mask(values):
+    """
+    Return a per-row list of booleans: True where the value contains an '@'.
+    """
+    if pyarrow is not None:
+        mask = pyarrow.compute.match_substring(pyarrow.array(values, type=pyarrow.string()), '@')
+        return mask.fill_null(False).to_pylist()
+    return [bool(v) and '@' in v for v in values]
+
+class DerivedColumns:
+    """
+    Output of prepare_derived_columns: one list per derived field, aligned with the records.
+    row(i) returns the dict get_hubspot_update_properties and process_record accept as 'derived'.
+    """
+    def __init__(self, columns, size):
+        self.columns = columns
+        self.size = size
+
+    def row(self, i):
+        return {name: values[i] for name, values in self.columns.items()}
+
+@traced('parse')
+def prepare_derived_columns(records):
+    """
+    Compute the derived fields for all records column by column: location (city, state, country),
+    education_description_1, organization_website_1, hs_language, the badge booleans and the
+    extracted email addresses. Returns a DerivedColumns.
+    """
+    size = len(records)
+    columns = {}
+
+    locations = _map_distinct(_record_column(records, 'location_name'), lambda v: resolve_location(v) if v else None)
+    columns['location'] = [loc or (None, None, None) for loc in locations]
+
+    # Degree + field of study pairs repeat too; memoize on the pair
+    pairs = {}
+    columns['education_description_1'] = [
+        pairs[p] if p in pairs else pairs.setdefault(p, build_education_description(*p))
+        for p in zip(_record_column(records, 'education_degree_1'), _record_column(records, 'education_fos_1'))
+    ]
+
+    for csv_key, hub_key in CSV_TO_HUBSPOT_MAP.items():
+        if csv_key == 'organization_website_1':
+            columns[hub_key] = _map_distinct(_record_column(records, csv_key), normalize_organization_website)
+        elif hub_key == 'hs_language':
+            columns[hub_key] = _map_distinct(_record_column(records, csv_key), get_language_code)
+        elif hub_key in BADGE_KEYS:
+            columns[hub_key] = _map_distinct(_record_column(records, csv_key), normalize_badge_value)
+
+    email_sets = [None] * size
+    for column in _records_email_column_plan(records):
+        values = _record_column(records, column)
+        for i, has_at in enumerate(_contains_at_mask(values)):
+            if has_at:
+                if email_sets[i] is None:
+                    email_sets[i] = set()
+                email_sets[i].update(EMAIL_REGEX.findall(values[i]))
+    columns['emails'] = [[e for e in found if e[-1] in EMAIL_VALID_LAST_CHARS] if found else [] for found in email_sets]
+    return DerivedColumns(columns, size)
+
+def _records_email_column_plan(records):
+    """
+    Return the email column plan over every distinct header among records: rows merged from several
+    exports can have different columns, and each row's emails must come from all of its own.
+    """
+    headers = set()
+    plan = {}
+    for r in records:
+        header = r.header if isinstance(r, CompactRecord) else tuple(r.keys())
+        if header not in headers:
+            headers.add(header)
+            plan.update(dict.fromkeys(build_email_column_plan(tuple(r.keys()))))
+    return tuple(plan)
+
+def get_record_organization_names(record):
+    """
+    Return the set of lowercased organization names (organization_1..organization_10) in a CSV record.
+    """
+    org_names = set()
+    for i in range(1, 11):
+        org = record.get(f'organization_{i}')
+        if org:
+            org_names.add(org.strip().lower())
+    return org_names
+
+def merge_emails_into_properties(update_properties, email_addresses):
+    """
+    Combine the extracted email addresses with any already in update_properties['email'] (in place).
+    """
+    if not email_addresses:
+        return
+    # Combine all unique emails from extracted and any already in update_properties
+    existing_emails = []
+    if 'email' in update_properties and update_properties['email']:
+        existing_emails = [e.strip() for e in update_properties['email'].split(',') if e.strip()]
+    all_emails = set(existing_emails) | set(email_addresses)
+    # Only keep emails ending with a letter (not '.', ' ', or other special char)
+    valid_emails = [e for e in all_emails if is_valid_email(e)]
+    update_properties['email'] = ','.join(sorted(valid_emails))
+
+@traced('resolve')
+def find_hubspot_ids_for_record(record, email_addresses):
+    """
+    Search HubSpot for every contact matching the record: by email, LinkedIn user ID, hash ID and
+    public ID, and by name (one ranked candidate, see match_name_candidates) only if nothing else matched.
+    Returns a set of HubSpot record IDs.
+    """
+    all_hubspot_ids = set()
+    if _known_filter is not None and _known_filter.definitely_new(record, email_addresses):
+        print("None of the record's emails, LinkedIn IDs or name exist in HubSpot (known-contacts filter). Skipping searches.")
+        return all_hubspot_ids
+    if not email_addresses:
+        print("No email addresses found in the record.")
+    else:
+        for email in email_addresses:
+            email_ids = search_hubspot_by_email(email)
+            if email_ids:
+                print(f"Found HubSpot record ID(s): {', '.join(email_ids)} for email: {email}")
+                all_hubspot_ids.update(email_ids)
+            else:
+                print(f"No matching HubSpot record found for email: {email}")
+
+    # LinkedIn ID
+    linkedin_id = record.get('id')
+    if linkedin_id:
+        print(f"Searching by LinkedIn User Id: {linkedin_id}")
+        linkedin_ids = search_hubspot_by_linkedin_id(linkedin_id)
+        if linkedin_ids:
+            print(f"Found HubSpot record ID(s): {', '.join(linkedin_ids)} for LinkedIn User Id: {linkedin_id}")
+            all_hubspot_ids.update(linkedin_ids)
+        else:
+            print(f"No matching HubSpot record found for LinkedIn User Id: {linkedin_id}")
+        searched_keys = {canonicalize_linkedin_id(linkedin_id)}
+        # Try with hash_id if available
+        hash_id = record.get('hash_id')
+        if hash_id and canonicalize_linkedin_id(hash_id) in searched_keys:
+            print(f"hash_id {hash_id} is the same LinkedIn ID already searched. Skipping.")
+        elif hash_id:
+            searched_keys.add(canonicalize_linkedin_id(hash_id))
+            print(f"Trying with hash_id: {hash_id}")
+            hash_ids = search_hubspot_by_linkedin_id(hash_id)
+            if hash_ids:
+                print(f"Found HubSpot record ID(s): {', '.join(hash_ids)} for hash_id: {hash_id}")
+                all_hubspot_ids.update(hash_ids)
+            else:
+                print(f"No matching HubSpot record found for hash_id: {hash_id}")
+        else:
+            print("No hash_id field found in the record.")
+        # Try with public_id_2 if still not found
+        public_id_2 = record.get('public_id_2')
+        if public_id_2 and canonicalize_linkedin_id(public_id_2) in searched_keys:
+            print(f"public_id_2 {public_id_2} is the same LinkedIn ID already searched. Skipping.")
+        elif public_id_2:
+            print(f"Trying with public_id_2: {public_id_2}")
+            public_ids = search_hubspot_by_linkedin_id(public_id_2)
+            if public_ids:
+                print(f"Found HubSpot record ID(s): {', '.join(public_ids)} for public_id_2: {public_id_2}")
+                all_hubspot_ids.update(public_ids)
+            else:
+                print(f"No matching HubSpot record found for public_id_2: {public_id_2}")
+        else:
+            print("No public_id_2 field found in the record.")
+    else:
+        print("No LinkedIn User Id ('id' field) found in the record.")
+
+    # Only search by name if no matches found yet
+    if not all_hubspot_ids:
+        first_name = record.get('first_name') or record.get('firstname')
+        last_name = record.get('last_name') or record.get('lastname')
+        if first_name and last_name:
+            print(f"Trying with first name and last name: {first_name} {last_name}")
+            candidates = search_hubspot_by_name(first_name, last_name)
+            if candidates:
+                print(f"Found {len(candidates)} HubSpot record(s) for name {first_name} {last_name}: {', '.join(candidates)}")
+                contact_id = match_name_candidates(candidates, record, email_addresses)
+                if contact_id:
+                    all_hubspot_ids.add(contact_id)
+            else:
+                print(f"No matching HubSpot record found for name: {first_name} {last_name}")
+        else:
+            print("No first name and/or last name found in the record.")
+    return all_hubspot_ids
+
+@traced('merge')
+def merge_duplicate_contacts(all_hubspot_ids):
+    """
+    Merge a list of duplicate HubSpot contact IDs (sorted ascending) into the highest one.
+    Returns the ID of the remaining primary contact.
+    """
+    print(f"Merging {len(all_hubspot_ids)} duplicate HubSpot contacts: {', '.join(all_hubspot_ids)}")
+    # Always keep the highest ID as primary, but update to the new ID returned by merge
+    primary_id = all_hubspot_ids[-1]
+    for merge_id in reversed(all_hubspot_ids[:-1]):
+        print(f"Merging duplicate contacts: {merge_id} into {primary_id}")
+        merge_result = merge_hubspot_contacts(merge_id, primary_id)
+        if merge_result is not None:
+            # HubSpot may return a new ID for the merged contact
+            new_id = merge_result.get('id') or merge_result.get('primaryObjectId') or primary_id
+            print(f"New primary ID after merge: {new_id}")
+            _search_cache.contact_merged(merge_id, new_id)
+            _search_cache.contact_merged(primary_id, new_id)
+            primary_id = str(new_id)
+        else:
+            print(f"Failed to merge contacts {merge_id} and {primary_id}. Stopping merge attempts.")
+            break
+    print(f"Final remaining HubSpot record ID after merge: {primary_id}")
+    return primary_id
+
+@traced('record', 'record', span_args=lambda record, record_number, *a, **k: {'record_number': record_number})
+def process_record(record, record_number, derived=None):
+    """
+    Synchronize a single CSV record into HubSpot: find matching contacts, merge duplicates,
+    create the contact if none exists, then update changed properties.
+    derived: optional precomputed fields for the record (see prepare_derived_columns).
+    Returns (True, contact_id) on success or (False, reason) on a failure that should stop the batch.
+    """
+    print(f"\nProcessing record number {record_number}...")
+
+    # Extract all email addresses from the record
+    email_addresses = derived['emails'] if derived else extract_emails_from_record(record)
+    all_hubspot_ids = find_hubspot_ids_for_record(record, email_addresses)
+
+    # Merge all found IDs if more than one
+    all_hubspot_ids = sorted(all_hubspot_ids, key=lambda x: int(x))
+    if len(all_hubspot_ids) > 1:
+        all_hubspot_ids = [merge_duplicate_contacts(all_hubspot_ids)]
+    elif len(all_hubspot_ids) == 1:
+        print(f"Single HubSpot record ID found: {all_hubspot_ids[0]}")
+    else:
+        print("No HubSpot record found for this contact. Creating a new contact.")
+        create_contact_id = create_hubspot_contact(record, derived)
+        if create_contact_id:
+            print(f"Created new HubSpot contact with ID: {create_contact_id}")
+            all_hubspot_ids = [str(create_contact_id)]
+        else:
+            print("Failed to create a new HubSpot contact.")
+            return False, "create failed"
+
+    # At this point, we have a unique HubSpot contact ID
+    unique_id = all_hubspot_ids[0]
+    remember_known_record(record, email_addresses)
+    hubspot_contact_json = get_hubspot_contact_by_id(unique_id)
+    if not hubspot_contact_json:
+        print(f"Could not fetch HubSpot contact with ID {unique_id}.")
+        return False, f"could not fetch contact {unique_id}"
+    update_properties = get_hubspot_update_properties(hubspot_contact_json, record, derived)
+    # Ensure email addresses found above are added to update_properties['email']
+    merge_emails_into_properties(update_properties, email_addresses)
+    if not update_properties:
+        print("No properties to update for this contact.")
+    else:
+        if DEBUG :
+            print(f"Updating HubSpot contact {unique_id} with the following properties:")
+            print("+------------------------------------------+------------------------------------------------+")
+            print("| Property                                 | Value                                          |")
+            print("+------------------------------------------+------------------------------------------------+")
+            for k, v in update_properties.items():
+                k_str = str(k)[:40].ljust(40)
+                v_str = str(v)[:44].ljust(44)
+                print(f"| {k_str} | {v_str}|")
+            print("+--------------------------------------------+------------------------------------------------+")
+        updated = update_hubspot_contact_by_id(unique_id, update_properties)
+        if updated is not None:
+            print(f"Successfully updated HubSpot contact {unique_id}.")
+        else:
+            print(f"Failed to update HubSpot contact {unique_id}.")
+            return False, f"update failed for contact {unique_id}"
+    return True, unique_id
+
+def record_identity_key(record):
+    """
+    Return a stable identity string for a record, used to keep the same person on the same worker.
+    Prefers the canonical LinkedIn key, then the primary email, then the lowest other email address,
+    then first and last name.
+    """
+    linkedin_key = get_record_linkedin_key(record)
+    if linkedin_key:
+        return f"li:{linkedin_key}"
+    email = (record.get('email') or '').strip().lower()
+    if email:
+        return f"email:{email}"
+    emails = sorted(e.lower() for e in extract_emails_from_record(record))
+    if emails:
+        return f"email:{emails[0]}"
+    first_name = (record.get('first_name') or record.get('firstname') or '').strip().lower()
+    last_name = (record.get('last_name') or record.get('lastname') or '').strip().lower()
+    return f"name:{first_name} {last_name}"
+
+def shard_records(numbered_records, num_shards, shard_by='identity'):
+    """
+    Split a list of (record_number, record) pairs into num_shards lists.
+    'range' gives each shard a contiguous block of records; 'identity' hashes record_identity_key
+    so every row for the same person lands in the same shard and merges never race.
+    """
+    shards = [[] for _ in range(num_shards)]
+    if shard_by == 'range':
+        size = -(-len(numbered_records) // num_shards)  # ceiling division
+        for i, item in enumerate(numbered_records):
+            shards[i // size].append(item)
+    else:
+        for item in numbered_records:
+            key = record_identity_key(item[1]).encode('utf-8')
+            shards[zlib.crc32(key) % num_shards].append(item)
+    return [shard for shard in shards if shard]
+
+class QuotaManager(BaseManager):
+    """
+    Manager process that hosts the shared RateLimiter (quota coordinator) for sharded runs.
+    """
+
+QuotaManager.register('RateLimiter', RateLimiter)
+
+def _init_shard_worker(rate_limiter, known_filter_path=None, trace=False):
+    # Runs once in each worker process: route every HubSpot call through the coordinator's budget
+    set_rate_limiter(rate_limiter)
+    if known_filter_path:
+        try:
+            load_known_filter(known_filter_path)
+        except RuntimeError as e:
+            print(f"{e} This worker searches every record.")
+    if trace:
+        _tracer.enable()
+        _tracer.events.clear()  # a forked worker inherits the coordinator's events; it reports only its own
+        _tracer._lanes.clear()
+
+def _run_shard(shard):
+    """
+    Process one shard of (record_number, record) pairs in a worker process.
+    Unlike the single-process loop, a failed record does not stop the shard; every outcome is returned
+    to the coordinator as a (record_number, ok, reason) tuple, together with the known-contacts filter
+    keys the shard added and the shard's trace events.
+    """
+    results = []
+    for record_number, record in shard:
+        try:
+            ok, reason = process_record(record, record_number)
+        except Exception as e:
+            ok, reason = False, f"unexpected error: {e}"
+        results.append((record_number, ok, reason))
+    drain_secondary_emails()
+    report_run_metrics()
+    with _tracer._lock:
+        events, _tracer.events = _tracer.events, []
+        _tracer._lanes.clear()
+    return results, (_known_filter.added_keys if _known_filter is not None else []), events
+
+def run_sharded(numbered_records, processes, shard_by='identity', known_filter_path=None):
+    """
+    Run records across worker processes. The parent process acts as the coordinator: it hosts the
+    shared rate-limit budget, collects per-record results and logs failures.
+    Returns the list of (record_number, reason) failures.
+    """
+    shards = shard_records(numbered_records, processes, shard_by)
+    print(f"Sharding {len(numbered_records)} records by {shard_by} into {len(shards)} worker process(es).")
+    failures = []
+    processed = 0
+    with QuotaManager() as manager:
+        rate_limiter = manager.RateLimiter(HUBSPOT_RATE_LIMIT_CALLS, HUBSPOT_RATE_LIMIT_PERIOD)
+        with ProcessPoolExecutor(max_workers=len(shards), initializer=_init_shard_worker,
+                                 initargs=(rate_limiter, known_filter_path, _tracer.enabled)) as executor:
+            futures = [executor.submit(_run_shard, shard) for shard in shards]
+            for future in as_completed(futures):
+                try:
+                    results, added_keys, events = future.result()
+                except Exception as e:
+                    print(f"Worker process failed: {e}")
+                    continue
+                with _tracer._lock:
+                    _tracer.events.extend(events)
+                if _known_filter is not None:
+                    for key in added_keys:
+                        _known_filter.add(key)
+                for record_number, ok, reason in results:
+                    processed += 1
+                    if not ok:
+                        failures.append((record_number, reason))
+                        log_failed_record_id(f"record {record_number}", reason=reason)
+    print(f"\nSharded run complete: {processed} record(s) processed, {len(failures)} failure(s).")
+    for record_number, reason in sorted(failures):
+        print(f"  Record {record_number}: {reason}")
+    return failures
+
+
+# --- Staged pipeline --------------------------------------------------------
+# --pipeline splits the per-record work into stages joined by bounded queues. Each stage has its own
+# worker threads and batch size, and a full queue blocks the stage feeding it (backpressure), so the
+# batch read/write stages can fill 100-item batches while resolution continues upstream.
+
+PIPELINE_STAGES = ('parse', 'identities', 'resolve', 'merge', 'fetch', 'diff', 'write', 'secondary_emails')
+
+DEFAULT_PIPELINE_CONFIG = {
+    'parse': {'workers': 1, 'batch_size': 1},
+    'identities': {'workers': 1, 'batch_size': 1},
+    'resolve': {'workers': 8, 'batch_size': 1},
+    'merge': {'workers': 1, 'batch_size': 1},  # merges and creates must stay serialized
+    'fetch': {'workers': 2, 'batch_size': 100},
+    'diff': {'workers': 1, 'batch_size': 1},
+    'write': {'workers': 2, 'batch_size': 100},
+    'secondary_emails': {'workers': 1, 'batch_size': 1},  # only queues work for the secondary email writer
+}
+DEFAULT_PIPELINE_QUEUE_SIZE = 1000
+PIPELINE_BATCH_LINGER = 0.5  # seconds a batching stage waits to fill a batch before sending it
+
+# Every HubSpot property get_hubspot_update_properties compares against
+HUBSPOT_READ_PROPERTIES = sorted(
+    set(DIRECT_FIELDS) | set(CSV_TO_HUBSPOT_MAP.values()) | {
+        'phone', 'home_phone', 'mobilephone', 'education_description_1', 'city', 'state', 'country',
+        'linkedin_user_id', 'email', 'linkedin_url', 'hs_additional_emails', LINKEDIN_KEY_PROPERTY
+    }
+)
+
+_PIPELINE_STOP = object()
+
+def parse_stage_config(values):
+    """
+    Parse --stage NAME=WORKERS[:BATCH] options into a pipeline config based on DEFAULT_PIPELINE_CONFIG.
+    Raises ValueError on an unknown stage or a malformed value.
+    """
+    config = {name: dict(cfg) for name, cfg in DEFAULT_PIPELINE_CONFIG.items()}
+    for value in values or []:
+        name, _, spec = value.partition('=')
+        name = name.strip().replace('-', '_')
+        if name not in config or not spec:
+            raise ValueError(f"Invalid --stage value '{value}'. Expected NAME=WORKERS[:BATCH] with NAME in {', '.join(PIPELINE_STAGES)}.")
+        workers, _, batch_size = spec.partition(':')
+        config[name]['workers'] = max(1, int(workers))
+        if batch_size:
+            config[name]['batch_size'] = max(1, int(batch_size))
+    # Creation and merging rely on seeing records one at a time
+    config['merge']['workers'] = 1
+    return config
+
+class RecordPipeline:
+    """
+    Runs records through PIPELINE_STAGES. Each work item is a dict that stages enrich in turn:
+    record_number, record, derived, email_addresses, hubspot_ids, contact_id, hubspot_json,
+    update_properties, secondary_emails and known_emails. Failed items are recorded and dropped.
+    """
+    def __init__(self, config=None, queue_size=DEFAULT_PIPELINE_QUEUE_SIZE):
+        self.config = config or parse_stage_config(None)
+        self.queue_size = queue_size
+        self.failures = []
+        self.completed = 0
+        self._lock = threading.Lock()
+        self._merged_into = {}   # merged-away contact ID -> surviving primary ID
+        self._identity_ids = {}  # identity key (email or LinkedIn ID) -> contact ID resolved or created this run
+
+    def fail(self, item, reason):
+        print(f"Record {item['record_number']} failed: {reason}")
+        with self._lock:
+            self.failures.append((item['record_number'], reason))
+        log_failed_record_id(f"record {item['record_number']}", reason=reason)
+
+    # Stage functions take a batch of items and return the items to pass downstream
+
+    def stage_parse(self, batch):
+        # Entries are (record_number, record) or (record_number, record, derived) from --columnar
+        return [{'record_number': entry[0], 'record': entry[1], 'derived': entry[2] if len(entry) > 2 else None}
+                for entry in batch]
+
+    def stage_identities(self, batch):
+        for item in batch:
+            if item['derived']:
+                item['email_addresses'] = item['derived']['emails']
+            else:
+                item['email_addresses'] = extract_emails_from_record(item['record'])
+        return batch
+
+    def stage_resolve(self, batch):
+        for item in batch:
+            item['hubspot_ids'] = find_hubspot_ids_for_record(item['record'], item['email_addresses'])
+        return batch
+
+    def _identity_keys(self, item):
+        return get_record_identity_keys(item['record'], item['email_addresses'])
+
+    def stage_merge(self, batch):
+        out = []
+        for item in batch:
+            keys = self._identity_keys(item)
+            ids = {self._merged_into.get(i, i) for i in item['hubspot_ids']}
+            # Records resolved in parallel may not see a contact created or merged earlier in this run
+            ids.update(self._identity_ids[k] for k in keys if k in self._identity_ids)
+            ids = sorted(ids, key=lambda x: int(x))
+            if len(ids) > 1:
+                contact_id = merge_duplicate_contacts(ids)
+                for merged_id in ids:
+                    if merged_id != contact_id:
+                        self._merged_into[merged_id] = contact_id
+            elif ids:
+                contact_id = ids[0]
+            else:
+                print(f"No HubSpot record found for record {item['record_number']}. Creating a new contact.")
+                contact_id = create_hubspot_contact(item['record'], item['derived'])
+                if not contact_id:
+                    self.fail(item, "create failed")
+                    continue
+                contact_id = str(contact_id)
+            for key in keys:
+                self._identity_ids[key] = contact_id
+            remember_known_record(item['record'], item['email_addresses'])
+            item['contact_id'] = contact_id
+            out.append(item)
+        return out
+
+    def stage_fetch(self, batch):
+        contacts = batch_read_hubspot_contacts({item['contact_id'] for item in batch}, HUBSPOT_READ_PROPERTIES)
+        out = []
+        for item in batch:
+            hubspot_json = contacts.get(item['contact_id'])
+            if not hubspot_json:
+                self.fail(item, f"could not fetch contact {item['contact_id']}")
+                continue
+            item['hubspot_json'] = hubspot_json
+            out.append(item)
+        return out
+
+    def stage_diff(self, batch):
+        for item in batch:
+            hubspot_json = item['hubspot_json']
+            update_properties = get_hubspot_update_properties(hubspot_json, item['record'], item['derived'])
+            merge_emails_into_properties(update_properties, item['email_addresses'])
+            secondary_emails = []
+            item['known_emails'] = None
+            email_list = [e.strip() for e in update_properties.get('email', '').split(',') if e.strip()]
+            if email_list:
+                # Batch update takes one primary email; the rest go to the secondary email stage
+                update_properties['email'] = email_list[0]
+                known = {e.strip().lower() for e in (hubspot_json.get('hs_additional_emails') or '').split(';') if e.strip()}
+                known.add((hubspot_json.get('email') or '').lower())
+                secondary_emails = [e for e in email_list[1:] if e.lower() not in known]
+                item['known_emails'] = known
+                if hubspot_json.get('email') == email_list[0]:
+                    del update_properties['email']
+            item['update_properties'] = update_properties
+            item['secondary_emails'] = secondary_emails
+        return batch
+
+    def stage_write(self, batch):
+        updates = {}
+        for item in batch:
+            if item['update_properties']:
+                updates.setdefault(item['contact_id'], {}).update(item['update_properties'])
+        updated = batch_update_hubspot_contacts(updates) if updates else set()
+        out = []
+        for item in batch:
+            if item['update_properties'] and item['contact_id'] not in updated:
+                self.fail(item, f"update failed for contact {item['contact_id']}")
+                continue
+            out.append(item)
+        return out
+
+    def stage_secondary_emails(self, batch):
+        writer = get_secondary_email_writer()
+        for item in batch:
+            if item['secondary_emails']:
+                # stage_diff already filtered against the emails HubSpot returned, so skip the profile lookup
+                writer.submit(item['contact_id'], item['secondary_emails'], known_emails=item['known_emails'])
+            with self._lock:
+                self.completed += 1
+        return []
+
+    def _stage_worker(self, func, in_q, out_q, batch_size, state):
+        profile = start_thread_profile()
+        stopping = False
+        while not stopping:
+            item = in_q.get()
+            if item is _PIPELINE_STOP:
+                in_q.put(_PIPELINE_STOP)  # let the other workers of this stage see it too
+                break
+            batch = [item]
+            deadline = time.monotonic() + PIPELINE_BATCH_LINGER
+            while len(batch) < batch_size:
+                try:
+                    item = in_q.get(timeout=max(0.0, deadline - time.monotonic()))
+                except queue.Empty:
+                    break
+                if item is _PIPELINE_STOP:
+                    in_q.put(_PIPELINE_STOP)
+                    stopping = True
+                    break
+                batch.append(item)
+            try:
+                with _tracer.span(func.__name__, 'stage', batch_size=len(batch),
+                                  records=[b['record_number'] if isinstance(b, dict) else b[0] for b in batch]):
+                    results = func(batch)
+            except Exception as e:
+                for failed in batch:
+                    self.fail(failed if isinstance(failed, dict) else {'record_number': failed[0]}, f"unexpected error: {e}")
+                continue
+            if out_q is not None:
+                for result in results:
+                    out_q.put(result)
+        stop_thread_profile(profile)
+        with self._lock:
+            state['running'] -= 1
+            last = state['running'] == 0
+        if last and out_q is not None:
+            out_q.put(_PIPELINE_STOP)
+
+    def run(self, numbered_records):
+        """
+        Feed (record_number, record) pairs through all stages and wait for them to drain.
+        Returns the list of (record_number, reason) failures.
+        """
+        queues = [queue.Queue(maxsize=self.queue_size) for _ in PIPELINE_STAGES]
+        threads = []
+        for i, name in enumerate(PIPELINE_STAGES):
+            cfg = self.config[name]
+            out_q = queues[i + 1] if i + 1 < len(queues) else None
+            state = {'running': cfg['workers']}
+            for n in range(cfg['workers']):
+                thread = threading.Thread(
+                    target=self._stage_worker,
+                    args=(getattr(self, f"stage_{name}"), queues[i], out_q, cfg['batch_size'], state),
+                    name=f"{name}-{n + 1}",
+                    daemon=True
+                )
+                thread.start()
+                threads.append(thread)
+        for numbered_record in numbered_records:
+            queues[0].put(numbered_record)  # blocks while the pipeline is saturated
+        queues[0].put(_PIPELINE_STOP)
+        for thread in threads:
+            thread.join()
+        drain_secondary_emails()
+        print(f"\nPipeline run complete: {self.completed} record(s) synchronized, {len(self.failures)} failure(s).")
+        for record_number, reason in sorted(self.failures):
+            print(f"  Record {record_number}: {reason}")
+        return self.failures
+
+
+# --- Watch / daemon mode ----------------------------------------------------
+# --watch DIR keeps one process running: new or appended LinkedHelper CSVs in DIR are streamed through
+# the sync as they arrive, while the HTTP session, the search cache and the lookup caches stay warm.
+
+DEFAULT_WATCH_INTERVAL = 5.0  # seconds between directory scans
+WATCH_STATE_FILENAME = '.read_record_watch_state.json'
+
+def _complete_csv_prefix(data):
+    """
+    Return the length of the longest prefix of data (bytes) that ends on a complete CSV record:
+    the last newline that is not inside a quoted field.
+    """
+    end = len(data)
+    while True:
+        end = data.rfind(b'\n', 0, end)
+        if end < 0:
+            return 0
+        if data.count(b'"', 0, end) % 2 == 0:
+            return end + 1
+
+class ExportWatcher:
+    """
+    Tracks how far each CSV in a directory has been read. poll() returns the records that appeared
+    since the previous call; offsets are persisted in WATCH_STATE_FILENAME so a restart resumes
+    where the last run stopped.
+    """
+    def __init__(self, directory, pattern='*.csv'):
+        self.directory = directory
+        self.pattern = pattern
+        self.state_path = os.path.join(directory, WATCH_STATE_FILENAME)
+        self.state = {}    # file name -> {'offset': bytes consumed, 'rows': records seen, 'inode': st_ino}
+        self.headers = {}  # file name -> RecordHeader
+        self.tails = {}    # file name -> (size, mtime) when an unterminated last row was seen
+        try:
+            with open(self.state_path, encoding='utf-8') as f:
+                self.state = json.load(f)
+        except (OSError, ValueError):
+            self.state = {}
+
+    def save(self):
+        try:
+            with open(self.state_path, 'w', encoding='utf-8') as f:
+                json.dump(self.state, f, indent=2)
+        except OSError as e:
+            print(f"Could not save watch state to {self.state_path}: {e}")
+
+    def _read_new_records(self, name, path, stat):
+        entry = self.state.get(name)
+        if entry is None or entry.get('inode') != stat.st_ino or stat.st_size < entry.get('offset', 0):
+            # New, replaced or truncated file: start over
+            entry = {'offset': 0, 'rows': 0, 'inode': stat.st_ino}
+            self.headers.pop(name, None)
+        if stat.st_size == entry['offset'] and name in self.headers:
+            self.state[name] = entry
+            return []
+        with open(path, 'rb') as f:
+            if name not in self.headers:
+                header_line = f.readline()
+                if not header_line.endswith(b'\n'):
+                    return []  # header still being written
+                self.headers[name] = RecordHeader(next(csv.reader([header_line.decode('utf-8-sig')])))
+                entry['offset'] = max(entry['offset'], len(header_line))
+            f.seek(entry['offset'])
+            data = f.read()
+        usable = _complete_csv_prefix(data)
+        tail = data[usable:]
+        if tail.strip() and _complete_csv_prefix(tail + b'\n') == len(tail) + 1:
+            # The last row has no newline yet. Once the file has stayed the same for a whole poll interval
+            # it is taken as finished, so an export without a trailing newline does not hold back its last row
+            signature = (stat.st_size, stat.st_mtime_ns)
+            if self.tails.get(name) == signature:
+                usable = len(data)
+                del self.tails[name]
+            else:
+                self.tails[name] = signature
+        else:
+            self.tails.pop(name, None)
+        if not usable:
+            self.state[name] = entry
+            return []
+        header = self.headers[name]
+        rows = [row for row in csv.reader(io.StringIO(data[:usable].decode('utf-8'), newline='')) if row]
+        first_number = entry['rows'] + 1
+        entry['offset'] += usable
+        entry['rows'] += len(rows)
+        self.state[name] = entry
+        return [(first_number + i, header.make_record(row)) for i, row in enumerate(rows)]
+
+    def poll(self):
+        """
+        Return a list of (file name, [(record_number, record), ...]) for files with new complete records.
+        """
+        batches = []
+        for path in sorted(glob.glob(os.path.join(self.directory, self.pattern))):
+            name = os.path.basename(path)
+            try:
+                stat = os.stat(path)
+                records = self._read_new_records(name, path, stat)
+            except (OSError, UnicodeDecodeError, csv.Error) as e:
+                print(f"Could not read {path}: {e}")
+                continue
+            if records:
+                batches.append((name, records))
+        return batches
+
+def run_watch(directory, args):
+    """
+    Watch directory for new or appended CSV exports and sync their records until interrupted.
+    Failed records are logged and do not stop the daemon.
+    """
+    if not os.path.isdir(directory):
+        print(f"Watch directory not found: {directory}")
+        sys.exit(1)
+    watcher = ExportWatcher(directory, args.watch_pattern)
+    print(f"Watching {directory} for {args.watch_pattern} every {args.watch_interval:g}s. Press Ctrl+C to stop.")
+    try:
+        while True:
+            for name, numbered_records in watcher.poll():
+                print(f"\n{name}: {len(numbered_records)} new record(s) (records {numbered_records[0][0]}-{numbered_records[-1][0]}).")
+                if args.pipeline:
+                    RecordPipeline(args.pipeline_config, args.queue_size).run(numbered_records)
+                else:
+                    for record_number, record in numbered_records:
+                        try:
+                            ok, reason = process_record(record, record_number)
+                        except Exception as e:
+                            ok, reason = False, f"unexpected error: {e}"
+                        if not ok:
+                            log_failed_record_id(f"{name} record {record_number}", reason=reason)
+                drain_secondary_emails()
+                watcher.save()
+                save_known_filter(args.known_filter)
+            # Contacts may be created elsewhere between scans; keep what was found, look up misses again
+            _search_cache.forget_misses()
+            time.sleep(args.watch_interval)
+    except KeyboardInterrupt:
+        print("\nStopping watch mode.")
+    finally:
+        drain_secondary_emails()
+        watcher.save()
+        save_known_filter(args.known_filter)
+        report_run_metrics()
+
+
+# --- Daily-quota-aware scheduling ---------------------------------------------
+# --schedule orders records by priority (new contacts, then changed ones, then merges, unchanged last)
+# using what earlier runs learned (SYNC_HISTORY_FILE), estimates the calls each record needs, paces the
+# run when the work would not fit in the remaining daily budget, and stops with a checkpoint before the cap.
+
+SYNC_HISTORY_FILE = '.read_record_sync_history.json'
+DEFAULT_CHECKPOINT_FILE = 'read_record_checkpoint.json'
+SCHEDULE_PRIORITIES = {'new': 0, 'changed': 1, 'merge': 2, 'unchanged': 3}
+
+def get_record_identity_keys(record, email_addresses=None):
+    """
+    Return every identity key of a record: lowercased emails and canonical LinkedIn keys.
+    """
+    if email_addresses is None:
+        email_addresses = extract_emails_from_record(record)
+    keys = {f"email:{e.lower()}" for e in email_addresses}
+    for field in ('id', 'hash_id', 'public_id_2'):
+        linkedin_key = canonicalize_linkedin_id(record.get(field))
+        if linkedin_key:
+            keys.add(f"li:{linkedin_key}")
+    return keys
+
+def record_fingerprint(record):
+    """
+    Return a short hash of the properties a record would write to an empty contact.
+    The raw mapped properties are hashed, so fingerprinting never logs invalid values.
+    """
+    properties = get_hubspot_update_properties({}, record, validate=False)
+    return hashlib.sha1(json.dumps(properties, sort_keys=True).encode('utf-8')).hexdigest()[:16]
+
+class SyncHistory:
+    """
+    Persistent map of identity key -> [contact ID, record fingerprint] from earlier successful syncs.
+    """
+    def __init__(self, path=SYNC_HISTORY_FILE):
+        self.path = path
+        self.entries = {}
+        try:
+            with open(path, encoding='utf-8') as f:
+                self.entries = json.load(f)
+        except (OSError, ValueError):
+            self.entries = {}
+
+    def classify(self, record, fingerprint=None):
+        """
+        Return (kind, estimated_calls) for a record; kind is one of SCHEDULE_PRIORITIES.
+        fingerprint: the record's record_fingerprint, if already computed.
+        """
+        email_addresses = extract_emails_from_record(record)
+        keys = get_record_identity_keys(record, email_addresses)
+        known = [self.entries[k] for k in keys if k in self.entries]
+        searches = len(keys) or 1
+        secondary = max(0, len(email_addresses) - 1)
+        email_writes = (1 + secondary) if secondary else 0  # profile lookup plus one call per secondary email
+        if not known:
+            # search cascade, name search, create, read, update
+            return 'new', searches + 1 + 3 + email_writes
+        contact_ids = {entry[0] for entry in known}
+        if len(contact_ids) > 1:
+            return 'merge', searches + (len(contact_ids) - 1) + 2 + email_writes
+        fingerprint = fingerprint or record_fingerprint(record)
+        if any(entry[1] != fingerprint for entry in known) or len(known) < len(keys):
+            return 'changed', searches + 2 + email_writes
+        return 'unchanged', searches + 2
+
+    def update(self, record, contact_id, fingerprint=None):
+        fingerprint = fingerprint or record_fingerprint(record)
+        for key in get_record_identity_keys(record):
+            self.entries[key] = [str(contact_id), fingerprint]
+
+    def save(self):
+        try:
+            with open(self.path, 'w', encoding='utf-8') as f:
+                json.dump(self.entries, f)
+        except OSError as e:
+            print(f"Could not save sync history to {self.path}: {e}")
+
+def write_checkpoint(path, export_files, pending_numbers):
+    """
+    Save the record numbers that still need processing so a later run can resume with --resume.
+    export_files is the snapshot_export_files of the inputs the record numbers refer to.
+    """
+    checkpoint = {
+        "files": export_files,
+        "created": datetime.datetime.now().isoformat(),
+        "pending": sorted(pending_numbers),
     }
+    with open(path, 'w', encoding='utf-8') as f:
+        json.dump(checkpoint, f, indent=2)
+    print(f"Checkpoint with {len(pending_numbers)} pending record(s) written to {path}.")
+    print(f"Resume with: python read_record.py --resume {path} --schedule")
+
+def run_scheduled(numbered_records, export_files, checkpoint_path=DEFAULT_CHECKPOINT_FILE, quota=None,
+                  reserve=HUBSPOT_DAILY_RESERVE):
+    """
+    Process records in priority order within the remaining daily API budget.
+    Records are paced evenly until the daily reset when the estimated calls exceed the budget,
+    and the run stops with a checkpoint once the next record would dip into the reserve.
+    Returns the list of (record_number, reason) failures.
+    """
+    quota = quota or _daily_quota
+    history = SyncHistory()
+    planned = []
+    for record_number, record in numbered_records:
+        fingerprint = record_fingerprint(record)
+        kind, estimate = history.classify(record, fingerprint)
+        planned.append((SCHEDULE_PRIORITIES[kind], record_number, record, kind, estimate, fingerprint))
+    planned.sort(key=lambda p: (p[0], p[1]))
+    total_estimate = sum(p[4] for p in planned)
+    available = quota.remaining() - reserve
+    counts = {kind: sum(1 for p in planned if p[3] == kind) for kind in SCHEDULE_PRIORITIES}
+    print(f"Scheduled {len(planned)} record(s): " + ", ".join(f"{n} {kind}" for kind, n in counts.items()))
+    print(f"Estimated API calls: {total_estimate}; remaining daily budget: {max(0, available)} (reserve {reserve}).")
+    pacing = total_estimate > available
+    if pacing:
+        print("Estimated calls exceed the remaining budget: pacing the run until the daily reset.")
+
+    failures = []
+    i = 0
+    try:
+        for i, (_, record_number, record, kind, estimate, fingerprint) in enumerate(planned):
+            available = quota.remaining() - reserve
+            if estimate > available:
+                print(f"\nDaily API budget nearly exhausted ({quota.remaining()} calls left). Stopping before record {record_number}.")
+                write_checkpoint(checkpoint_path, export_files, [p[1] for p in planned[i:]])
+                break
+            started = time.monotonic()
+            print(f"\n[{kind}] record {record_number}: ~{estimate} call(s)")
+            try:
+                ok, result = process_record(record, record_number)
+            except Exception as e:
+                ok, result = False, f"unexpected error: {e}"
+            if ok:
+                history.update(record, result, fingerprint)
+            else:
+                failures.append((record_number, result))
+                log_failed_record_id(f"record {record_number}", reason=result)
+            if pacing:
+                # Spread the remaining budget evenly over the time left until the daily reset
+                per_call = quota.seconds_until_reset() / max(1, quota.remaining() - reserve)
+                time.sleep(max(0.0, estimate * per_call - (time.monotonic() - started)))
+    except KeyboardInterrupt:
+        print("\nInterrupted.")
+        write_checkpoint(checkpoint_path, export_files, [p[1] for p in planned[i:]])
+        raise
+    finally:
+        drain_secondary_emails()
+        history.save()
+        quota.save()
+    print(f"\nScheduled run complete: {len(failures)} failure(s); {quota.remaining()} daily API call(s) left.")
+    return failures
+
+def parse_args(argv=None):
+    """
+    Parse command line arguments. The positional arguments keep the original
+    <csv_file> <record_number> [num_records] usage.
+    """
+    parser = argparse.ArgumentParser(
+        usage="python read_record.py (<csv_file> <record_number> [num_records] | --watch DIR) [--processes N] [--shard-by {range,identity}] [--async] [--concurrency N] [--pipeline] [--stage NAME=WORKERS[:BATCH]] [--columnar] [--schedule [--resume CHECKPOINT]] [--known-filter [PATH]] [--build-known-filter [PATH]] [--trace [PATH]] [--profile [PATH]]",
+        description="Synchronize LinkedHelper2 CSV records into HubSpot contacts."
+    )
+    parser.add_argument('csv_file', nargs='?',
+                        help="LinkedHelper2 CSV export file, or several as comma-separated paths and/or a quoted glob pattern")
+    parser.add_argument('record_number', type=int, nargs='?', help="Starting record number (1-based)")
+    parser.add_argument('num_records', type=int, nargs='?', help="Number of records to process (default: all)")
+    parser.add_argument('--processes', type=int, default=1,
+                        help="Number of worker processes sharing the HubSpot rate limit (default: 1)")
+    parser.add_argument('--shard-by', choices=['range', 'identity'], default='identity',
+                        help="How records are split across worker processes (default: identity)")
+    parser.add_argument('--pipeline', action='store_true',
+                        help="Run records through the staged pipeline with batched reads and writes")
+    parser.add_argument('--stage', action='append', metavar='NAME=WORKERS[:BATCH]',
+                        help=f"Set a pipeline stage's worker count and batch size; stages: {', '.join(PIPELINE_STAGES)}")
+    parser.add_argument('--queue-size', type=int, default=DEFAULT_PIPELINE_QUEUE_SIZE,
+                        help=f"Capacity of each queue between pipeline stages (default: {DEFAULT_PIPELINE_QUEUE_SIZE})")
+    parser.add_argument('--watch', metavar='DIR',
+                        help="Run as a daemon that syncs new or appended CSV exports in DIR")
+    parser.add_argument('--watch-pattern', default='*.csv',
+                        help="File name pattern to watch in --watch mode (default: *.csv)")
+    parser.add_argument('--watch-interval', type=float, default=DEFAULT_WATCH_INTERVAL,
+                        help=f"Seconds between directory scans in --watch mode (default: {DEFAULT_WATCH_INTERVAL:g})")
+    parser.add_argument('--columnar', action='store_true',
+                        help="Derive location, email, badge and other fields for all rows in one pre-pass (faster with pyarrow)")
+    parser.add_argument('--async', dest='use_async', action='store_true',
+                        help="Process records on one asyncio event loop (requires aiohttp)")
+    parser.add_argument('--concurrency', type=int, default=DEFAULT_ASYNC_CONCURRENCY,
+                        help=f"Maximum in-flight HubSpot requests in --async mode (default: {DEFAULT_ASYNC_CONCURRENCY})")
+    parser.add_argument('--schedule', action='store_true',
+                        help="Prioritize new and changed records and pace the run to fit the daily HubSpot API limit")
+    parser.add_argument('--daily-limit', type=int, default=HUBSPOT_DAILY_LIMIT,
+                        help=f"HubSpot API calls allowed per day in --schedule mode (default: {HUBSPOT_DAILY_LIMIT})")
+    parser.add_argument('--daily-reserve', type=int, default=HUBSPOT_DAILY_RESERVE,
+                        help=f"Daily API calls left untouched for other integrations (default: {HUBSPOT_DAILY_RESERVE})")
+    parser.add_argument('--checkpoint', default=DEFAULT_CHECKPOINT_FILE,
+                        help=f"Where --schedule writes pending records when it stops early (default: {DEFAULT_CHECKPOINT_FILE})")
+    parser.add_argument('--resume', metavar='CHECKPOINT',
+                        help="Process the pending records of a --schedule checkpoint")
+    parser.add_argument('--known-filter', nargs='?', const=KNOWN_FILTER_FILE, metavar='PATH',
+                        help=f"Skip searches for records the known-contacts filter says are new (default path: {KNOWN_FILTER_FILE})")
+    parser.add_argument('--build-known-filter', nargs='?', const=KNOWN_FILTER_FILE, metavar='PATH',
+                        help="Export all HubSpot contacts into a known-contacts filter before the run (or on its own)")
+    parser.add_argument('--trace', nargs='?', const=DEFAULT_TRACE_FILE, metavar='PATH',
+                        help=f"Write a Chrome trace-event timeline of records, stages and HubSpot calls (default path: {DEFAULT_TRACE_FILE})")
+    parser.add_argument('--profile', nargs='?', const=DEFAULT_PROFILE_FILE, metavar='PATH',
+                        help=f"Profile the run with cProfile, save the stats and print the hottest functions (default path: {DEFAULT_PROFILE_FILE})")
+    args = parser.parse_args(argv)
+    if args.resume:
+        if args.csv_file or args.watch:
+            parser.error("--resume takes no CSV file and cannot be combined with --watch.")
+        args.schedule = True
+    if args.schedule:
+        if args.watch or args.use_async or args.pipeline or args.processes > 1 or args.columnar:
+            parser.error("--schedule runs records sequentially and cannot be combined with other modes.")
+        if args.daily_limit < 1 or args.daily_reserve < 0:
+            parser.error("Daily limit must be >= 1 and daily reserve >= 0.")
+    if not (args.watch or args.resume or args.build_known_filter) and (args.csv_file is None or args.record_number is None):
+        parser.error("the following arguments are required: csv_file, record_number")
+    if args.csv_file and args.record_number is None:
+        parser.error("the following arguments are required: record_number")
+    if args.watch:
+        if args.csv_file or args.use_async or args.processes > 1 or args.columnar:
+            parser.error("--watch takes no CSV file and cannot be combined with --async, --processes or --columnar.")
+    if args.num_records is not None and args.num_records < 1:
+        parser.error("Number of records to process must be >= 1.")
+    if args.processes < 1:
+        parser.error("Number of processes must be >= 1.")
+    if args.concurrency < 1:
+        parser.error("Concurrency must be >= 1.")
+    if sum([args.use_async, args.pipeline, args.processes > 1]) > 1:
+        parser.error("--async, --pipeline and --processes cannot be combined.")
+    if args.columnar and (args.use_async or args.processes > 1):
+        parser.error("--columnar can only be used in the default and --pipeline modes.")
+    if args.queue_size < 1:
+        parser.error("Queue size must be >= 1.")
     try:
-        response = requests.post(url, headers=headers, json=payload)
-        response.raise_for_status()
-        data = response.json()
-        results = data.get('results', [])
-        ids = [r.get('id') for r in results if r.get('id')]
-        return ids
-    except Exception as e:
-        print(f"HubSpot API error: {e}")
-        return []
-    # imports are now at the top of the file
+        args.pipeline_config = parse_stage_config(args.stage)
+    except ValueError as e:
+        parser.error(str(e))
+    return args
 
 
 def main():
-    if len(sys.argv) < 2:
-        print("Usage: python read_record.py <csv_file> <record_number> [num_records]")
-        sys.exit(1)
-
-    csv_file = sys.argv[1]
+    global _profiling
+    args = parse_args()
+    if args.trace:
+        _tracer.enable()
+    profile = None
+    if args.profile:
+        _profiling = True
+        profile = start_thread_profile()
     try:
-        record_number = int(sys.argv[2])
-    except ValueError:
-        print("Record number must be an integer.")
-        sys.exit(1)
+        run(args)
+    finally:
+        stop_thread_profile(profile)
+        if args.trace:
+            _tracer.write(args.trace)
+        if args.profile:
+            write_profile(args.profile)
 
-    num_records = None
-    if len(sys.argv) >= 4:
+def run(args):
+    """
+    Run the mode selected by the command line arguments.
+    """
+    if args.build_known_filter:
+        if build_known_contacts_filter(args.build_known_filter) is None:
+            sys.exit(1)
+        if not (args.csv_file or args.watch or args.resume):
+            return
+        args.known_filter = args.known_filter or args.build_known_filter
+    if args.known_filter:
         try:
-            num_records = int(sys.argv[3])
-            if num_records < 1:
-                print("Number of records to process must be >= 1.")
-                sys.exit(1)
-        except ValueError:
-            print("Number of records to process must be an integer.")
+            load_known_filter(args.known_filter)
+        except RuntimeError as e:
+            print(e)
+            sys.exit(1)
+    # Load the property schema once up front: a first fetch inside the async event loop would block every
+    # worker, and forked shard workers inherit it instead of fetching it each
+    get_contact_property_schema()
+    if args.watch:
+        run_watch(args.watch, args)
+        return
+    if args.schedule:
+        _daily_quota.daily_limit = args.daily_limit
+    if args.resume:
+        try:
+            with open(args.resume, encoding='utf-8') as f:
+                checkpoint = json.load(f)
+            if 'files' not in checkpoint:
+                raise RuntimeError("the checkpoint does not list its export files (written by an older version)")
+            records = load_export_records(check_export_files(checkpoint['files']))
+            numbered_records = [(n, records[n - 1]) for n in checkpoint['pending'] if 1 <= n <= len(records)]
+        except (OSError, ValueError, KeyError, RuntimeError) as e:
+            print(f"Could not resume from {args.resume}: {e}")
             sys.exit(1)
+        run_scheduled(numbered_records, checkpoint['files'], args.checkpoint, reserve=args.daily_reserve)
+        save_known_filter(args.known_filter)
+        report_run_metrics()
+        return
+    csv_file = args.csv_file
+    record_number = args.record_number
+    num_records = args.num_records
 
     try:
-        with open(csv_file, newline='', encoding='utf-8') as f:
-            reader = csv.DictReader(f)
-            records = list(reader)
-            if record_number < 1 or record_number > len(records):
-                print(f"Record number must be between 1 and {len(records)}.")
-                sys.exit(1)
-            start_idx = record_number - 1
-            if num_records is not None:
-                end_idx = min(start_idx + num_records, len(records))
+        export_files = snapshot_export_files(expand_csv_inputs(csv_file))
+        records = load_export_records([f['path'] for f in export_files])
+        if record_number < 1 or record_number > len(records):
+            print(f"Record number must be between 1 and {len(records)}.")
+            sys.exit(1)
+        start_idx = record_number - 1
+        if num_records is not None:
+            end_idx = min(start_idx + num_records, len(records))
+        else:
+            end_idx = len(records)
+        if args.processes > 1:
+            numbered_records = [(idx + 1, records[idx]) for idx in range(start_idx, end_idx)]
+            run_sharded(numbered_records, args.processes, args.shard_by, args.known_filter)
+            return
+        if args.schedule:
+            numbered_records = [(idx + 1, records[idx]) for idx in range(start_idx, end_idx)]
+            run_scheduled(numbered_records, export_files, args.checkpoint, reserve=args.daily_reserve)
+            return
+        derived = None
+        if args.columnar:
+            started = time.perf_counter()
+            derived = prepare_derived_columns(records[start_idx:end_idx])
+            print(f"Prepared derived fields for {derived.size} record(s) in {time.perf_counter() - started:.2f}s.")
+        if args.pipeline:
+            if derived:
+                numbered_records = ((idx + 1, records[idx], derived.row(idx - start_idx)) for idx in range(start_idx, end_idx))
             else:
-                end_idx = len(records)
-            for idx in range(start_idx, end_idx):
-                record = records[idx]
-                print(f"\nProcessing record number {idx + 1}...")
-
-                # Extract all email addresses from the record
-                email_addresses = extract_emails_from_record(record)
-                all_hubspot_ids = set()
-                if not email_addresses:
-                    print("No email addresses found in the record.")
-                else:
-                    for email in email_addresses:
-                        email_ids = search_hubspot_by_email(email)
-                        if email_ids:
-                            print(f"Found HubSpot record ID(s): {', '.join(email_ids)} for email: {email}")
-                            all_hubspot_ids.update(email_ids)
-                        else:
-                            print(f"No matching HubSpot record found for email: {email}")
-
-                # LinkedIn ID
-                linkedin_id = record.get('id')
-                if linkedin_id:
-                    print(f"Searching by LinkedIn User Id: {linkedin_id}")
-                    linkedin_ids = search_hubspot_by_linkedin_id(linkedin_id)
-                    if linkedin_ids:
-                        print(f"Found HubSpot record ID(s): {', '.join(linkedin_ids)} for LinkedIn User Id: {linkedin_id}")
-                        all_hubspot_ids.update(linkedin_ids)
-                    else:
-                        print(f"No matching HubSpot record found for LinkedIn User Id: {linkedin_id}")
-                    # Try with hash_id if available
-                    hash_id = record.get('hash_id')
-                    if hash_id:
-                        print(f"Trying with hash_id: {hash_id}")
-                        hash_ids = search_hubspot_by_linkedin_id(hash_id)
-                        if hash_ids:
-                            print(f"Found HubSpot record ID(s): {', '.join(hash_ids)} for hash_id: {hash_id}")
-                            all_hubspot_ids.update(hash_ids)
-                        else:
-                            print(f"No matching HubSpot record found for hash_id: {hash_id}")
-                    else:
-                        print("No hash_id field found in the record.")
-                    # Try with public_id_2 if still not found
-                    public_id_2 = record.get('public_id_2')
-                    if public_id_2:
-                        print(f"Trying with public_id_2: {public_id_2}")
-                        public_ids = search_hubspot_by_linkedin_id(public_id_2)
-                        if public_ids:
-                            print(f"Found HubSpot record ID(s): {', '.join(public_ids)} for public_id_2: {public_id_2}")
-                            all_hubspot_ids.update(public_ids)
-                        else:
-                            print(f"No matching HubSpot record found for public_id_2: {public_id_2}")
-                    else:
-                        print("No public_id_2 field found in the record.")
-                else:
-                    print("No LinkedIn User Id ('id' field) found in the record.")
-
-                # Only search by name if no matches found yet
-                if not all_hubspot_ids:
-                    first_name = record.get('first_name') or record.get('firstname')
-                    last_name = record.get('last_name') or record.get('lastname')
-                    if first_name and last_name:
-                        print(f"Trying with first name and last name: {first_name} {last_name}")
-                        name_ids = search_hubspot_by_name(first_name, last_name)
-                        if name_ids:
-                            print(f"Found {len(name_ids)} HubSpot record(s) for name {first_name} {last_name}: {', '.join(name_ids)}")
-                            org_names = set()
-                            for i in range(1, 11):
-                                org = record.get(f'organization_{i}')
-                                if org:
-                                    org_names.add(org.strip().lower())
-                            if org_names:
-                                print(f"Corroborating with organization names: {', '.join(org_names)}")
-                                corroborated_ids = []
-                                for contact_id in name_ids:
-                                    company_names = get_company_names_for_contact(contact_id)
-                                    if company_names & org_names:
-                                        print(f"Contact {contact_id} is associated with company name(s): {', '.join(company_names & org_names)}")
-                                        corroborated_ids.append(contact_id)
-                                if corroborated_ids:
-                                    print(f"After corroboration, keeping contact(s): {', '.join(corroborated_ids)}")
-                                    all_hubspot_ids.update(corroborated_ids)
-                                else:
-                                    print("No contacts corroborated by company names. Keeping all name matches.")
-                                    all_hubspot_ids.update(name_ids)
-                            else:
-                                print("No organization names found in the record. Keeping all name matches.")
-                                all_hubspot_ids.update(name_ids)
-                        else:
-                            print(f"No matching HubSpot record found for name: {first_name} {last_name}")
-                    else:
-                        print("No first name and/or last name found in the record.")
-
-                # Merge all found IDs if more than one
-                all_hubspot_ids = sorted(all_hubspot_ids, key=lambda x: int(x))
-                if len(all_hubspot_ids) > 1:
-                    print(f"Merging {len(all_hubspot_ids)} duplicate HubSpot contacts: {', '.join(all_hubspot_ids)}")
-                    # Always keep the highest ID as primary, but update to the new ID returned by merge
-                    primary_id = all_hubspot_ids[-1]
-                    for merge_id in reversed(all_hubspot_ids[:-1]):
-                        print(f"Merging duplicate contacts: {merge_id} into {primary_id}")
-                        merge_result = merge_hubspot_contacts(merge_id, primary_id)
-                        if merge_result is not None:
-                            # HubSpot may return a new ID for the merged contact
-                            new_id = merge_result.get('id') or merge_result.get('primaryObjectId') or primary_id
-                            print(f"New primary ID after merge: {new_id}")
-                            primary_id = str(new_id)
-                        else:
-                            print(f"Failed to merge contacts {merge_id} and {primary_id}. Stopping merge attempts.")
-                            break
-                    print(f"Final remaining HubSpot record ID after merge: {primary_id}")
-                    all_hubspot_ids = [primary_id]
-                elif len(all_hubspot_ids) == 1:
-                    print(f"Single HubSpot record ID found: {all_hubspot_ids[0]}")
-                else:
-                    print("No HubSpot record found for this contact. Creating a new contact.")
-                    create_contact_id = create_hubspot_contact(record)
-                    if create_contact_id:
-                        print(f"Created new HubSpot contact with ID: {create_contact_id}")
-                        all_hubspot_ids = [str(create_contact_id)]
-                    else:
-                        print("Failed to create a new HubSpot contact.")
-                        return
-
-                # At this point, we have a unique HubSpot contact ID
-                unique_id = all_hubspot_ids[0]
-                hubspot_contact_json = get_hubspot_contact_by_id(unique_id)
-                if not hubspot_contact_json:
-                    print(f"Could not fetch HubSpot contact with ID {unique_id}.")
-                    return
-                update_properties = get_hubspot_update_properties(hubspot_contact_json, record)
-                # Ensure email addresses found above are added to update_properties['email']
-                if email_addresses:
-                    # Combine all unique emails from extracted and any already in update_properties
-                    existing_emails = []
-                    if 'email' in update_properties and update_properties['email']:
-                        existing_emails = [e.strip() for e in update_properties['email'].split(',') if e.strip()]
-                    all_emails = set(existing_emails) | set(email_addresses)
-                    # Only keep emails ending with a letter (not '.', ' ', or other special char)
-                    valid_emails = [e for e in all_emails if re.match(r'.*[a-zA-Z]$', e)]
-                    update_properties['email'] = ','.join(sorted(valid_emails))
-                if not update_properties:
-                    print("No properties to update for this contact.")
-                else:
-                    if DEBUG :
-                        print(f"Updating HubSpot contact {unique_id} with the following properties:")
-                        print("+------------------------------------------+------------------------------------------------+")
-                        print("| Property                                 | Value                                          |")
-                        print("+------------------------------------------+------------------------------------------------+")
-                        for k, v in update_properties.items():
-                            k_str = str(k)[:40].ljust(40)
-                            v_str = str(v)[:44].ljust(44)
-                            print(f"| {k_str} | {v_str}|")
-                        print("+--------------------------------------------+------------------------------------------------+")
-                    updated = update_hubspot_contact_by_id(unique_id, update_properties)
-                    if updated is not None:
-                        print(f"Successfully updated HubSpot contact {unique_id}.")
-                    else:
-                        print(f"Failed to update HubSpot contact {unique_id}.")
-                        return
+                numbered_records = ((idx + 1, records[idx]) for idx in range(start_idx, end_idx))
+            RecordPipeline(args.pipeline_config, args.queue_size).run(numbered_records)
+            return
+        if args.use_async:
+            numbered_records = [(idx + 1, records[idx]) for idx in range(start_idx, end_idx)]
+            asyncio.run(async_run_records(numbered_records, args.concurrency))
+            return
+        for idx in range(start_idx, end_idx):
+            ok, reason = process_record(records[idx], idx + 1, derived.row(idx - start_idx) if derived else None)
+            if not ok:
+                return
     except FileNotFoundError:
         print("File not found.")
         sys.exit(1)
     except Exception as e:
         print(f"Error: {e}")
         sys.exit(1)
+    finally:
+        drain_secondary_emails()
+        save_known_filter(args.known_filter)
+        report_run_metrics()
 
+# Company ID -> lowercased name; company names rarely change, so they are kept for the whole process
+_company_name_cache = {}
+
+@traced('corroborate')
 def get_company_names_for_contact(contact_id):
     """
     Given a HubSpot contact ID, retrieve associated company names (set, lowercased).
+    Company names are cached by company ID for the lifetime of the process.
     """
     api_key = get_api_key()
     if not api_key:
@@ -988,18 +3368,23 @@ def get_company_names_for_contact(contact_id):
         "Authorization": f"Bearer {api_key}"
     }
     try:
-        response = requests.get(url, headers=headers)
+        response = hubspot_request('GET', url, headers=headers)
         response.raise_for_status()
         data = response.json()
         company_ids = [a['id'] for a in data.get('results', []) if 'id' in a]
         company_names = set()
         for company_id in company_ids:
+            if company_id in _company_name_cache:
+                if _company_name_cache[company_id]:
+                    company_names.add(_company_name_cache[company_id])
+                continue
             try:
                 company_url = f"https://api.hubapi.com/crm/v3/objects/companies/{company_id}?properties=name"
-                resp = requests.get(company_url, headers=headers)
+                resp = hubspot_request('GET', company_url, headers=headers)
                 resp.raise_for_status()
                 company_data = resp.json()
                 name = company_data.get('properties', {}).get('name')
+                _company_name_cache[company_id] = name.strip().lower() if name else ''
                 if name:
                     company_names.add(name.strip().lower())
             except Exception as e:
@@ -1009,15 +3394,360 @@ def get_company_names_for_contact(contact_id):
         print(f"HubSpot API error while fetching company names for contact {contact_id}: {e}")
         return set()
 
+# --- Search memoization ------------------------------------------------------
+# Lookups repeat within a run: third-party emails shared between rows, hash_ids equal to public IDs, the
+# same name searched for every row of one person. Answers, including "not found", are kept for the run
+# in one cache keyed by (kind, value). Writes that change an answer update it: creates, merges and email
+# writes. Failed requests are never cached.
+
+class SearchCache:
+    """
+    Run-scoped memo of email, LinkedIn and name searches. Keys are ('email', email), ('linkedin', canonical
+    key) or ('name', first, last); values are sets of contact IDs (an empty set is a cached miss).
+    """
+    KINDS = ('email', 'linkedin', 'name')
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._entries = {}
+        self.stats = {kind: {'hits': 0, 'negative_hits': 0, 'misses': 0} for kind in self.KINDS}
+
+    def get(self, key):
+        """
+        Return the cached contact IDs (sorted list, possibly empty) for key, or None if not cached.
+        """
+        with self._lock:
+            ids = self._entries.get(key)
+            stats = self.stats[key[0]]
+            if ids is None:
+                stats['misses'] += 1
+                return None
+            stats['hits' if ids else 'negative_hits'] += 1
+            return sorted(ids)
+
+    def put(self, key, contact_ids):
+        with self._lock:
+            self._entries[key] = {str(c) for c in contact_ids}
+
+    def add(self, key, contact_id):
+        """
+        Record that contact_id now answers key (a create or write made it match).
+        """
+        with self._lock:
+            self._entries.setdefault(key, set()).add(str(contact_id))
+
+    def forget(self, key):
+        with self._lock:
+            self._entries.pop(key, None)
+
+    def contact_created(self, contact_id, properties):
+        """
+        Update the cache for a contact created with properties: its LinkedIn key and name now find it,
+        and its emails are looked up again (the create request may hold several comma-separated emails).
+        """
+        if not contact_id:
+            return
+        linkedin_key = properties.get(LINKEDIN_KEY_PROPERTY)
+        if linkedin_key:
+            self.add(('linkedin', linkedin_key), contact_id)
+        key = name_search_key(properties.get('firstname'), properties.get('lastname'))
+        if key:
+            remember_name_candidate(contact_id, properties)
+            with self._lock:
+                if key in self._entries:
+                    self._entries[key].add(str(contact_id))
+        for email in (properties.get('email') or '').split(','):
+            if email.strip():
+                self.forget(('email', normalize_search_email(email)))
+
+    def contact_merged(self, old_id, new_id):
+        """
+        Point every entry that found a merged-away contact at the surviving contact.
+        """
+        old_id, new_id = str(old_id), str(new_id)
+        if old_id in _name_candidate_properties and new_id not in _name_candidate_properties:
+            _name_candidate_properties[new_id] = _name_candidate_properties[old_id]
+        with self._lock:
+            for contact_ids in self._entries.values():
+                if old_id in contact_ids:
+                    contact_ids.discard(old_id)
+                    contact_ids.add(new_id)
+
+    def emails_written(self, contact_id, emails):
+        """
+        Record that emails were set on contact_id. A new primary email can drop the previous one from
+        the contact, so other cached emails of that contact are looked up again.
+        """
+        contact_id = str(contact_id)
+        written = {('email', normalize_search_email(e)) for e in emails if e and e.strip()}
+        with self._lock:
+            for key, contact_ids in list(self._entries.items()):
+                if key[0] == 'email' and contact_id in contact_ids and key not in written:
+                    del self._entries[key]
+            for key in written:
+                self._entries[key] = {contact_id}
+
+    def forget_misses(self):
+        """
+        Drop cached misses, which go stale when contacts are created outside this process.
+        """
+        with self._lock:
+            for key in [k for k, ids in self._entries.items() if not ids]:
+                del self._entries[key]
+
+    def report(self):
+        """
+        Print the hit rate per search kind, if any searches were made.
+        """
+        with self._lock:
+            stats = {kind: dict(counts) for kind, counts in self.stats.items()}
+        lines = []
+        for kind, counts in stats.items():
+            total = counts['hits'] + counts['negative_hits'] + counts['misses']
+            if total:
+                cached = counts['hits'] + counts['negative_hits']
+                lines.append(f"  {kind}: {cached}/{total} answered from cache ({cached / total:.0%}; "
+                             f"{counts['negative_hits']} cached miss(es))")
+        if lines:
+            print("Search cache:")
+            print("\n".join(lines))
+
+def normalize_search_email(email):
+    return email.strip().lower().rstrip('.')
+
+def name_search_key(first_name, last_name):
+    if not first_name or not last_name:
+        return None
+    return ('name', first_name.strip().lower(), last_name.strip().lower())
+
+_search_cache = SearchCache()
+
+def report_run_metrics():
+    """
+    Print end-of-run metrics: search cache hit rates and the adaptive HTTP concurrency level.
+    """
+    _search_cache.report()
+    _concurrency.report()
+
+# --- Known-contacts filter ---------------------------------------------------
+# A Bloom filter over every email, canonical LinkedIn key and name in the portal, built from a paginated
+# contact export (--build-known-filter) and kept on disk. If none of a record's keys is in the filter the
+# contact definitely does not exist, so the search cascade is skipped and it is created right away.
+# False positives only cost the usual searches; at 1% the filter needs about 1.2 bytes per key (roughly
+# 4 MB for a million contacts with three keys each).
+
+KNOWN_FILTER_FILE = '.hubspot_known_contacts.bloom'
+KNOWN_FILTER_FP_RATE = 0.01
+KNOWN_FILTER_MAX_AGE_HOURS = 24  # contacts created elsewhere since the build are invisible to the filter
+_KNOWN_FILTER_MAGIC = b'RRBLOOM1'
+_KNOWN_FILTER_HEADER = struct.Struct('<QIQd')  # bits, hashes, keys added, build time
+KNOWN_FILTER_EXPORT_PROPERTIES = ['email', 'hs_additional_emails', 'firstname', 'lastname', LINKEDIN_KEY_PROPERTY, 'linkedin_url']
+
+class KnownContactsFilter:
+    """
+    Bloom filter of contact identity keys (see known_filter_keys). might_contain() has no false negatives;
+    add() is thread-safe and remembers the keys added since loading so worker processes can report them.
+    """
+    def __init__(self, capacity, fp_rate=KNOWN_FILTER_FP_RATE):
+        capacity = max(1000, int(capacity))
+        self.num_bits = max(64, int(-capacity * math.log(fp_rate) / math.log(2) ** 2))
+        self.num_hashes = max(1, round(self.num_bits / capacity * math.log(2)))
+        self.bits = bytearray((self.num_bits + 7) // 8)
+        self.count = 0
+        self.built_at = time.time()
+        self.added_keys = []
+        self._lock = threading.Lock()
+
+    def _positions(self, key):
+        # Double hashing (Kirsch-Mitzenmacher): k positions from one 128-bit digest
+        digest = hashlib.blake2b(key.encode('utf-8'), digest_size=16).digest()
+        h1, h2 = struct.unpack('<QQ', digest)
+        return [(h1 + i * h2) % self.num_bits for i in range(self.num_hashes)]
+
+    def add(self, key, track=True):
+        with self._lock:
+            for pos in self._positions(key):
+                self.bits[pos >> 3] |= 1 << (pos & 7)
+            self.count += 1
+            if track:
+                self.added_keys.append(key)
+
+    def might_contain(self, key):
+        return all(self.bits[pos >> 3] & (1 << (pos & 7)) for pos in self._positions(key))
+
+    def definitely_new(self, record, email_addresses):
+        keys = known_filter_keys(record, email_addresses)
+        return bool(keys) and not any(self.might_contain(k) for k in keys)
+
+    def add_record(self, record, email_addresses):
+        for key in known_filter_keys(record, email_addresses):
+            self.add(key)
+
+    def save(self, path):
+        with self._lock:
+            data = _KNOWN_FILTER_MAGIC + _KNOWN_FILTER_HEADER.pack(self.num_bits, self.num_hashes, self.count, self.built_at) + bytes(self.bits)
+        tmp_path = path + '.tmp'
+        with open(tmp_path, 'wb') as f:
+            f.write(data)
+        os.replace(tmp_path, path)
+
+    @classmethod
+    def load(cls, path):
+        with open(path, 'rb') as f:
+            data = f.read()
+        if not data.startswith(_KNOWN_FILTER_MAGIC):
+            raise ValueError(f"{path} is not a known-contacts filter")
+        num_bits, num_hashes, count, built_at = _KNOWN_FILTER_HEADER.unpack_from(data, len(_KNOWN_FILTER_MAGIC))
+        known_filter = cls.__new__(cls)
+        known_filter.num_bits, known_filter.num_hashes = num_bits, num_hashes
+        known_filter.count, known_filter.built_at = count, built_at
+        known_filter.bits = bytearray(data[len(_KNOWN_FILTER_MAGIC) + _KNOWN_FILTER_HEADER.size:])
+        if len(known_filter.bits) != (num_bits + 7) // 8:
+            raise ValueError(f"{path} is truncated")
+        known_filter.added_keys = []
+        known_filter._lock = threading.Lock()
+        return known_filter
+
+def known_filter_keys(record, email_addresses):
+    """
+    Return the filter keys a record could be found by: its emails, canonical LinkedIn keys and name,
+    normalized the way the searches normalize them.
+    """
+    keys = {f"email:{normalize_search_email(e)}" for e in email_addresses if e.strip()}
+    for field in ('id', 'hash_id', 'public_id_2'):
+        linkedin_key = canonicalize_linkedin_id(record.get(field))
+        if linkedin_key:
+            keys.add(f"li:{linkedin_key}")
+    name_key = name_search_key(record.get('first_name') or record.get('firstname'),
+                               record.get('last_name') or record.get('lastname'))
+    if name_key:
+        keys.add(f"name:{name_key[1]}|{name_key[2]}")
+    return keys
+
+def contact_filter_keys(properties):
+    """
+    Return the filter keys of an exported HubSpot contact (see known_filter_keys). Both the canonical key
+    property and linkedin_url are added, since they can hold different forms (public ID, member hash) of
+    the same profile and a CSV record may be searched by either.
+    """
+    emails = [properties.get('email') or ''] + (properties.get('hs_additional_emails') or '').split(';')
+    record = {
+        'id': properties.get(LINKEDIN_KEY_PROPERTY),
+        'first_name': properties.get('firstname'),
+        'last_name': properties.get('lastname'),
+    }
+    keys = known_filter_keys(record, [e for e in emails if e.strip()])
+    linkedin_url_key = canonicalize_linkedin_id(properties.get('linkedin_url'))
+    if linkedin_url_key:
+        keys.add(f"li:{linkedin_url_key}")
+    return keys
+
+def count_hubspot_contacts():
+    """
+    Return the number of contacts in the portal (from a one-result search), or None on error.
+    """
+    api_key = get_api_key()
+    if not api_key:
+        return None
+    url = "https://api.hubapi.com/crm/v3/objects/contacts/search"
+    headers = {
+        "Content-Type": "application/json",
+        "Authorization": f"Bearer {api_key}"
+    }
+    try:
+        response = hubspot_request('POST', url, headers=headers, json={"limit": 1, "properties": ["email"]})
+        response.raise_for_status()
+        return response.json().get('total')
+    except Exception as e:
+        print(f"HubSpot API error while counting contacts: {e}")
+        return None
+
+def build_known_contacts_filter(path=KNOWN_FILTER_FILE):
+    """
+    Page through every contact in the portal (100 per call) and save a KnownContactsFilter of their
+    keys to path. Returns the filter, or None if the export failed.
+    """
+    api_key = get_api_key()
+    if not api_key:
+        return None
+    total = count_hubspot_contacts()
+    if total is None:
+        return None
+    # Most contacts have an email, a name and a LinkedIn key; leave room for secondary emails and later creates
+    known_filter = KnownContactsFilter(capacity=(total + 10000) * 4)
+    print(f"Building known-contacts filter for {total} contact(s) ({len(known_filter.bits) / 1024 / 1024:.1f} MB)...")
+    url = "https://api.hubapi.com/crm/v3/objects/contacts"
+    headers = {
+        "Content-Type": "application/json",
+        "Authorization": f"Bearer {api_key}"
+    }
+    params = {"limit": 100, "properties": ",".join(KNOWN_FILTER_EXPORT_PROPERTIES), "archived": "false"}
+    exported = 0
+    while True:
+        try:
+            response = hubspot_request('GET', url, headers=headers, params=params)
+            response.raise_for_status()
+            data = response.json()
+        except Exception as e:
+            print(f"HubSpot API error while exporting contacts: {e}")
+            return None
+        for contact in data.get('results', []):
+            for key in contact_filter_keys(contact.get('properties') or {}):
+                known_filter.add(key, track=False)
+            exported += 1
+        if exported % 10000 < 100:
+            print(f"  {exported} contact(s) exported...")
+        after = ((data.get('paging') or {}).get('next') or {}).get('after')
+        if not after:
+            break
+        params['after'] = after
+    known_filter.save(path)
+    print(f"Known-contacts filter with {known_filter.count} key(s) from {exported} contact(s) saved to {path}.")
+    return known_filter
+
+_known_filter = None
+
+def load_known_filter(path=KNOWN_FILTER_FILE):
+    """
+    Load the known-contacts filter from path and enable "definitely new" checks for this process.
+    Raises RuntimeError if the filter cannot be read.
+    """
+    global _known_filter
+    try:
+        _known_filter = KnownContactsFilter.load(path)
+    except (OSError, ValueError) as e:
+        raise RuntimeError(f"Could not load known-contacts filter from {path}: {e}. Run with --build-known-filter first.") from e
+    age_hours = (time.time() - _known_filter.built_at) / 3600
+    if age_hours > KNOWN_FILTER_MAX_AGE_HOURS:
+        print(f"WARNING: the known-contacts filter was built {age_hours:.0f} hours ago; contacts created elsewhere "
+              "since then may be duplicated. Rebuild it with --build-known-filter.")
+    return _known_filter
+
+def remember_known_record(record, email_addresses):
+    """
+    Add a synchronized record's keys to the known-contacts filter, if one is in use.
+    """
+    if _known_filter is not None:
+        _known_filter.add_record(record, email_addresses)
+
+def save_known_filter(path):
+    if _known_filter is not None and _known_filter.added_keys:
+        _known_filter.save(path)
+        print(f"Known-contacts filter updated with {len(_known_filter.added_keys)} key(s).")
+        _known_filter.added_keys = []
+
 def search_hubspot_by_email(email):
     """
     Search HubSpot contacts by email using API v3 and return the record ID if found.
     Requires HUBSPOT_API_KEY environment variable to be set.
     """
+    email = normalize_search_email(email)
+    cached = _search_cache.get(('email', email))
+    if cached is not None:
+        return cached
     api_key = get_api_key()
     if not api_key:
         return None
-    email = email.strip().lower().rstrip('.')
     # Use legacy endpoint to search by primary and secondary email
     url = f"https://api.hubapi.com/contacts/v1/contact/email/{email}/profile"
     headers = {
@@ -1025,28 +3755,69 @@ def search_hubspot_by_email(email):
         "Authorization": f"Bearer {api_key}"
     }
     try:
-        response = requests.get(url, headers=headers)
+        response = hubspot_request('GET', url, headers=headers)
         if DEBUG:
             print(f"[DEBUG] search_hubspot_by_email: email={email}")
             print(f"[DEBUG] Response status code: {response.status_code}")
             print(f"[DEBUG] Response content: {response.content.decode('utf-8')}")  
         if response.status_code == 404:
+            _search_cache.put(('email', email), [])
             return []
         response.raise_for_status()
         data = response.json()
         vid = data.get('vid')
-        if vid:
-            return [str(vid)]
-        return []
+        ids = [str(vid)] if vid else []
+        _search_cache.put(('email', email), ids)
+        return ids
     except Exception as e:
         print(f"HubSpot API error: {e}")
         return []
 
+def linkedin_key_property_available():
+    """
+    Return False if the contact property schema shows LINKEDIN_KEY_PROPERTY has not been created in the
+    portal (searches filtering on it would fail with a 400); warns once. True if the schema is unavailable.
+    """
+    schema = get_contact_property_schema()
+    if not schema or LINKEDIN_KEY_PROPERTY in schema:
+        return True
+    if LINKEDIN_KEY_PROPERTY not in _reported_unknown_properties:
+        _reported_unknown_properties.add(LINKEDIN_KEY_PROPERTY)
+        print(f"WARNING: HubSpot has no contact property '{LINKEDIN_KEY_PROPERTY}'; LinkedIn searches match linkedin_url only. "
+              "Create the property (see README) for reliable LinkedIn matching.")
+    return False
+
+def build_linkedin_search_payload(linkedin_key):
+    """
+    Build one search request that matches a canonical LinkedIn key: an exact match on LINKEDIN_KEY_PROPERTY,
+    OR'ed (as separate filter groups) with the https/http and trailing-slash linkedin_url spellings
+    for contacts synced before the key existed. If the portal has no LINKEDIN_KEY_PROPERTY, only the
+    linkedin_url spellings are searched.
+    """
+    filter_groups = []
+    properties = ["linkedin_url"]
+    if linkedin_key_property_available():
+        filter_groups.append({"filters": [{"propertyName": LINKEDIN_KEY_PROPERTY, "operator": "EQ", "value": linkedin_key}]})
+        properties.insert(0, LINKEDIN_KEY_PROPERTY)
+    if LINKEDIN_LEGACY_URL_LOOKUP or not filter_groups:
+        for template in ("https://www.linkedin.com/in/{}", "https://www.linkedin.com/in/{}/",
+                         "http://www.linkedin.com/in/{}", "http://www.linkedin.com/in/{}/"):
+            filter_groups.append({"filters": [{"propertyName": "linkedin_url", "operator": "EQ", "value": template.format(linkedin_key)}]})
+    return {"filterGroups": filter_groups, "properties": properties, "limit": 100}
+
 def search_hubspot_by_linkedin_id(linkedin_id):
     """
-    Search HubSpot contacts by LinkedIn User Id (custom property 'linkedinuserid') using API v3 and return the record ID if found.
+    Search HubSpot contacts by LinkedIn ID or profile URL and return a list of record IDs.
+    The value is canonicalized first, answered from the search cache when possible, and otherwise
+    looked up with a single search request (see build_linkedin_search_payload).
     Requires HUBSPOT_API_KEY environment variable to be set.
     """
+    linkedin_key = canonicalize_linkedin_id(linkedin_id)
+    if not linkedin_key:
+        return []
+    cached = _search_cache.get(('linkedin', linkedin_key))
+    if cached is not None:
+        return cached
     api_key = get_api_key()
     if not api_key:
         return None
@@ -1055,67 +3826,447 @@ def search_hubspot_by_linkedin_id(linkedin_id):
         "Content-Type": "application/json",
         "Authorization": f"Bearer {api_key}"
     }
-    # Try all combinations: https/http, with and without trailing slash
-    url_templates = [
-        "https://www.linkedin.com/in/{}",
-        "https://www.linkedin.com/in/{}/",
-        "http://www.linkedin.com/in/{}",
-        "http://www.linkedin.com/in/{}/"
-    ]
     try:
-        all_ids = []
-        for template in url_templates:
-            linkedin_url = template.format(linkedin_id)
-            payload = {
-                "filterGroups": [
-                    {
-                        "filters": [
-                            {
-                                "propertyName": "linkedin_url",
-                                "operator": "EQ",
-                                "value": linkedin_url
-                            }
-                        ]
-                    }
-                ],
-                "properties": ["linkedin_url"]
-            }
-            response = requests.post(url, headers=headers, json=payload)
-            response.raise_for_status()
-            data = response.json()
-            results = data.get('results', [])
-            ids = [r.get('id') for r in results if r.get('id')]
-            all_ids.extend(ids)
-        # Remove duplicates
-        all_ids = list(set(all_ids))
+        response = hubspot_request('POST', url, headers=headers, json=build_linkedin_search_payload(linkedin_key))
+        response.raise_for_status()
+        data = response.json()
+        all_ids = list({r.get('id') for r in data.get('results', []) if r.get('id')})
         if len(all_ids) > 1:
             print(f"WARNING: Multiple HubSpot records found for LinkedIn ID '{linkedin_id}': {', '.join(all_ids)}")
-        if all_ids:
-            return all_ids
-        return []
+        _search_cache.put(('linkedin', linkedin_key), all_ids)
+        return all_ids
     except Exception as e:
         print(f"HubSpot API error: {e}")
         return []
 
-def extract_emails_from_record(record):
+EMAIL_REGEX = re.compile(r"[a-zA-Z0-9_.+-]+@[a-zA-Z0-9-]+\.[a-zA-Z0-9-.]+")
+# Emails must end with a letter (not '.', ' ', or other special char)
+EMAIL_VALID_LAST_CHARS = frozenset(string.ascii_letters)
+
+# LinkedHelper columns that never hold email addresses: identifiers, counts, dates, flags, phones,
+# LinkedIn URLs and locations. Message text is skipped on purpose (it quotes other people's emails).
+EMAIL_EXCLUDED_COLUMNS = frozenset({
+    'last_received_message_text', 'id', 'id_type', 'public_id', 'public_id_2', 'hash_id', 'sn_hash_id',
+    'member_id', 'lh_id', 'avatar', 'location_name', 'industry', 'birthday', 'member_distance',
+    'followers', 'mutual_count', 'connections_count', 'connected_at',
+})
+EMAIL_EXCLUDED_COLUMN_PATTERN = re.compile(
+    r"^(badges_|phone_|education_(start|end)_|organization_(id|start|end|url|location|domain)_)"
+    r"|(_id|_count|_at|_url|_date)(_\d+)?$"
+)
+
+@functools.lru_cache(maxsize=32)
+def build_email_column_plan(fieldnames):
+    """
+    Return the tuple of columns worth scanning for email addresses, given the CSV header (as a tuple).
+    Computed once per distinct header.
+    """
+    return tuple(
+        name for name in fieldnames
+        if name and name not in EMAIL_EXCLUDED_COLUMNS and not EMAIL_EXCLUDED_COLUMN_PATTERN.search(name)
+    )
+
+def is_valid_email(email):
+    """
+    Return True if the email ends with a letter (not '.', ' ', or other special char).
+    """
+    return bool(email) and email[-1] in EMAIL_VALID_LAST_CHARS
+
+def extract_emails_from_record(record, column_plan=None):
     """
     Extract all email addresses from the record values (case-insensitive, supports multiple fields).
+    Only the columns in column_plan are scanned (see build_email_column_plan; derived from the record's
+    keys if not given), and values without an '@' are skipped before any regex work.
     Returns a list of unique email addresses.
     """
+    if column_plan is None:
+        column_plan = build_email_column_plan(tuple(record.keys()))
     emails = set()
-    email_regex = re.compile(r"[a-zA-Z0-9_.+-]+@[a-zA-Z0-9-]+\.[a-zA-Z0-9-.]+")
-    for key, value in record.items():
-        if key == "last_received_message_text":
-            continue
-        if not value:
-            continue
-        # If value is a string, search for email(s)
-        if isinstance(value, str):
-            found = email_regex.findall(value)
-            emails.update(found)
-    # Only keep emails ending with a letter (not '.', ' ', or other special char)
-    valid_emails = [e for e in emails if re.match(r'.*[a-zA-Z]$', e)]
-    return valid_emails
+    for key in column_plan:
+        value = record.get(key)
+        if value and isinstance(value, str) and '@' in value:
+            emails.update(EMAIL_REGEX.findall(value))
+    return [e for e in emails if e[-1] in EMAIL_VALID_LAST_CHARS]
+
+
+
+# --- Asyncio HubSpot client -------------------------------------------------
+# Async variants of the HubSpot helpers for --async runs. They share the module rate limiter with the
+# blocking helpers and bound the number of in-flight requests with a semaphore instead of threads.
+
+DEFAULT_ASYNC_CONCURRENCY = 200
+
+class AsyncHubSpotClient:
+    """
+    Holds the aiohttp session, auth headers and the in-flight request semaphore for async helpers.
+    Use as an async context manager: async with AsyncHubSpotClient(api_key, 200) as client: ...
+    """
+    def __init__(self, api_key, concurrency=DEFAULT_ASYNC_CONCURRENCY):
+        self.headers = {
+            "Content-Type": "application/json",
+            "Authorization": f"Bearer {api_key}"
+        }
+        self.concurrency = concurrency
+        self.semaphore = None
+        self.session = None
+
+    async def __aenter__(self):
+        if aiohttp is None:
+            raise RuntimeError("The aiohttp package is required for --async mode (pip install aiohttp).")
+        self.semaphore = asyncio.Semaphore(self.concurrency)
+        # --concurrency is the ceiling; the adaptive controller decides how much of it is used
+        _concurrency.raise_max_limit(self.concurrency)
+        connector = aiohttp.TCPConnector(limit=self.concurrency)
+        self.session = aiohttp.ClientSession(connector=connector, headers=self.headers)
+        return self
+
+    async def __aexit__(self, exc_type, exc, tb):
+        await self.session.close()
+
+async def async_hubspot_request(client, method, url, compress=False, **kwargs):
+    """
+    Send a request through the client's session after taking a rate-limit slot, a semaphore permit and
+    a slot from the adaptive concurrency limit.
+    Returns (status_code, json_data); json_data is None if the body is not JSON.
+    compress works as in hubspot_request.
+    """
+    compressed = gzip_json_body(kwargs) if compress else None
+    span_start = _tracer.now() if _tracer.enabled else None
+    async with client.semaphore:
+        # Take the concurrency slot first, so the rate-limit reservation is not stale by the time the request is sent
+        waited = time.monotonic()
+        await _concurrency.acquire_async()
+        acquired = time.monotonic()
+        delay = 0.0
+        status = None
+        started = None
+        try:
+            delay = _rate_limiter.reserve()
+            if delay > 0:
+                await asyncio.sleep(delay)
+            started = time.monotonic()
+            async with client.session.request(method, url, **(compressed or kwargs)) as response:
+                status = response.status
+                _daily_quota.record_call(response.headers)
+                try:
+                    data = await response.json(content_type=None)
+                except (ValueError, aiohttp.ContentTypeError):
+                    data = None
+        finally:
+            network = time.monotonic() - started if started is not None else 0.0
+            _concurrency.release(network if started is not None else None, status, latency_class(method, url))
+            if span_start is not None:
+                _tracer.add_span(f"{method} {trace_endpoint(url)}", 'http', span_start, _tracer.now(), {
+                    'status': status, 'limiter_wait_ms': round(delay * 1000, 1),
+                    'concurrency_wait_ms': round((acquired - waited) * 1000, 1),
+                    'network_ms': round(network * 1000, 1), 'gzip': bool(compressed)})
+    if compressed and status in (400, 415):
+        retry_status, retry_data = await async_hubspot_request(client, method, url, **kwargs)
+        if retry_status < 400:
+            _disable_gzip_requests(status)
+        return retry_status, retry_data
+    return status, data
+
+def _raise_for_status(status, data, url):
+    if status >= 400:
+        raise RuntimeError(f"{status} error for url: {url} {data if data else ''}".rstrip())
+
+async def async_search_hubspot_by_email(client, email):
+    """
+    Async variant of search_hubspot_by_email. Returns a list of record IDs.
+    """
+    email = normalize_search_email(email)
+    cached = _search_cache.get(('email', email))
+    if cached is not None:
+        return cached
+    url = f"https://api.hubapi.com/contacts/v1/contact/email/{email}/profile"
+    try:
+        status, data = await async_hubspot_request(client, 'GET', url)
+        if status == 404:
+            _search_cache.put(('email', email), [])
+            return []
+        _raise_for_status(status, data, url)
+        vid = (data or {}).get('vid')
+        ids = [str(vid)] if vid else []
+        _search_cache.put(('email', email), ids)
+        return ids
+    except Exception as e:
+        print(f"HubSpot API error: {e}")
+        return []
+
+async def async_search_hubspot_by_linkedin_id(client, linkedin_id):
+    """
+    Async variant of search_hubspot_by_linkedin_id (one canonical-key search, search cache first).
+    """
+    linkedin_key = canonicalize_linkedin_id(linkedin_id)
+    if not linkedin_key:
+        return []
+    cached = _search_cache.get(('linkedin', linkedin_key))
+    if cached is not None:
+        return cached
+    url = "https://api.hubapi.com/crm/v3/objects/contacts/search"
+    try:
+        status, data = await async_hubspot_request(client, 'POST', url, json=build_linkedin_search_payload(linkedin_key))
+        _raise_for_status(status, data, url)
+        all_ids = list({r.get('id') for r in (data or {}).get('results', []) if r.get('id')})
+        if len(all_ids) > 1:
+            print(f"WARNING: Multiple HubSpot records found for LinkedIn ID '{linkedin_id}': {', '.join(all_ids)}")
+        _search_cache.put(('linkedin', linkedin_key), all_ids)
+        return all_ids
+    except Exception as e:
+        print(f"HubSpot API error: {e}")
+        return []
+
+async def async_search_hubspot_by_name(client, first_name, last_name):
+    """
+    Async variant of search_hubspot_by_name. Returns a dict mapping contact ID to its properties.
+    """
+    cache_key = name_search_key(first_name, last_name)
+    cached = cached_name_candidates(cache_key)
+    if cached is not None:
+        return cached
+    url = "https://api.hubapi.com/crm/v3/objects/contacts/search"
+    candidates = {}
+    after = None
+    try:
+        for page in range(NAME_SEARCH_MAX_PAGES):
+            status, data = await async_hubspot_request(client, 'POST', url, json=build_name_search_payload(first_name, last_name, after))
+            _raise_for_status(status, data, url)
+            for r in (data or {}).get('results', []):
+                if r.get('id'):
+                    candidates[r['id']] = r.get('properties') or {}
+            after = (((data or {}).get('paging') or {}).get('next') or {}).get('after')
+            if not after:
+                break
+    except Exception as e:
+        print(f"HubSpot API error: {e}")
+        store_name_candidates(cache_key, candidates, complete=False)
+        return candidates
+    store_name_candidates(cache_key, candidates)
+    return candidates
+
+async def async_match_name_candidates(client, candidates, record, email_addresses):
+    """
+    Async variant of match_name_candidates; the bounded company corroboration runs concurrently.
+    """
+    best_id, unconfirmed_ids = rank_name_candidates(candidates, record, email_addresses)
+    if best_id or not unconfirmed_ids:
+        return best_id
+    if len(unconfirmed_ids) == 1:
+        return unconfirmed_ids[0]
+    org_names = get_record_organization_names(record)
+    if org_names:
+        checked = unconfirmed_ids[:NAME_CORROBORATION_LIMIT]
+        company_names = await asyncio.gather(*(async_get_company_names_for_contact(client, c) for c in checked))
+        for contact_id, names in zip(checked, company_names):
+            if names & org_names:
+                return contact_id
+    return None
+
+async def async_get_hubspot_contact_by_id(client, contact_id):
+    """
+    Async variant of get_hubspot_contact_by_id. Returns the contact properties or None.
+    """
+    url = f"https://api.hubapi.com/crm/v3/objects/contacts/{contact_id}"
+    try:
+        status, data = await async_hubspot_request(client, 'GET', url)
+        _raise_for_status(status, data, url)
+        return (data or {}).get('properties', {})
+    except Exception as e:
+        print(f"HubSpot API error while fetching contact {contact_id}: {e}")
+        return None
+
+async def async_create_hubspot_contact(client, csv_json):
+    """
+    Async variant of create_hubspot_contact. Returns the new contact ID or False.
+    """
+    update_properties = get_hubspot_update_properties({}, csv_json)
+    if not update_properties:
+        print("No properties to set for new contact. Skipping.")
+        return False
+    url = "https://api.hubapi.com/crm/v3/objects/contacts"
+    try:
+        status, data = await async_hubspot_request(client, 'POST', url, json={"properties": update_properties})
+        _raise_for_status(status, data, url)
+        contact_id = (data or {}).get('id')
+        print(f"Successfully created new HubSpot contact with email: {update_properties.get('email', '[no email]')} and ID: {contact_id}")
+        _search_cache.contact_created(contact_id, update_properties)
+        return contact_id if contact_id else False
+    except Exception as e:
+        print(f"HubSpot API error while creating contact: {e}")
+        return False
+
+async def async_merge_hubspot_contacts(client, id1, id2):
+    """
+    Async variant of merge_hubspot_contacts; the smaller ID is merged into the larger.
+    """
+    id1_str, id2_str = str(id1), str(id2)
+    if int(id1_str) < int(id2_str):
+        objectIdToMerge, primaryObjectId = id1_str, id2_str
+    else:
+        objectIdToMerge, primaryObjectId = id2_str, id1_str
+    url = "https://api.hubapi.com/crm/v3/objects/contacts/merge"
+    payload = {"objectIdToMerge": objectIdToMerge, "primaryObjectId": primaryObjectId}
+    try:
+        status, data = await async_hubspot_request(client, 'POST', url, json=payload)
+        _raise_for_status(status, data, url)
+        print(f"Successfully merged contact {objectIdToMerge} into {primaryObjectId}.")
+        return data or {}
+    except Exception as e:
+        print(f"HubSpot API error during merge: {e}")
+        return None
+
+async def async_get_company_names_for_contact(client, contact_id):
+    """
+    Async variant of get_company_names_for_contact; company names are fetched concurrently.
+    """
+    url = f"https://api.hubapi.com/crm/v3/objects/contacts/{contact_id}/associations/companies"
+
+    async def company_name(company_id):
+        company_url = f"https://api.hubapi.com/crm/v3/objects/companies/{company_id}?properties=name"
+        try:
+            status, data = await async_hubspot_request(client, 'GET', company_url)
+            _raise_for_status(status, data, company_url)
+            return ((data or {}).get('properties', {}).get('name') or '').strip().lower()
+        except Exception as e:
+            print(f"HubSpot API error while fetching company name for company {company_id}: {e}")
+            return ''
+
+    try:
+        status, data = await async_hubspot_request(client, 'GET', url)
+        _raise_for_status(status, data, url)
+        company_ids = [a['id'] for a in (data or {}).get('results', []) if 'id' in a]
+        names = await asyncio.gather(*(company_name(c) for c in company_ids))
+        return {n for n in names if n}
+    except Exception as e:
+        print(f"HubSpot API error while fetching company names for contact {contact_id}: {e}")
+        return set()
+
+async def async_update_hubspot_contact_by_id(client, contact_id, properties):
+    """
+    Async variant of update_hubspot_contact_by_id: the first email becomes primary and the others
+    are handed to the background secondary email writer.
+    """
+    email_val = properties.get('email')
+    secondary_emails = []
+    if email_val and ',' in email_val:
+        email_list = [e.strip() for e in email_val.split(',') if e.strip()]
+        if email_list:
+            properties['email'] = email_list[0]
+            secondary_emails = email_list[1:]
+    url = f"https://api.hubapi.com/crm/v3/objects/contacts/{contact_id}"
+    try:
+        status, data = await async_hubspot_request(client, 'PATCH', url, json={"properties": properties})
+        _raise_for_status(status, data, url)
+    except Exception as e:
+        print(f"HubSpot API error while updating contact {contact_id}: {e}")
+        log_failed_record_id(contact_id, reason=str(e))
+        return None
+    if properties.get('email'):
+        _search_cache.emails_written(contact_id, [properties['email']])
+    if secondary_emails:
+        get_secondary_email_writer().submit(contact_id, secondary_emails)
+    return (data or {}).get('properties', {})
+
+@traced('record', 'record', span_args=lambda client, record, record_number: {'record_number': record_number})
+async def async_process_record(client, record, record_number):
+    """
+    Async variant of process_record. Independent lookups for one record (emails, LinkedIn IDs)
+    run concurrently. Returns (True, contact_id) on success or (False, reason) on failure.
+    """
+    print(f"\nProcessing record number {record_number}...")
+    email_addresses = extract_emails_from_record(record)
+    definitely_new = _known_filter is not None and _known_filter.definitely_new(record, email_addresses)
+    lookups = [] if definitely_new else [async_search_hubspot_by_email(client, email) for email in email_addresses]
+    if record.get('id') and not definitely_new:
+        linkedin_keys = {canonicalize_linkedin_id(record.get(f)) for f in ('id', 'hash_id', 'public_id_2')} - {None}
+        lookups += [async_search_hubspot_by_linkedin_id(client, key) for key in linkedin_keys]
+    all_hubspot_ids = set()
+    for ids in await asyncio.gather(*lookups):
+        all_hubspot_ids.update(ids or [])
+
+    # Only search by name if no matches found yet
+    if not all_hubspot_ids and not definitely_new:
+        first_name = record.get('first_name') or record.get('firstname')
+        last_name = record.get('last_name') or record.get('lastname')
+        if first_name and last_name:
+            candidates = await async_search_hubspot_by_name(client, first_name, last_name)
+            if candidates:
+                contact_id = await async_match_name_candidates(client, candidates, record, email_addresses)
+                if contact_id:
+                    all_hubspot_ids.add(contact_id)
+
+    # Merge all found IDs if more than one, keeping the highest ID as primary
+    all_hubspot_ids = sorted(all_hubspot_ids, key=lambda x: int(x))
+    if len(all_hubspot_ids) > 1:
+        primary_id = all_hubspot_ids[-1]
+        for merge_id in reversed(all_hubspot_ids[:-1]):
+            merge_result = await async_merge_hubspot_contacts(client, merge_id, primary_id)
+            if merge_result is None:
+                print(f"Failed to merge contacts {merge_id} and {primary_id}. Stopping merge attempts.")
+                break
+            new_id = str(merge_result.get('id') or merge_result.get('primaryObjectId') or primary_id)
+            _search_cache.contact_merged(merge_id, new_id)
+            _search_cache.contact_merged(primary_id, new_id)
+            primary_id = new_id
+        unique_id = primary_id
+    elif len(all_hubspot_ids) == 1:
+        unique_id = all_hubspot_ids[0]
+    else:
+        create_contact_id = await async_create_hubspot_contact(client, record)
+        if not create_contact_id:
+            return False, "create failed"
+        unique_id = str(create_contact_id)
+    remember_known_record(record, email_addresses)
+
+    hubspot_contact_json = await async_get_hubspot_contact_by_id(client, unique_id)
+    if not hubspot_contact_json:
+        return False, f"could not fetch contact {unique_id}"
+    update_properties = get_hubspot_update_properties(hubspot_contact_json, record)
+    merge_emails_into_properties(update_properties, email_addresses)
+    if not update_properties:
+        print(f"No properties to update for contact {unique_id}.")
+        return True, unique_id
+    updated = await async_update_hubspot_contact_by_id(client, unique_id, update_properties)
+    if updated is None:
+        return False, f"update failed for contact {unique_id}"
+    print(f"Successfully updated HubSpot contact {unique_id}.")
+    return True, unique_id
+
+async def async_run_records(numbered_records, concurrency=DEFAULT_ASYNC_CONCURRENCY):
+    """
+    Async record loop: keeps many records in flight on one event loop. Records that share an identity
+    key are serialized with a per-identity lock so their merges never race.
+    Returns the list of (record_number, reason) failures.
+    """
+    api_key = get_api_key()
+    if not api_key:
+        return [(n, "HUBSPOT_API_KEY not set") for n, _ in numbered_records]
+    failures = []
+    identity_locks = {}
+    pending = iter(numbered_records)
+
+    async def worker(lane):
+        _trace_lane.set(f"async worker {lane}")
+        for record_number, record in pending:
+            lock = identity_locks.setdefault(record_identity_key(record), asyncio.Lock())
+            async with lock:
+                try:
+                    ok, reason = await async_process_record(client, record, record_number)
+                except Exception as e:
+                    ok, reason = False, f"unexpected error: {e}"
+            if not ok:
+                failures.append((record_number, reason))
+                log_failed_record_id(f"record {record_number}", reason=reason)
+
+    async with AsyncHubSpotClient(api_key, concurrency) as client:
+        # Each worker drives one record at a time; the semaphore bounds the requests they issue together
+        await asyncio.gather(*(worker(n + 1) for n in range(min(concurrency, len(numbered_records)) or 1)))
+    await asyncio.to_thread(drain_secondary_emails)
+    print(f"\nAsync run complete: {len(numbered_records)} record(s) processed, {len(failures)} failure(s).")
+    for record_number, reason in sorted(failures):
+        print(f"  Record {record_number}: {reason}")
+    return failures
 
 
 if __name__ == "__main__":
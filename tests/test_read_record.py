@@ -0,0 +1,491 @@
+import io
+import os
+import csv
+import sys
+import time
+import asyncio
+import threading
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..'))
+
+import read_record as rr
+
+
+# --- Adaptive concurrency ----------------------------------------------------
+
+def feed(controller, clock, latency, status=200, endpoint='single', count=1):
+    for _ in range(count):
+        clock[0] += 1.0
+        controller.acquire()
+        controller.release(latency, status, endpoint)
+
+def test_concurrency_recovers_after_lasting_latency_increase(monkeypatch):
+    clock = [0.0]
+    monkeypatch.setattr(rr.time, 'monotonic', lambda: clock[0])
+    controller = rr.ConcurrencyController(initial=8, max_limit=32)
+    feed(controller, clock, 0.05, count=20)
+    feed(controller, clock, 0.5, count=200)
+    assert controller.baselines['single'] > 0.4
+    assert controller.limit > 8
+
+def test_concurrency_keeps_a_latency_baseline_per_endpoint_class(monkeypatch):
+    clock = [0.0]
+    monkeypatch.setattr(rr.time, 'monotonic', lambda: clock[0])
+    controller = rr.ConcurrencyController(initial=8, max_limit=32)
+    feed(controller, clock, 0.05, count=20)
+    feed(controller, clock, 0.8, endpoint='batch', count=5)
+    assert controller.stats['decrease_latency'] == 0
+    feed(controller, clock, 0.5, count=1)
+    assert controller.stats['decrease_latency'] == 1
+
+def test_concurrency_halves_on_429_and_ignores_unsent_requests():
+    controller = rr.ConcurrencyController(initial=8, max_limit=32)
+    controller.acquire()
+    controller.release(0.1, 429)
+    assert controller.limit == 4
+    controller.acquire()
+    controller.release(None, None)
+    assert controller.limit == 4 and controller.in_flight == 0 and controller.stats['requests'] == 1
+
+def test_latency_class():
+    assert rr.latency_class('POST', 'https://api.hubapi.com/crm/v3/objects/contacts/batch/read') == 'batch'
+    assert rr.latency_class('POST', 'https://api.hubapi.com/crm/v3/objects/contacts/search') == 'search'
+    assert rr.latency_class('GET', 'https://api.hubapi.com/crm/v3/objects/contacts/42?properties=email') == 'single'
+
+def test_acquire_async_wakes_when_another_thread_releases():
+    controller = rr.ConcurrencyController(initial=1, max_limit=1)
+    controller.acquire()
+
+    async def wait_for_slot():
+        timer = threading.Timer(0.05, controller.release, (0.01, 200))
+        timer.start()
+        await asyncio.wait_for(controller.acquire_async(), timeout=2)
+        timer.join()
+
+    asyncio.run(wait_for_slot())
+    assert controller.in_flight == 1
+
+
+# --- Known-contacts filter ---------------------------------------------------
+
+def test_known_filter_round_trips_through_its_file(tmp_path):
+    known_filter = rr.KnownContactsFilter(capacity=1000)
+    for i in range(500):
+        known_filter.add(f"email:person{i}@example.com", track=False)
+    path = str(tmp_path / 'known.bloom')
+    known_filter.save(path)
+    loaded = rr.KnownContactsFilter.load(path)
+    assert all(loaded.might_contain(f"email:person{i}@example.com") for i in range(500))
+    false_positives = sum(loaded.might_contain(f"email:other{i}@example.com") for i in range(2000))
+    assert false_positives < 100
+    assert (loaded.count, loaded.num_bits, loaded.num_hashes) == (500, known_filter.num_bits, known_filter.num_hashes)
+
+def test_known_filter_record_is_new_only_if_no_key_is_known():
+    known_filter = rr.KnownContactsFilter(capacity=1000)
+    known_filter.add_record({'id': 'jane-doe', 'first_name': 'Jane', 'last_name': 'Doe'}, ['jane@example.com'])
+    assert not known_filter.definitely_new({'first_name': 'Jane', 'last_name': 'Doe'}, [])
+    assert not known_filter.definitely_new({'public_id_2': 'https://www.linkedin.com/in/Jane-Doe/'}, [])
+    assert known_filter.definitely_new({'id': 'john-roe', 'first_name': 'John', 'last_name': 'Roe'}, ['john@example.com'])
+
+def test_contact_filter_keys_include_both_linkedin_properties():
+    keys = rr.contact_filter_keys({
+        rr.LINKEDIN_KEY_PROPERTY: 'jane-doe',
+        'linkedin_url': 'https://www.linkedin.com/sales/people/ACwAAAB1234567abcdEFGH,NAME_SEARCH',
+        'email': 'jane@example.com', 'hs_additional_emails': 'j.doe@example.org;',
+        'firstname': 'Jane', 'lastname': 'Doe',
+    })
+    assert {'li:jane-doe', 'li:ACwAAAB1234567abcdEFGH', 'email:jane@example.com', 'email:j.doe@example.org', 'name:jane|doe'} <= keys
+
+def test_load_known_filter_raises_instead_of_exiting(tmp_path):
+    path = tmp_path / 'broken.bloom'
+    path.write_bytes(b'not a filter')
+    try:
+        rr.load_known_filter(str(path))
+    except RuntimeError as e:
+        assert 'broken.bloom' in str(e)
+    else:
+        raise AssertionError("load_known_filter accepted a broken file")
+
+
+# --- Contact property coercion -----------------------------------------------
+
+def test_coerce_booleans():
+    definition = {'type': 'bool', 'field_type': 'booleancheckbox'}
+    assert rr.coerce_property_value(definition, 'Yes') == ('true', None)
+    assert rr.coerce_property_value(definition, '0') == ('false', None)
+    assert rr.coerce_property_value(definition, 'maybe')[0] is None
+
+def test_coerce_enumerations_by_value_or_label():
+    definition = {'type': 'enumeration', 'field_type': 'checkbox', 'options': ['en', 'de'],
+                  'labels': {'english': 'en', 'german': 'de'}}
+    assert rr.coerce_property_value(definition, 'English; de') == ('en;de', None)
+    assert rr.coerce_property_value(definition, 'French')[0] is None
+
+def test_coerce_numbers():
+    definition = {'type': 'number'}
+    assert rr.coerce_property_value(definition, '1,234') == ('1234', None)
+    assert rr.coerce_property_value(definition, '500+') == ('500', None)
+    assert rr.coerce_property_value(definition, '2.5') == ('2.5', None)
+    for value in ('nan', 'inf', '-Infinity', 'many'):
+        assert rr.coerce_property_value(definition, value)[0] is None
+
+def test_coerce_dates_and_datetimes():
+    assert rr.coerce_property_value({'type': 'date'}, '05/01/2024') == ('2024-05-01', None)
+    assert rr.coerce_property_value({'type': 'datetime'}, '2024-05-01T12:00:00+02:00') == ('2024-05-01T10:00:00.000Z', None)
+    assert rr.coerce_property_value({'type': 'date'}, 'someday')[0] is None
+
+def test_coerce_truncates_long_strings():
+    value, reason = rr.coerce_property_value({'type': 'string'}, 'x' * (rr.HUBSPOT_STRING_MAX_LENGTH + 10))
+    assert reason is None and len(value) == rr.HUBSPOT_STRING_MAX_LENGTH
+
+def test_validate_contact_properties_drops_unknown_read_only_invalid_and_unchanged(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    monkeypatch.setattr(rr, '_property_schema', {
+        'followers': {'type': 'number'},
+        'jobtitle': {'type': 'string'},
+        'hs_created_by': {'type': 'string', 'read_only': True},
+    })
+    validated = rr.validate_contact_properties(
+        {'email': 'a@example.com,b@example.com', 'followers': 'nan', 'jobtitle': 'CEO', 'hs_created_by': 'x', 'nosuchprop': 'y'},
+        hubspot_json={'jobtitle': 'CEO'})
+    assert validated == {'email': 'a@example.com,b@example.com'}
+
+
+# --- Sharding --------------------------------------------------------------------
+
+def test_record_identity_key_uses_canonical_linkedin_key_and_primary_email():
+    by_url = {'id': 'https://www.linkedin.com/in/Jane-Doe/', 'email': 'jane@example.com'}
+    by_slug = {'id': 'jane-doe', 'email': 'other@example.com'}
+    assert rr.record_identity_key(by_url) == rr.record_identity_key(by_slug) == 'li:jane-doe'
+    first = {'email': 'Jane@Example.com', 'third_party_email_1': 'aaa@example.com'}
+    second = {'email': 'jane@example.com', 'third_party_email_1': 'zzz@example.com'}
+    assert rr.record_identity_key(first) == rr.record_identity_key(second) == 'email:jane@example.com'
+    shards = rr.shard_records([(1, by_url), (2, first), (3, by_slug), (4, second)], 4)
+    assert sorted(sorted(n for n, _ in shard) for shard in shards if shard) == [[1, 3], [2, 4]]
+
+
+# --- Multi-file input ----------------------------------------------------------
+
+def test_dedupe_links_linkedin_rows_and_email_only_rows():
+    older = {'id': 'jane-doe', 'email': 'jane@example.com', 'first_name': 'Jane', 'last_name': 'Doe', 'headline': 'old'}
+    email_only = {'email': 'Jane@Example.com', 'first_name': 'Jane', 'last_name': 'Doe', 'headline': 'new'}
+    other = {'id': 'john-roe', 'first_name': 'John', 'last_name': 'Roe'}
+    assert rr.dedupe_records([older, other, email_only]) == [email_only, other]
+
+def test_dedupe_merges_people_linked_by_a_later_row():
+    by_public_id = {'id': 'jane-doe', 'first_name': 'Jane', 'last_name': 'Doe'}
+    by_hash = {'hash_id': 'ACwAAAB1234567abcdEFGH', 'first_name': 'Jane', 'last_name': 'Doe'}
+    linking = {'id': 'jane-doe', 'hash_id': 'ACwAAAB1234567abcdEFGH', 'first_name': 'Jane', 'last_name': 'Doe'}
+    later = {'hash_id': 'ACwAAAB1234567abcdEFGH', 'first_name': 'Jane', 'last_name': 'Doe', 'headline': 'latest'}
+    assert rr.dedupe_records([by_public_id, by_hash, linking, later]) == [later]
+
+def test_checkpoint_export_files_detect_changes(tmp_path):
+    export = tmp_path / 'a,b.csv'
+    export.write_text('id,first_name\n1,Jane\n')
+    assert rr.expand_csv_inputs(str(export)) == [str(export)]
+    files = rr.snapshot_export_files([str(export)])
+    assert rr.check_export_files(files) == [str(export)]
+    export.write_text('id,first_name\n1,Jane\n2,John\n')
+    try:
+        rr.check_export_files(files)
+    except RuntimeError as e:
+        assert 'changed' in str(e)
+    else:
+        raise AssertionError("a changed export was accepted")
+
+
+def test_schedule_fingerprint_is_quiet_and_computed_once(tmp_path, monkeypatch, capsys):
+    monkeypatch.chdir(tmp_path)
+    monkeypatch.setattr(rr, '_property_schema', {'linkedin_followers': {'type': 'number'}})
+    record = {'id': 'jane-doe', 'first_name': 'Jane', 'last_name': 'Doe', 'followers': 'lots'}
+    calls = []
+    fingerprint = rr.record_fingerprint
+    monkeypatch.setattr(rr, 'record_fingerprint', lambda r: calls.append(r) or fingerprint(r))
+    history = rr.SyncHistory(str(tmp_path / 'history.json'))
+    value = rr.record_fingerprint(record)
+    assert history.classify(record, value)[0] == 'new'
+    history.update(record, '101', value)
+    assert history.classify(record, value)[0] == 'unchanged'
+    assert len(calls) == 1
+    assert 'Dropping' not in capsys.readouterr().out
+    assert not (tmp_path / 'failed_records.log').exists()
+
+
+# --- Pipeline ------------------------------------------------------------------
+
+def test_pipeline_drops_failed_items_and_stops(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    monkeypatch.setattr(rr, 'PIPELINE_BATCH_LINGER', 0.01)
+    existing = {'boom': None, 'fetchless': ['600'], 'rejected': ['700'], 'fine': ['800']}
+    created = []
+
+    def find_ids(record, email_addresses):
+        ids = existing.get(record['id'], [])
+        if ids is None:
+            raise ValueError("search exploded")
+        return ids
+
+    def create(record, derived=None):
+        created.append(record['id'])
+        return None if record['id'] == 'nobody' else 500
+
+    class Writer:
+        def submit(self, *args, **kwargs):
+            pass
+
+    monkeypatch.setattr(rr, 'find_hubspot_ids_for_record', find_ids)
+    monkeypatch.setattr(rr, 'create_hubspot_contact', create)
+    monkeypatch.setattr(rr, 'batch_read_hubspot_contacts',
+                        lambda ids, properties=None: {i: {'firstname': 'x'} for i in ids if i != '600'})
+    monkeypatch.setattr(rr, 'get_hubspot_update_properties', lambda hubspot_json, record, derived=None: {'jobtitle': 'CTO'})
+    monkeypatch.setattr(rr, 'batch_update_hubspot_contacts', lambda updates: set(updates) - {'700'})
+    monkeypatch.setattr(rr, 'get_secondary_email_writer', Writer)
+    monkeypatch.setattr(rr, 'drain_secondary_emails', lambda: None)
+
+    records = [{'id': 'https://www.linkedin.com/in/Jane-Doe/'}, {'id': 'boom'}, {'id': 'nobody'},
+               {'id': 'jane-doe'}, {'id': 'fetchless'}, {'id': 'rejected'}, {'id': 'fine'}]
+    pipeline = rr.RecordPipeline()
+    failures = dict(pipeline.run(list(enumerate(records, start=1))))
+    assert sorted(failures) == [2, 3, 5, 6]
+    assert failures[2] == "unexpected error: search exploded"
+    assert failures[3] == "create failed"
+    assert failures[5] == "could not fetch contact 600"
+    assert failures[6] == "update failed for contact 700"
+    assert pipeline.completed == 3
+    # Both spellings of Jane's profile resolve to the contact created for the first one
+    assert len(created) == 2 and 'nobody' in created
+
+
+# --- Watch mode ------------------------------------------------------------------
+
+def test_watcher_flushes_an_unterminated_last_row_once_the_file_is_stable(tmp_path):
+    export = tmp_path / 'export.csv'
+    export.write_bytes(b'id,first_name\n1,Jane\n2,"John\nJr"')
+    watcher = rr.ExportWatcher(str(tmp_path))
+    [(name, records)] = watcher.poll()
+    assert [(n, r.get('id')) for n, r in records] == [(1, '1')]
+    [(name, records)] = watcher.poll()
+    assert [(n, r.get('first_name')) for n, r in records] == [(2, 'John\nJr')]
+    assert watcher.poll() == []
+    with open(export, 'ab') as f:
+        f.write(b'\n3,Ann\n')
+    [(name, records)] = watcher.poll()
+    assert [(n, r.get('id')) for n, r in records] == [(3, '3')]
+
+def test_watcher_waits_while_a_quoted_field_is_open(tmp_path):
+    (tmp_path / 'export.csv').write_bytes(b'id,first_name\n1,"Ja')
+    watcher = rr.ExportWatcher(str(tmp_path))
+    assert watcher.poll() == []
+    assert watcher.poll() == []
+
+
+# --- Name matching -------------------------------------------------------------
+
+def test_rank_name_candidates_prefers_evidence_and_highest_id_on_ties():
+    record = {'first_name': 'Bob', 'last_name': 'Lee', 'organization_1': 'Acme'}
+    candidates = {'7': {'company': 'Acme'}, '9': {'company': 'acme '}, '12': {'company': 'Other'}, '3': {'email': 'bob@lee.com'}}
+    assert rr.rank_name_candidates(candidates, record, ['Bob@Lee.com']) == ('3', [])
+    assert rr.rank_name_candidates(candidates, record, []) == ('9', [])
+
+def test_rank_name_candidates_rules_out_other_linkedin_profiles():
+    record = {'id': 'bob-lee', 'first_name': 'Bob', 'last_name': 'Lee'}
+    candidates = {'100': {'linkedin_url': 'https://www.linkedin.com/in/other-bob'}, '50': {}}
+    assert rr.rank_name_candidates(candidates, record, []) == (None, ['50'])
+
+def test_match_name_candidates_never_picks_among_unconfirmed_strangers(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    checked = []
+    monkeypatch.setattr(rr, 'get_company_names_for_contact', lambda c: checked.append(c) or set())
+    record = {'first_name': 'Bob', 'last_name': 'Lee', 'organization_1': 'Acme'}
+    candidates = {str(i): {} for i in range(1, 5)}
+    assert rr.match_name_candidates(candidates, record, []) is None
+    assert checked == ['4', '3', '2'][:rr.NAME_CORROBORATION_LIMIT]
+    assert rr.match_name_candidates({'4': {}}, record, []) == '4'
+
+def test_match_name_candidates_uses_a_corroborated_candidate(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    monkeypatch.setattr(rr, 'get_company_names_for_contact', lambda c: {'acme'} if c == '2' else set())
+    candidates = {str(i): {} for i in range(1, 5)}
+    assert rr.match_name_candidates(candidates, {'organization_1': 'Acme'}, []) == '2'
+
+def test_created_contacts_keep_their_properties_for_name_ranking(monkeypatch):
+    monkeypatch.setattr(rr, '_search_cache', rr.SearchCache())
+    monkeypatch.setattr(rr, '_name_candidate_properties', {})
+    key = rr.name_search_key('Bob', 'Lee')
+    rr.store_name_candidates(key, {'100': {'linkedin_url': 'https://www.linkedin.com/in/other-bob'}})
+    rr._search_cache.contact_created('500', {'firstname': 'Bob', 'lastname': 'Lee', rr.LINKEDIN_KEY_PROPERTY: 'first-bob',
+                                             'email': 'bob@first.com,bob@alt.com'})
+    candidates = rr.cached_name_candidates(key)
+    assert rr.rank_name_candidates(candidates, {'id': 'second-bob'}, []) == (None, [])
+    assert rr.rank_name_candidates(candidates, {}, ['bob@alt.com']) == ('500', [])
+
+
+# --- Compact CSV records ---------------------------------------------------------
+
+def test_compact_records_match_dict_reader_with_empty_and_duplicate_columns():
+    text = 'id,,first_name,email,first_name\nabc,junk,Jane,jane@example.com,Janet\nxyz\n'
+    [jane, short] = rr.read_compact_records(io.StringIO(text))
+    expected = next(csv.DictReader(io.StringIO(text)))
+    for column in ('id', 'first_name', 'email'):
+        assert jane[column] == expected[column]
+    assert jane['first_name'] == 'Janet'
+    assert '' not in jane
+    assert short.get('email') is None and short.get('email', '') == ''
+    assert dict(jane.items()) == {'id': 'abc', 'first_name': 'Janet', 'email': 'jane@example.com'}
+
+def test_compact_records_intern_repeated_values():
+    text = 'id,organization_1\n1,' + 'Acme Corporation International' + '\n2,' + 'Acme Corporation International' + '\n'
+    first, second = rr.read_compact_records(io.StringIO(text))
+    assert first['organization_1'] is second['organization_1']
+
+def test_columnar_emails_match_per_row_extraction_on_mixed_headers():
+    first = rr.read_compact_records(io.StringIO('id,email\n1,ann@example.com\n'))
+    second = rr.read_compact_records(io.StringIO('id,third_party_email_1,email\n2,bob@example.com,\n3,,cy@example.org\n'))
+    records = first + second
+    derived = rr.prepare_derived_columns(records)
+    for i, record in enumerate(records):
+        assert sorted(derived.row(i)['emails']) == sorted(rr.extract_emails_from_record(record))
+    assert derived.row(1)['emails'] == ['bob@example.com']
+
+
+# --- Search cache ----------------------------------------------------------------
+
+class FakeResponse:
+    def __init__(self, status_code=200, data=None):
+        self.status_code = status_code
+        self._data = data if data is not None else {}
+        self.headers = {}
+        self.text = ''
+
+    def json(self):
+        return self._data
+
+    def raise_for_status(self):
+        if self.status_code >= 400:
+            raise rr.requests.HTTPError(f"{self.status_code} error")
+
+def cache_with_email_entries():
+    cache = rr.SearchCache()
+    cache.put(('email', 'old@example.com'), ['42'])
+    cache.put(('email', 'new@example.com'), [])
+    cache.put(('email', 'other@example.com'), ['7'])
+    return cache
+
+def test_search_cache_updates_on_create_and_merge():
+    cache = rr.SearchCache()
+    cache.put(('name', 'bob', 'lee'), ['10'])
+    cache.put(('email', 'bob@lee.com'), [])
+    cache.contact_created('20', {'firstname': 'Bob', 'lastname': 'Lee', 'email': 'bob@lee.com', rr.LINKEDIN_KEY_PROPERTY: 'bob-lee'})
+    assert cache.get(('name', 'bob', 'lee')) == ['10', '20']
+    assert cache.get(('linkedin', 'bob-lee')) == ['20']
+    assert cache.get(('email', 'bob@lee.com')) is None
+    cache.contact_merged('10', '20')
+    assert cache.get(('name', 'bob', 'lee')) == ['20']
+
+def test_sync_contact_update_invalidates_cached_emails(monkeypatch):
+    monkeypatch.setattr(rr, '_search_cache', cache_with_email_entries())
+    monkeypatch.setattr(rr, 'get_api_key', lambda: 'key')
+    monkeypatch.setattr(rr, 'hubspot_request', lambda method, url, **kwargs: FakeResponse(200, {'properties': {}}))
+    assert rr.update_hubspot_contact_by_id('42', {'email': 'new@example.com'}) == {}
+    assert rr._search_cache.get(('email', 'new@example.com')) == ['42']
+    assert rr._search_cache.get(('email', 'old@example.com')) is None
+    assert rr._search_cache.get(('email', 'other@example.com')) == ['7']
+
+def test_async_contact_update_invalidates_cached_emails(monkeypatch):
+    monkeypatch.setattr(rr, '_search_cache', cache_with_email_entries())
+
+    async def fake_request(client, method, url, compress=False, **kwargs):
+        return 200, {'properties': {}}
+
+    monkeypatch.setattr(rr, 'async_hubspot_request', fake_request)
+    assert asyncio.run(rr.async_update_hubspot_contact_by_id(None, '42', {'email': 'new@example.com'})) == {}
+    assert rr._search_cache.get(('email', 'new@example.com')) == ['42']
+    assert rr._search_cache.get(('email', 'old@example.com')) is None
+
+
+# --- Secondary emails ------------------------------------------------------------
+
+def test_update_secondary_email_retries_rate_limits_and_falls_back_to_primary(monkeypatch):
+    sleeps = []
+    monkeypatch.setattr(rr.time, 'sleep', sleeps.append)
+    responses = [FakeResponse(429), FakeResponse(503), FakeResponse(400), FakeResponse(200)]
+    calls = []
+
+    def request(method, url, **kwargs):
+        calls.append(method)
+        return responses.pop(0)
+
+    monkeypatch.setattr(rr, 'hubspot_request', request)
+    assert rr.update_secondary_email('42', 'b@example.com') == (True, None)
+    assert calls == ['PUT', 'PUT', 'PUT', 'POST']
+    assert sleeps == [0.5, 1.0]
+
+    responses[:] = [FakeResponse(403)]
+    assert rr.update_secondary_email('42', 'c@example.com') == (False, "status 403")
+    assert sleeps == [0.5, 1.0]
+
+def test_secondary_email_writer_skips_known_and_queued_emails_and_drains(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    monkeypatch.setattr(rr, '_search_cache', rr.SearchCache())
+    written = []
+
+    def update(contact_id, email):
+        written.append((contact_id, email))
+        return (False, "status 403") if email.startswith('bad') else (True, None)
+
+    monkeypatch.setattr(rr, 'update_secondary_email', update)
+    monkeypatch.setattr(rr, 'get_contact_email_identities', lambda contact_id: {'known@example.com'})
+    writer = rr.SecondaryEmailWriter(workers=2)
+    writer.submit(42, ['Known@example.com', 'new@example.com', 'bad@example.com'])
+    writer.submit('42', ['NEW@example.com'])
+    writer.submit('7', ['known@example.com'], known_emails=set())
+    writer.drain()
+    assert sorted(written) == [('42', 'bad@example.com'), ('42', 'new@example.com'), ('7', 'known@example.com')]
+    assert writer.stats == {'added': 2, 'known': 1, 'failed': 1}
+    assert rr._search_cache.get(('email', 'new@example.com')) == ['42']
+    assert 'bad@example.com' in (tmp_path / 'failed_records.log').read_text()
+
+
+# --- LinkedIn keys ---------------------------------------------------------------
+
+def test_canonicalize_linkedin_id_spellings():
+    for value in ('https://www.linkedin.com/in/Jane-Doe/', 'http://linkedin.com/in/jane-doe', 'de.linkedin.com/in/jane-doe?trk=x',
+                  'https://m.linkedin.com/in/jane-doe', 'jane-doe', ' Jane-Doe/ '):
+        assert rr.canonicalize_linkedin_id(value) == 'jane-doe', value
+    assert rr.canonicalize_linkedin_id('https://www.linkedin.com/sales/people/ACwAAAB1234567abcdEFGH,NAME_SEARCH,x') == 'ACwAAAB1234567abcdEFGH'
+    assert rr.canonicalize_linkedin_id('ACwAAAB1234567abcdEFGH') == 'ACwAAAB1234567abcdEFGH'
+    assert rr.canonicalize_linkedin_id('https://www.linkedin.com/in/j%C3%A9r%C3%B4me') == 'jérôme'
+    for value in ('', None, 'https://www.linkedin.com/company/acme', 'https://example.com/in/jane'):
+        assert rr.canonicalize_linkedin_id(value) is None, value
+
+def test_linkedin_search_uses_the_key_property_only_if_the_portal_has_it(monkeypatch):
+    monkeypatch.setattr(rr, '_reported_unknown_properties', set())
+    monkeypatch.setattr(rr, '_property_schema', {rr.LINKEDIN_KEY_PROPERTY: {'type': 'string'}, 'linkedin_url': {'type': 'string'}})
+    payload = rr.build_linkedin_search_payload('jane-doe')
+    assert payload['filterGroups'][0]['filters'][0]['propertyName'] == rr.LINKEDIN_KEY_PROPERTY
+    monkeypatch.setattr(rr, '_property_schema', {'linkedin_url': {'type': 'string'}})
+    payload = rr.build_linkedin_search_payload('jane-doe')
+    assert {f['propertyName'] for g in payload['filterGroups'] for f in g['filters']} == {'linkedin_url'}
+    assert {'filters': [{'propertyName': 'linkedin_url', 'operator': 'EQ', 'value': 'https://www.linkedin.com/in/jane-doe'}]} in payload['filterGroups']
+    assert rr.LINKEDIN_KEY_PROPERTY not in payload['properties']
+
+
+# --- Locations -------------------------------------------------------------------
+
+def test_resolve_location():
+    cases = {
+        'Tbilisi, Georgia': ('Tbilisi', None, 'Georgia'),
+        'Mumbai, IN': ('Mumbai', None, None),
+        'London, England, United Kingdom': ('London', None, 'United Kingdom'),
+        'Atlanta, GA, United States': ('Atlanta', 'Georgia', 'United States'),
+        'Austin, TX': ('Austin', 'Texas', 'United States'),
+        'Toronto, Ontario': ('Toronto', 'Ontario', 'Canada'),
+        'Munich, Bavaria, Germany': ('Munich', 'Bavaria', 'Germany'),
+        'Greater Seattle Area': ('Seattle', 'Washington', 'United States'),
+        'Portland, Oregon Metropolitan Area': ('Portland', 'Oregon', 'United States'),
+        'Texas': (None, 'Texas', 'United States'),
+        'Springfield, Nowhere': ('Springfield', 'Nowhere', None),
+        '': (None, None, None),
+    }
+    for location, expected in cases.items():
+        assert rr.resolve_location(location) == expected, location